@@ -1,8 +1,64 @@
 from django.contrib import admin
-from app.models import (Customer,Account,Transfer,Withdraw,Deposit)
+from app.models import (Customer,Account,Transfer,Withdraw,Deposit,LedgerEntry,BalanceSnapshot,IdempotencyKey,
+                        Task)
 
-admin.site.register(Customer)
-admin.site.register(Account)
-admin.site.register(Transfer)
-admin.site.register(Withdraw)
-admin.site.register(Deposit)
\ No newline at end of file
+
+@admin.register(Customer)
+class CustomerAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'identification_number')
+
+
+@admin.register(Account)
+class AccountAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'type', 'balance', 'is_active', 'open_date')
+    list_select_related = ('customer',)
+    raw_id_fields = ('customer',)
+
+
+@admin.register(Transfer)
+class TransferAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'processing_date')
+    list_select_related = ('transfer_from__customer', 'transfer_to__customer')
+    raw_id_fields = ('transfer_from', 'transfer_to')
+
+
+@admin.register(Withdraw)
+class WithdrawAdmin(admin.ModelAdmin):
+    list_display = ('id', 'account', 'amount', 'processing_date')
+    list_select_related = ('account__customer',)
+    raw_id_fields = ('account',)
+
+
+@admin.register(Deposit)
+class DepositAdmin(admin.ModelAdmin):
+    list_display = ('id', 'account', 'amount', 'processing_date')
+    list_select_related = ('account__customer',)
+    raw_id_fields = ('account',)
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'account', 'kind', 'amount', 'balance', 'processing_date')
+    list_select_related = ('account__customer',)
+    list_filter = ('kind',)
+    raw_id_fields = ('account', 'transfer', 'deposit', 'withdraw')
+
+
+@admin.register(BalanceSnapshot)
+class BalanceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('id', 'account', 'taken_at', 'balance')
+    list_select_related = ('account__customer',)
+    raw_id_fields = ('account',)
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('id', 'scope', 'key', 'status_code', 'created_at', 'expires_at')
+    list_filter = ('scope',)
+    search_fields = ('key',)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'max_attempts', 'run_at')
+    list_filter = ('status', 'name')
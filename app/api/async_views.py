@@ -0,0 +1,191 @@
+"""
+Async (ASGI) variants of the read and money-movement endpoints.
+
+Django 3.2 has no async ORM methods yet, so reads and the transactional section of writes
+run on two bounded thread pools (`ASYNC_READ_WORKERS`, `ASYNC_WRITE_WORKERS`) rather than on
+Django's single shared sync thread. The event loop itself never blocks on the database, so one
+process can keep thousands of slow clients connected while only the pools' threads hold
+database connections.
+"""
+import asyncio
+import functools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.http import parse_etags
+from django.views import View
+from rest_framework.exceptions import APIException, ParseError, Throttled
+from rest_framework.request import Request
+
+from app.models import Account, Transfer
+from app.api import idempotency, throttling
+from app.api.filters import AccountFilter, TransferFilter
+from app.api.pagination import ProcessingDateCursorPagination
+from app.api.serializers import AccountSerializer, DepositSerializer, TransferSerializer, WithdrawSerializer
+from app.api.views import AccountDetailAPIView, create_movement, create_transfer
+from app.services import account_cache, balances
+from config.error_handler import error_payload
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name, max_workers):
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'async-{name}')
+        return _executors[name]
+
+
+async def run_read(func, *args):
+    """Run a read on the read pool, or on Django's shared sync thread with ASYNC_READ_WORKERS = 0."""
+    return await _run_on_pool('read', settings.ASYNC_READ_WORKERS, func, *args)
+
+
+async def run_write(func, *args):
+    """
+    Run a transactional section on the write pool. With ASYNC_WRITE_WORKERS = 0 it runs on
+    Django's shared sync thread instead, which is what the tests use.
+    """
+    return await _run_on_pool('write', settings.ASYNC_WRITE_WORKERS, func, *args)
+
+
+async def _run_on_pool(name, workers, func, *args):
+    if not workers:
+        return await sync_to_async(func)(*args)
+    return await sync_to_async(functools.partial(_with_connection, func), thread_sensitive=False,
+                               executor=get_executor(name, workers))(*args)
+
+
+def _with_connection(func, *args):
+    # Pool threads outlive requests, so apply CONN_MAX_AGE and drop broken connections ourselves.
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+def json_response(data, status=200, headers=None):
+    response = JsonResponse(data, status=status, encoder=DjangoJSONEncoder, safe=False)
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+class AsyncAPIView(View):
+    """
+    Plain Django view with async handlers, returning the same bodies and error payloads as the
+    DRF views, throttled like them.
+    """
+    throttle_scope = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        # Django 3.2 only runs a view natively when the callable itself is a coroutine function.
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        functools.update_wrapper(async_view, view)
+        async_view.csrf_exempt = True
+        return async_view
+
+    async def dispatch(self, request, *args, **kwargs):
+        method = request.method.lower()
+        handler = getattr(self, method, None) if method in self.http_method_names else None
+        if not asyncio.iscoroutinefunction(handler):
+            return json_response(error_payload(405, f'Method "{request.method}" not allowed.'), status=405)
+        try:
+            wait = await run_read(throttling.wait_for, request, self.throttle_scope)
+            if wait:
+                raise Throttled(wait)
+            return await handler(request, *args, **kwargs)
+        except APIException as exc:
+            # Like DRF's exception handler, which the sync views go through.
+            headers = {'Retry-After': '%d' % exc.wait} if getattr(exc, 'wait', None) else None
+            return json_response(error_payload(exc.status_code, exc.detail), status=exc.status_code, headers=headers)
+        except Http404:
+            return json_response(error_payload(404, 'Not found.'), status=404)
+
+    async def options(self, request, *args, **kwargs):
+        # View.options is sync; dispatch only awaits coroutine handlers.
+        return super().options(request, *args, **kwargs)
+
+    @staticmethod
+    def parse_body(request):
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+    @staticmethod
+    async def create(request, scope, data, func, *args):
+        """Run `func` on the write pool for a 201, at most once per Idempotency-Key like the sync views."""
+        key = idempotency.get_key(request.headers)
+        if key is None:
+            return json_response(await run_write(func, *args), status=201)
+        status_code, body, replayed = await run_write(idempotency.run, key, scope, data, lambda: (201, func(*args)))
+        return json_response(body, status=status_code, headers=idempotency.replay_headers(replayed))
+
+
+class AsyncAccountDetailView(AsyncAPIView):
+
+    async def get(self, request, id):
+        entry = await run_read(account_cache.get_or_fill, id, lambda: AccountDetailAPIView.load(id))
+        if entry is None:
+            raise Http404
+        if entry['etag'] in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponse(status=304)
+            response['ETag'] = entry['etag']
+            return response
+        return json_response(entry['payload'], headers={'ETag': entry['etag']})
+
+
+class AsyncAccountListView(AsyncAPIView):
+
+    async def get(self, request):
+        def load():
+            accounts = AccountFilter(request.GET, queryset=Account.objects.all()).qs
+            return AccountSerializer(AccountSerializer.setup_eager_loading(accounts), many=True).data
+
+        return json_response(await run_read(load))
+
+
+class AsyncTransferView(AsyncAPIView):
+
+    async def get(self, request):
+        paginator = ProcessingDateCursorPagination()
+
+        def load():
+            transfers = TransferFilter(request.GET, queryset=Transfer.objects.all()).qs
+            page = paginator.paginate_queryset(TransferSerializer.setup_eager_loading(transfers), Request(request))
+            return {'next': paginator.get_next_link(), 'results': TransferSerializer(page, many=True).data}
+
+        return json_response(await run_read(load))
+
+    async def post(self, request):
+        data = self.parse_body(request)
+        return await self.create(request, 'transfer', data, create_transfer, data)
+
+
+class AsyncDepositView(AsyncAPIView):
+
+    async def post(self, request):
+        data = self.parse_body(request)
+        return await self.create(request, 'deposit', data, create_movement, balances.deposit, DepositSerializer, data)
+
+
+class AsyncWithdrawView(AsyncAPIView):
+
+    async def post(self, request):
+        data = self.parse_body(request)
+        return await self.create(request, 'withdraw', data, create_movement, balances.withdraw, WithdrawSerializer,
+                                 data)
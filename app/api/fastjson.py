@@ -0,0 +1,30 @@
+"""
+JSON encoding and decoding through orjson when it is installed, the standard library
+otherwise. Both produce compact UTF-8 (no ASCII escaping), like DRF's JSONRenderer.
+"""
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+ACCELERATED = orjson is not None
+
+_default = JSONEncoder().default
+
+
+def dumps(data, default=_default):
+    """`data` as JSON bytes; `default` converts what JSON has no type for (dates, decimals, ...)."""
+    if orjson is not None:
+        return orjson.dumps(data, default=default)
+    return json.dumps(data, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    """Decode JSON bytes or text; raises ValueError on malformed input."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -1,5 +1,36 @@
+from decimal import ROUND_CEILING, ROUND_FLOOR
+
 import django_filters
-from app.models import Account, Transfer
+from django_filters.constants import EMPTY_VALUES
+from app.models import Account, Transfer, LedgerEntry
+from app.money import MINOR_UNIT_EXPONENT
+
+
+class MoneyFilter(django_filters.NumberFilter):
+    """Takes an amount in major units, like the API, and filters the minor unit column."""
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        minor = value.scaleb(MINOR_UNIT_EXPONENT)
+        if minor != minor.to_integral_value():
+            if self.lookup_expr == 'exact':
+                return qs.none()
+            # Round towards the inside of the range so gte / lte still mean what they say.
+            minor = minor.to_integral_value(ROUND_CEILING if self.lookup_expr == 'gte' else ROUND_FLOOR)
+        return super().filter(qs, int(minor))
+
+
+class TieredFilterSet(django_filters.FilterSet):
+    """
+    Reads the hot tier alone when processing_date__gte stays within it, and every tier
+    (hot and archived rows) otherwise.
+    """
+
+    def filter_queryset(self, queryset):
+        if hasattr(queryset, 'for_period'):
+            queryset = queryset.for_period(self.form.cleaned_data.get('processing_date__gte'))
+        return super().filter_queryset(queryset)
 
 
 class AccountFilter(django_filters.FilterSet):
@@ -12,12 +43,33 @@ class AccountFilter(django_filters.FilterSet):
         }
 
 
-class TransferFilter(django_filters.FilterSet):
+class TransferFilter(TieredFilterSet):
+    amount = MoneyFilter(field_name='amount')
+    amount__gte = MoneyFilter(field_name='amount', lookup_expr='gte')
+    amount__lte = MoneyFilter(field_name='amount', lookup_expr='lte')
+
     class Meta:
         model = Transfer
         fields = {
             'transfer_from__id': ['exact'],
             'transfer_to__id': ['exact'],
             'processing_date': ['gte', 'lte'],
-            'amount': ['gte', 'lte', 'exact']
         }
+
+
+class LedgerEntryFilter(django_filters.FilterSet):
+    class Meta:
+        model = LedgerEntry
+        fields = {
+            'processing_date': ['gte', 'lte'],
+            'kind': ['exact']
+        }
+
+
+class MovementFilter(TieredFilterSet):
+    """Deposit and withdraw filters, named like TransferFilter's so one query string fits every movement."""
+    processing_date__gte = django_filters.DateTimeFilter(field_name='processing_date', lookup_expr='gte')
+    processing_date__lte = django_filters.DateTimeFilter(field_name='processing_date', lookup_expr='lte')
+    amount = MoneyFilter(field_name='amount')
+    amount__gte = MoneyFilter(field_name='amount', lookup_expr='gte')
+    amount__lte = MoneyFilter(field_name='amount', lookup_expr='lte')
@@ -0,0 +1,70 @@
+import functools
+
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from app.services import idempotency
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed, retry later.'
+    default_code = 'idempotency_key_in_use'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used with a different request body.'
+    default_code = 'idempotency_key_reused'
+
+
+def get_key(headers):
+    key = headers.get(HEADER)
+    if key is not None and not 0 < len(key) <= 255:
+        raise ValidationError({HEADER: ['Must be between 1 and 255 characters.']})
+    return key
+
+
+def run(key, scope, payload, work):
+    """idempotency.run with its refusals turned into API errors."""
+    try:
+        return idempotency.run(key, scope, payload, work)
+    except idempotency.KeyReused:
+        raise IdempotencyKeyReused()
+    except idempotency.RequestInProgress:
+        raise IdempotencyKeyInUse()
+
+
+def replay_headers(replayed):
+    return {REPLAYED_HEADER: 'true'} if replayed else {}
+
+
+def idempotent(scope):
+    """
+    Make an APIView's post honour the Idempotency-Key header: a repeat with the same key and
+    body gets the first successful response back instead of running the view again.
+    """
+    def decorator(post):
+        @functools.wraps(post)
+        def wrapper(self, request, *args, **kwargs):
+            key = get_key(request.headers)
+            if key is None:
+                return post(self, request, *args, **kwargs)
+            responses = []
+
+            def work():
+                response = post(self, request, *args, **kwargs)
+                responses.append(response)
+                return response.status_code, response.data
+
+            status_code, body, replayed = run(key, scope, request.data, work)
+            if not replayed:
+                # Earlier entries are attempts rolled back and retried.
+                return responses[-1]
+            return Response(body, status=status_code, headers=replay_headers(replayed))
+        return wrapper
+    return decorator
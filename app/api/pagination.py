@@ -0,0 +1,90 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ProcessingDateCursorPagination(BasePagination):
+    """
+    Keyset pagination over (processing_date, id), newest first.
+
+    The cursor is an opaque token holding the position of the last row of the
+    previous page, so every page is a single indexed range read no matter how
+    deep the client has scrolled.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+    ordering = ('-processing_date', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def order_queryset(self, queryset):
+        return queryset.order_by(*self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, instance):
+        position = [instance.processing_date.isoformat(), instance.id]
+        return urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            processing_date, id = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            processing_date = parse_datetime(processing_date)
+            id = int(id)
+        except (TypeError, ValueError, UnicodeError, BinasciiError):
+            raise NotFound(self.invalid_cursor_message)
+        if processing_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return processing_date, id
+
+    def filter_after_cursor(self, queryset, request):
+        """Order the queryset and drop every row up to and including the cursor position."""
+        queryset = self.order_queryset(queryset)
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            return queryset
+        processing_date, id = cursor
+        # Same rows as (processing_date, id) < cursor, written so the leading bound is an index range.
+        return queryset.filter(
+            Q(processing_date__lte=processing_date) & (Q(processing_date__lt=processing_date) | Q(id__lt=id))
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        # Fetch one extra row to find out whether there is a next page without a COUNT(*).
+        rows = list(self.filter_after_cursor(queryset, request)[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        page = rows[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
@@ -0,0 +1,52 @@
+import codecs
+import csv
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+from app.api import fastjson
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser through app.api.fastjson."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return fastjson.loads(stream.read())
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class NDJSONParser(BaseParser):
+    """Newline delimited JSON; the parsed body is the list of decoded lines."""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        items = []
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line.decode(encoding)))
+            except ValueError as exc:
+                raise ParseError(f'NDJSON parse error on line {number} - {exc}')
+        return items
+
+
+class CSVParser(BaseParser):
+    """CSV with a header row; the parsed body is the list of rows as dicts, without their empty cells."""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            return [{key: value for key, value in row.items() if value != ''}
+                    for row in csv.DictReader(codecs.iterdecode(stream, encoding))]
+        except (csv.Error, UnicodeDecodeError) as exc:
+            raise ParseError(f'CSV parse error - {exc}')
@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from app.api import fastjson
+
+_django_default = DjangoJSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer through app.api.fastjson; indented output (the browsable API) still goes through DRF."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type or '', renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        return fastjson.dumps(data)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline delimited JSON, one object per line."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = [data]
+        return b''.join(self.render_line(item) for item in data)
+
+    @staticmethod
+    def render_line(item):
+        if settings.FAST_JSON:
+            return fastjson.dumps(item, default=_django_default) + b'\n'
+        return json.dumps(item, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class CSVRenderer(BaseRenderer):
+    """CSV for the streaming exports; anything else (an error body) becomes a header and one row."""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = [data] if isinstance(data, dict) else data
+        output = io.StringIO()
+        writer = csv.writer(output)
+        if rows:
+            writer.writerow(rows[0].keys())
+            writer.writerows(row.values() for row in rows)
+        return output.getvalue().encode('utf-8')
@@ -0,0 +1,63 @@
+import functools
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+
+from app.db import routers
+
+PIN_COOKIE = 'primary_pin'
+
+
+def client_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'replica-pin:user:{user.pk}'
+    return f'replica-pin:addr:{request.META.get("REMOTE_ADDR", "")}'
+
+
+def pin(request, response):
+    """Send this client's reads to the primary for the next REPLICA_PIN_SECONDS."""
+    until = time.time() + settings.REPLICA_PIN_SECONDS
+    # Truncated, not rounded: rounded up it could exceed is_pinned's bound for the first instant.
+    response.set_cookie(PIN_COOKIE, f'{math.floor(until * 1000) / 1000:.3f}', max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+                        samesite='Lax')
+    # Clients that drop cookies are pinned by user or address, across processes with a shared cache.
+    cache.set(client_key(request), until, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(request):
+    now = time.time()
+    try:
+        until = float(request.COOKIES.get(PIN_COOKIE, 0))
+    except ValueError:
+        until = 0
+    # A cookie can not pin for longer than a write would have.
+    if now < until <= now + settings.REPLICA_PIN_SECONDS:
+        return True
+    return cache.get(client_key(request), 0) > now
+
+
+def replica_reads(get):
+    """
+    Run an APIView's get on a healthy replica unless the client is pinned to the primary.
+    A database error on the replica takes it out of rotation and the view runs again on the
+    primary; streamed bodies keep reading from the replica they started on.
+    """
+    @functools.wraps(get)
+    def wrapper(self, request, *args, **kwargs):
+        alias = None if not settings.REPLICA_DATABASES or is_pinned(request) else routers.pick_replica()
+        if alias is None:
+            return get(self, request, *args, **kwargs)
+        try:
+            with routers.reading_from(alias):
+                response = get(self, request, *args, **kwargs)
+        except DatabaseError:
+            routers.mark_unhealthy(alias)
+            return get(self, request, *args, **kwargs)
+        if response.streaming:
+            response.streaming_content = routers.stream_from(alias, response.streaming_content)
+        return response
+    return wrapper
@@ -1,8 +1,220 @@
-from rest_framework import serializers
-from app.models import (Customer, Account, Transfer, Withdraw, Deposit)
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from app.models import (Customer, Account, Transfer, Withdraw, Deposit, LedgerEntry)
+from app.money import MAX_AMOUNT, MINOR_UNIT_EXPONENT, MINOR_UNITS, to_major, to_minor
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+class MoneyField(serializers.Field):
+    """
+    Amount in major units at the API edge (12.5), integer minor units in the model (1250).
+    Input with finer precision than a minor unit is rejected rather than rounded, and amounts
+    beyond MAX_AMOUNT either way are refused before they can overflow a BIGINT column. With
+    `positive` (every amount a client asks to move) zero and negative amounts are refused too.
+    """
+    default_error_messages = {
+        'invalid': 'A valid number is required.',
+        'max_decimal_places': 'Ensure that there are no more than {max_decimal_places} decimal places.',
+        'max_value': 'Ensure this value is less than or equal to {max_value}.',
+        'positive': 'Amount must be greater than 0',
+    }
+
+    def __init__(self, positive=False, **kwargs):
+        self.positive = positive
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool) or not isinstance(data, (int, float, str)):
+            self.fail('invalid')
+        try:
+            minor = to_minor(data)
+        except ArithmeticError:
+            self.fail('invalid')
+        except ValueError:
+            self.fail('max_decimal_places', max_decimal_places=MINOR_UNIT_EXPONENT)
+        if abs(minor) > MAX_AMOUNT:
+            self.fail('max_value', max_value=MAX_AMOUNT // MINOR_UNITS)
+        if self.positive and minor <= 0:
+            self.fail('positive')
+        return minor
+
+    def to_representation(self, value):
+        return to_major(value)
+
+
+class EagerLoadingMixin:
+    """
+    Lets list views load exactly what the serializer reads in a fixed number of queries.
+
+    Relations are worked out from the declared fields (nested serializers, related fields that
+    need more than the pk, dotted sources); extra lookups can be listed in `Meta.select_related`
+    and `Meta.prefetch_related`. When every field maps to a model column the queryset is also
+    narrowed with `only()`.
+    """
+    _eager_loading_cache = None
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        select_related, prefetch_related, only = cls.get_eager_loading()
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if only:
+            queryset = queryset.only(*only)
+        return queryset
+
+    @classmethod
+    def get_eager_loading(cls):
+        if cls.__dict__.get('_eager_loading_cache') is None:
+            cls._eager_loading_cache = cls._build_eager_loading()
+        return cls._eager_loading_cache
+
+    @classmethod
+    def _build_eager_loading(cls):
+        model = cls.Meta.model
+        select_related = set(getattr(cls.Meta, 'select_related', ()))
+        prefetch_related = set(getattr(cls.Meta, 'prefetch_related', ()))
+        only = {model._meta.pk.name}
+        columns_only = True
+
+        for field in cls().fields.values():
+            if field.source == '*':
+                columns_only = False
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                field, loads_relation = field.child, True
+            else:
+                loads_relation = isinstance(field, serializers.BaseSerializer) or (
+                    isinstance(field, (serializers.RelatedField, serializers.ManyRelatedField))
+                    and not getattr(field, 'use_pk_only_optimization', lambda: False)()
+                )
+            attrs = field.source_attrs if loads_relation else field.source_attrs[:-1]
+            lookup, many = _relation_lookup(model, attrs)
+
+            if lookup:
+                (prefetch_related if many else select_related).add(lookup)
+            if isinstance(field, EagerLoadingMixin) and lookup:
+                nested_select, nested_prefetch, _ = field.get_eager_loading()
+                nested = (prefetch_related if many else select_related)
+                nested.update(f'{lookup}__{related}' for related in nested_select)
+                prefetch_related.update(f'{lookup}__{related}' for related in nested_prefetch)
+
+            if len(field.source_attrs) == 1 and _is_concrete(model, field.source_attrs[0]):
+                only.add(field.source_attrs[0])
+            elif not lookup or many:
+                columns_only = False
+            else:
+                only.add(lookup.split('__')[0])
+
+        return (tuple(sorted(select_related)), tuple(sorted(prefetch_related)),
+                tuple(sorted(only)) if columns_only and not prefetch_related else ())
+
+
+def _relation_lookup(model, attrs):
+    """Translate the leading relation hops of a dotted source into an ORM lookup."""
+    relations = []
+    many = False
+    for attr in attrs:
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation:
+            break
+        relations.append(attr)
+        many = many or field.many_to_many or field.one_to_many
+        model = field.related_model
+    return '__'.join(relations), many
+
+
+def _is_concrete(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return False
+    return field.concrete
+
+
+class ValuesSerializer:
+    """
+    Read-only stand-in for a ModelSerializer on list endpoints. It reads the rows as
+    `values_list(named=True)` tuples and converts them with plain functions, skipping model
+    instances and per-field to_representation. Output is the same as the ModelSerializer's.
+
+    `fields` lists (output name, column, converter or None); converters are not called on None.
+    DATETIME renders like DateTimeField, in the time zone current when `data` is read.
+    """
+    fields = ()
+
+    def __init__(self, instance=None, many=False, **kwargs):
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def queryset(cls, queryset):
+        return queryset.values_list(*(column for _, column, _ in cls.fields), named=True)
+
+    @classmethod
+    def converters(cls):
+        # DateTimeField looks the current time zone up for every value; here it is once per call.
+        datetime = _datetime_converter()
+        return [(name, datetime if convert is DATETIME else convert) for name, _, convert in cls.fields]
+
+    @classmethod
+    def to_representation(cls, row, converters=None):
+        return {name: value if convert is None or value is None else convert(value)
+                for (name, convert), value in zip(converters or cls.converters(), row)}
+
+    @property
+    def data(self):
+        converters = self.converters()
+        if self.many:
+            return [self.to_representation(row, converters) for row in self.instance]
+        return self.to_representation(self.instance, converters)
+
+
+DATETIME = object()
+
+
+def _datetime_converter():
+    if not settings.USE_TZ or (api_settings.DATETIME_FORMAT or '').lower() != ISO_8601:
+        return serializers.DateTimeField().to_representation
+    current = timezone.get_current_timezone()
+
+    def convert(value):
+        value = value.astimezone(current).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+class TransferValuesSerializer(ValuesSerializer):
+    """TransferSerializer's output."""
+    fields = (
+        ('id', 'id', None),
+        ('amount', 'amount', to_major),
+        ('processing_date', 'processing_date', DATETIME),
+        ('transfer_from', 'transfer_from_id', None),
+        ('transfer_to', 'transfer_to_id', None),
+    )
+
+
+class AccountValuesSerializer(ValuesSerializer):
+    """AccountSerializer's output."""
+    fields = (
+        ('customer', 'customer_id', None),
+        ('open_date', 'open_date', DATETIME),
+        ('id', 'id', None),
+        ('balance', 'balance', to_major),
+        ('currency', 'currency', None),
+        ('type', 'type', None),
+        ('is_active', 'is_active', None),
+    )
+
+
+class CustomerSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = ('__all__')
@@ -16,28 +228,28 @@ class CustomerSerializer(serializers.ModelSerializer):
         return identification_number_value
 
 
-class AccountSerializer(serializers.ModelSerializer):
+class AccountSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    balance = MoneyField()
+
     class Meta:
         model = Account
-        fields = ('customer', 'open_date', 'id', 'balance', 'type', 'is_active')
+        fields = ('customer', 'open_date', 'id', 'balance', 'currency', 'type', 'is_active')
         read_only_fields = ('id','open_date')
 
     def validate_balance(self, balance_value):
-        if balance_value < 50:
+        if balance_value < to_minor(50):
             raise serializers.ValidationError(f'Initial amount must be greater than 50')
         return balance_value
 
 
-class TransferSerializer(serializers.ModelSerializer):
+class TransferSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    amount = MoneyField(positive=True)
+
     class Meta:
         model = Transfer
         fields = ('__all__')
 
     def validate(self, data):
-
-        print(data["transfer_to"].is_active)
-        print(data["transfer_from"].is_active)
-
         if data["transfer_to"] == data["transfer_from"]:
             raise serializers.ValidationError(f'Transfers cannot be made between two same accounts.')
 
@@ -54,6 +266,8 @@ class TransferSerializer(serializers.ModelSerializer):
 
 
 class WithdrawSerializer(serializers.ModelSerializer):
+    amount = MoneyField(positive=True)
+
     class Meta:
         model = Withdraw
         fields = ('__all__')
@@ -68,6 +282,8 @@ class WithdrawSerializer(serializers.ModelSerializer):
 
 
 class DepositSerializer(serializers.ModelSerializer):
+    amount = MoneyField(positive=True)
+
     class Meta:
         model = Deposit
         fields = ('__all__')
@@ -76,3 +292,33 @@ class DepositSerializer(serializers.ModelSerializer):
         if not data["account"].is_active:
             raise serializers.ValidationError(f'Account is not active')
         return data
+
+
+class LedgerEntrySerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    amount = MoneyField()
+    balance = MoneyField()
+
+    class Meta:
+        model = LedgerEntry
+        fields = ('id', 'kind', 'amount', 'balance', 'processing_date', 'transfer', 'deposit', 'withdraw')
+
+
+class AccountMovementSerializer(serializers.Serializer):
+    """
+    Request body of a deposit or withdraw. The account is checked by the balance update
+    itself, so it is not fetched here.
+    """
+    account = serializers.IntegerField(source='account_id')
+    amount = MoneyField(positive=True)
+
+
+class TransferBatchItemSerializer(serializers.Serializer):
+    """One line of a transfer batch. Accounts are checked in bulk by the settlement, not per item."""
+    transfer_from = serializers.IntegerField()
+    transfer_to = serializers.IntegerField()
+    amount = MoneyField(positive=True)
+
+    def validate(self, data):
+        if data["transfer_to"] == data["transfer_from"]:
+            raise serializers.ValidationError(f'Transfers cannot be made between two same accounts.')
+        return data
@@ -0,0 +1,31 @@
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from app.services import ratelimit
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    A token bucket per client and endpoint. The rate is DEFAULT_THROTTLE_RATES[scope], read as
+    a bucket of N tokens refilled over the period: the view's throttle_scope, otherwise 'read'
+    for safe methods and 'write' for the rest. A scope without a rate is not limited.
+    """
+
+    def allow_request(self, request, view):
+        self.wait_seconds = wait_for(request, getattr(view, 'throttle_scope', None))
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def wait_for(request, scope=None):
+    """Seconds until `request`'s client may call this endpoint again; 0 takes a token and lets it through."""
+    scope = scope or ('read' if request.method in SAFE_METHODS else 'write')
+    rate = ratelimit.parse_rate(api_settings.DEFAULT_THROTTLE_RATES.get(scope))
+    if rate is None:
+        return 0
+    match = getattr(request, 'resolver_match', None)
+    endpoint = match.view_name if match is not None else request.path
+    return ratelimit.take(f'throttle:{scope}:{endpoint}:{BaseThrottle().get_ident(request)}', *rate)
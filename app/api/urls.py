@@ -1,13 +1,30 @@
 from django.urls import path
+from .async_views import (
+    AsyncAccountDetailView,
+    AsyncAccountListView,
+    AsyncTransferView,
+    AsyncDepositView,
+    AsyncWithdrawView
+)
 from .views import (
     CustomerListCreateAPIView,
+    CustomerImportAPIView,
+    CustomerSearchAPIView,
     AccountCreateAPIView,
     AccountListAPIView,
     AccountDetailAPIView,
     DepositListCreateAPIView,
     WithdrawListCreateAPIView,
     TransferAPIView,
-    AccountTransfersAPIView
+    TransferBatchAPIView,
+    AccountTransfersAPIView,
+    AccountLedgerAPIView,
+    AccountBalanceAtAPIView,
+    AccountFlowsAPIView,
+    AccountCounterpartiesAPIView,
+    CustomerBalancesAPIView,
+    TransferVolumeAPIView,
+    AccountStatementAPIView
 )
 
 urlpatterns = [
@@ -16,6 +33,15 @@ urlpatterns = [
     # GET All Customers
     path('customer/', CustomerListCreateAPIView.as_view(), name='list-create-customer'),
 
+    # POST Customers with their opening account and deposit in bulk (JSON array, NDJSON or CSV)
+    path('customer/import', CustomerImportAPIView.as_view(), name='import-customer'),
+
+    # GET Customers by identification number prefix, or partial or misspelt name or address (?q=, ranked pages)
+    path('customer/search', CustomerSearchAPIView.as_view(), name='search-customer'),
+
+    # GET Total balance per customer and currency (AccountFilter parameters, ?after= pages)
+    path('customer/balances', CustomerBalancesAPIView.as_view(), name='customer-balances'),
+
     # GET All accounts with filter (open_date,type,customer__id)
     path('account/', AccountListAPIView.as_view(), name='list-account'),
 
@@ -27,17 +53,47 @@ urlpatterns = [
     # GET Account transfer transactions
     path('account/<int:id>/transfers', AccountTransfersAPIView.as_view(), name='detail-account-transfer'),
 
+    # GET Account ledger (transfers, deposits, withdrawals) with running balances
+    path('account/<int:id>/ledger', AccountLedgerAPIView.as_view(), name='detail-account-ledger'),
+
+    # GET Account balance at a point in time (?at=)
+    path('account/<int:id>/balance', AccountBalanceAtAPIView.as_view(), name='detail-account-balance'),
+
+    # GET Account inflow / outflow totals (processing_date and amount filters)
+    path('account/<int:id>/flows', AccountFlowsAPIView.as_view(), name='detail-account-flows'),
+
+    # GET Account statement (transfers, deposits, withdrawals) streamed as CSV or NDJSON (?format=ndjson)
+    path('account/<int:id>/statement', AccountStatementAPIView.as_view(), name='detail-account-statement'),
+
+    # GET Top counterparties of the account by money moved (?limit=, TransferFilter parameters)
+    path('account/<int:id>/counterparties', AccountCounterpartiesAPIView.as_view(),
+         name='detail-account-counterparties'),
+
     # POST Create a new bank account for a customer with an initial deposit amount
     path('account/create', AccountCreateAPIView.as_view(), name='create-account'),
 
     # POST Transfer amounts between any two accounts
     # GET Retrieve transfer history for a given account -> All transfers with filter (account_id,processing_date_start,processing_date_end)
+    #     Cursor paginated (cursor, page_size), ?format=ndjson streams every matching row
     path('transfer/', TransferAPIView.as_view(), name='transfer'),
 
+    # POST Settle a JSON array / NDJSON body of transfers at once (?mode=atomic|partial)
+    path('transfer/batch', TransferBatchAPIView.as_view(), name='transfer-batch'),
+
+    # GET Transfer count and total per day or month (?interval=day|month, TransferFilter parameters)
+    path('transfer/volume', TransferVolumeAPIView.as_view(), name='transfer-volume'),
+
     # POST Deposit Money
     path('deposit/', DepositListCreateAPIView.as_view(), name='deposit'),
 
     # POST Withdraw Money
     path('withdraw/', WithdrawListCreateAPIView.as_view(), name='withdraw'),
 
+    # Async (ASGI) variants, same request and response bodies as above
+    path('async/account/', AsyncAccountListView.as_view(), name='async-list-account'),
+    path('async/account/<int:id>', AsyncAccountDetailView.as_view(), name='async-detail-account'),
+    path('async/transfer/', AsyncTransferView.as_view(), name='async-transfer'),
+    path('async/deposit/', AsyncDepositView.as_view(), name='async-deposit'),
+    path('async/withdraw/', AsyncWithdrawView.as_view(), name='async-withdraw'),
+
 ]
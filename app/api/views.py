@@ -1,25 +1,197 @@
-from django.db.models import Q
-from django.db.models.expressions import F
+from contextlib import contextmanager
+
+from django.conf import settings
 from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
 
 from rest_framework import generics, status
+from rest_framework.exceptions import NotFound, Throttled, ValidationError
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 
-from app.models import (Customer, Account, Transfer, Deposit, Withdraw)
+from app.models import (Customer, Account, Transfer, Deposit, Withdraw, LedgerEntry)
 from app.api.serializers import (CustomerSerializer, AccountSerializer, TransferSerializer, WithdrawSerializer,
-                                 DepositSerializer)
-from app.api.filters import AccountFilter, TransferFilter
+                                 DepositSerializer, AccountMovementSerializer, TransferBatchItemSerializer,
+                                 LedgerEntrySerializer, AccountValuesSerializer, TransferValuesSerializer)
+from app.api.filters import AccountFilter, TransferFilter, LedgerEntryFilter, MovementFilter
+from app.api.idempotency import idempotent
+from app.api.pagination import ProcessingDateCursorPagination
+from app.api.replicas import replica_reads
+from app.api.parsers import CSVParser, NDJSONParser
+from app.api.renderers import CSVRenderer, NDJSONRenderer
+from app.money import to_major
+from app.services import account_cache, admission, analytics, balances, imports, ledger, search, statements
+from app.services.exceptions import AccountNotFound, MovementError
+from app.services.transfers import execute_transfer, execute_transfer_batch
+
+
+def movement_error_detail(exc):
+    if isinstance(exc, AccountNotFound):
+        return {'account': [str(exc)]}
+    return {api_settings.NON_FIELD_ERRORS_KEY: [str(exc)]}
+
+
+def raise_movement_error(exc):
+    """Turn a refused money movement into the 400 a serializer would have produced."""
+    raise ValidationError(movement_error_detail(exc))
+
+
+@contextmanager
+def admitted(account_ids):
+    """admission.controller.admit, with a refusal turned into a 429 with Retry-After."""
+    try:
+        with admission.controller.admit(account_ids):
+            yield
+    except admission.Overloaded as exc:
+        raise Throttled(wait=exc.retry_after, detail=str(exc))
+
+
+def create_transfer(data):
+    """Validate and execute one transfer, returning the response body. Shared by the sync and async views."""
+    serializer = TransferSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    transfer_from_id = serializer.validated_data['transfer_from'].id
+    transfer_to_id = serializer.validated_data['transfer_to'].id
+    try:
+        with admitted([transfer_from_id, transfer_to_id]):
+            transfer = execute_transfer(transfer_from_id=transfer_from_id, transfer_to_id=transfer_to_id,
+                                        amount=serializer.validated_data['amount'])
+    except MovementError as exc:
+        raise_movement_error(exc)
+    return TransferSerializer(transfer).data
+
+
+def create_movement(movement, serializer_class, data):
+    """Validate and apply a deposit or withdraw (`movement`), returning the response body."""
+    serializer = AccountMovementSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    try:
+        with admitted([serializer.validated_data['account_id']]):
+            instance, balance = movement(**serializer.validated_data)
+    except MovementError as exc:
+        raise_movement_error(exc)
+    return dict(serializer_class(instance).data, balance=to_major(balance))
+
+
+def int_param(request, name, default, maximum):
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    if not value.isdigit() or not 0 < int(value) <= maximum:
+        raise ValidationError({name: [f'Must be a whole number between 1 and {maximum}.']})
+    return int(value)
+
+
+def aggregate_response(request, name, compute, account_id=None, present=None):
+    """
+    Serve an aggregate from the analytics cache, with an ETag and 304 for a matching If-None-Match.
+    The cache is shared by every client, so whatever depends on the request (links) is left to
+    `present`, which turns the cached payload into the body.
+    """
+    entry = analytics.cached(name, request.query_params, compute, account_id=account_id)
+    if entry['etag'] in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': entry['etag']})
+    payload = entry['payload'] if present is None else present(entry['payload'])
+    return Response(payload, headers={'ETag': entry['etag']})
 
 
 class CustomerListCreateAPIView(generics.ListCreateAPIView):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
 
+    @replica_reads
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class CustomerImportAPIView(APIView):
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES + [NDJSONParser, CSVParser]
+    max_import_size = 10000
+    chunk_size = 1000
+
+    @idempotent('customer-import')
+    def post(self, request):
+        """
+        JSON array, NDJSON or CSV (with a header row) of customers with their opening account:
+        [
+            {"name": "Sarah Johnson", "address": "Example Address 1", "identification_number": "12345678901",
+             "type": "vadeli", "balance": 100, "currency": "TRY", "is_active": true}
+        ]
+        Valid rows are created, the rest are reported by row number. Larger files go through
+        `manage.py import_customers`.
+        """
+        rows = request.data
+        if not isinstance(rows, list) or not rows or not all(isinstance(row, dict) for row in rows):
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Expected a non-empty list of customers.']})
+        if len(rows) > self.max_import_size:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                f'An import can contain at most {self.max_import_size} customers.']})
+        created, rejected = 0, []
+        for job in imports.chunks(rows, self.chunk_size):
+            result = imports.import_chunk(*job)
+            created += result.created
+            rejected += [{'row': row, 'identification_number': number, 'errors': errors}
+                         for row, number, errors in result.rejected]
+        return Response({'created': created, 'rejected': rejected},
+                        status=status.HTTP_207_MULTI_STATUS if rejected else status.HTTP_201_CREATED)
+
+
+class CustomerSearchAPIView(APIView):
+    page_size = 20
+    max_page_size = 100
+    max_page = 50
+
+    @replica_reads
+    def get(self, request):
+        """
+        Customers whose identification number starts with ?q=, or whose name or address
+        contains it or looks like it, best matches first. Pages are numbered: follow `next`.
+        """
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            raise ValidationError({'q': ['This parameter is required.']})
+        page_size = int_param(request, 'page_size', self.page_size, self.max_page_size)
+        page = int_param(request, 'page', 1, self.max_page)
+        rows, more = search.search(term, offset=(page - 1) * page_size, limit=page_size)
+        next_link = replace_query_param(request.build_absolute_uri(), 'page', page + 1) if more else None
+        results = [dict(CustomerSerializer(customer).data, rank=round(rank, 3)) for customer, rank in rows]
+        return Response({'next': next_link, 'results': results})
+
+
+class CustomerBalancesAPIView(APIView):
+    page_size = 100
+    max_page_size = 1000
+
+    def get(self, request):
+        """
+        Total balance of each customer per currency, over the accounts AccountFilter selects.
+        Pages through customers by id: follow `next` (?after=<last customer id>).
+        """
+        page_size = int_param(request, 'page_size', self.page_size, self.max_page_size)
+        after = int_param(request, 'after', None, 2 ** 63 - 1)
+
+        def compute():
+            accounts = AccountFilter(request.GET, queryset=Account.objects.all()).qs
+            rows, last = analytics.customer_balances(accounts, after=after, limit=page_size)
+            return {'last': last, 'results': rows}
+
+        def present(payload):
+            last = payload['last']
+            next_link = replace_query_param(request.build_absolute_uri(), 'after', last) if last else None
+            return {'next': next_link, 'results': payload['results']}
+
+        return aggregate_response(request, 'customer-balances', compute, present=present)
+
 
 class AccountCreateAPIView(APIView):
 
+    @idempotent('account-create')
     def post(self, request):
         """
         {
@@ -38,7 +210,10 @@ class AccountCreateAPIView(APIView):
             deposit_serializer = DepositSerializer(data={'account': account_serializer.data["id"],
                                                          'amount': account_serializer.data['balance']})
             if deposit_serializer.is_valid(raise_exception=True):
-                deposit_serializer.save()
+                deposit = deposit_serializer.save()
+                ledger.record(deposit.account_id, LedgerEntry.DEPOSIT, deposit.amount, deposit.amount,
+                              deposit.processing_date, deposit=deposit)
+                account_cache.invalidate(deposit.account_id)
             else:
                 return Response(deposit_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             return Response(account_serializer.data, status=status.HTTP_201_CREATED)
@@ -51,22 +226,39 @@ class AccountDetailAPIView(APIView):
         return account_instance
 
     def get(self, request, id):
-        account = self.get_object(id=id)
-        serializer = AccountSerializer(account)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        """Served from the account cache; a matching If-None-Match gets a 304 without touching the database."""
+        entry = account_cache.get_or_fill(id, lambda: self.load(id))
+        if entry is None:
+            raise NotFound()
+        if entry['etag'] in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': entry['etag']})
+        return Response(entry['payload'], status=status.HTTP_200_OK, headers={'ETag': entry['etag']})
+
+    @staticmethod
+    def load(id):
+        account = Account.objects.filter(id=id).first()
+        return dict(AccountSerializer(account).data) if account else None
 
     def put(self, request, id):
-        account = self.get_object(id=id)
-        serializer = AccountSerializer(account, data=request.data)
-        if serializer.is_valid(raise_exception=True):
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        with transaction.atomic():
+            account = get_object_or_404(Account.objects.select_for_update(), id=id)
+            previous_balance = account.balance
+            serializer = AccountSerializer(account, data=request.data)
+            if serializer.is_valid(raise_exception=True):
+                account = serializer.save()
+                if account.balance != previous_balance:
+                    ledger.record(account.id, LedgerEntry.ADJUSTMENT, account.balance - previous_balance,
+                                  account.balance, timezone.now())
+                account_cache.invalidate(account.id)
+                return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, id):
         account = self.get_object(id=id)
-        account.is_active = False
-        account.save()
+        with transaction.atomic():
+            account.is_active = False
+            account.save(update_fields=['is_active'])
+            account_cache.invalidate(account.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -76,30 +268,161 @@ class AccountTransfersAPIView(APIView):
         account_instance = get_object_or_404(Account, id=id)
         return account_instance
 
+    @replica_reads
     def get(self, request, id):
         account = self.get_object(id=id)
-        transfers = Transfer.objects.filter(Q(transfer_from=account) | Q(transfer_to=account))
+        # A UNION of the two sides lets each arm use its own (account, processing_date) index,
+        # where an OR across both foreign keys falls back to scanning the table. The whole
+        # history is listed, so both sides read the archived rows too.
+        sent = TransferSerializer.setup_eager_loading(Transfer.objects.filter(transfer_from=account).all_tiers())
+        received = TransferSerializer.setup_eager_loading(Transfer.objects.filter(transfer_to=account).all_tiers())
+        transfers = sent.union(received, all=True).order_by('-processing_date', '-id')
         serializer = TransferSerializer(transfers, many=True)
         return Response(serializer.data)
 
 
+class AccountLedgerAPIView(APIView):
+    pagination_class = ProcessingDateCursorPagination
+
+    def get(self, request, id):
+        """Ledger entries with running balances, newest first. Filter with processing_date__gte/lte and kind."""
+        account = get_object_or_404(Account, id=id)
+        entries = LedgerEntryFilter(request.GET, queryset=LedgerEntry.objects.filter(account=account)).qs
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(LedgerEntrySerializer.setup_eager_loading(entries), request, view=self)
+        return paginator.get_paginated_response(LedgerEntrySerializer(page, many=True).data)
+
+
+class AccountBalanceAtAPIView(APIView):
+
+    def get(self, request, id):
+        """Balance of the account at ?at=<ISO 8601 timestamp>, default now."""
+        account = get_object_or_404(Account, id=id)
+        at = timezone.now()
+        if 'at' in request.query_params:
+            at = parse_datetime(request.query_params['at'])
+            if at is None:
+                raise ValidationError({'at': ['Invalid timestamp.']})
+        return Response({'account': account.id, 'at': at, 'balance': to_major(ledger.balance_at(account.id, at))})
+
+
+class AccountFlowsAPIView(APIView):
+
+    def get(self, request, id):
+        """
+        Inflow and outflow of the account, split into transfers, deposits and withdraws.
+        Takes TransferFilter's processing_date and amount parameters.
+        """
+        account = get_object_or_404(Account, id=id)
+
+        def compute():
+            return analytics.account_flows(
+                account.id,
+                sent=TransferFilter(request.GET, queryset=Transfer.objects.filter(transfer_from=account)).qs,
+                received=TransferFilter(request.GET, queryset=Transfer.objects.filter(transfer_to=account)).qs,
+                deposits=MovementFilter(request.GET, queryset=Deposit.objects.filter(account=account)).qs,
+                withdraws=MovementFilter(request.GET, queryset=Withdraw.objects.filter(account=account)).qs)
+
+        return aggregate_response(request, 'account-flows', compute, account_id=account.id)
+
+
+class AccountCounterpartiesAPIView(APIView):
+    max_limit = 100
+
+    def get(self, request, id):
+        """Top `limit` (default 10) accounts by money moved with this one. Takes TransferFilter's parameters."""
+        account = get_object_or_404(Account, id=id)
+        limit = int_param(request, 'limit', 10, self.max_limit)
+
+        def compute():
+            return analytics.counterparties(
+                TransferFilter(request.GET, queryset=Transfer.objects.filter(transfer_from=account)).qs,
+                TransferFilter(request.GET, queryset=Transfer.objects.filter(transfer_to=account)).qs,
+                limit=limit)
+
+        return aggregate_response(request, 'account-counterparties', compute, account_id=account.id)
+
+
+class AccountStatementAPIView(APIView):
+    renderer_classes = [CSVRenderer, NDJSONRenderer]
+
+    def get(self, request, id):
+        """
+        Every transfer, deposit and withdraw of the account, oldest first, streamed as CSV
+        (default) or NDJSON (?format=ndjson). Narrow it with processing_date__gte / __lte.
+        """
+        account = get_object_or_404(Account.objects.only('id', 'currency'), id=id)
+        start, end = (self.parse_date(request, name) for name in ('processing_date__gte', 'processing_date__lte'))
+        fmt = request.accepted_renderer.format
+        response = StreamingHttpResponse(
+            statements.render(statements.lines(account.id, start, end), account.currency, fmt),
+            content_type=request.accepted_renderer.media_type)
+        response['Content-Disposition'] = f'attachment; filename="statement-{account.id}.{fmt}"'
+        return response
+
+    @staticmethod
+    def parse_date(request, name):
+        if name not in request.query_params:
+            return None
+        value = parse_datetime(request.query_params[name])
+        if value is None:
+            raise ValidationError({name: ['Invalid timestamp.']})
+        return value
+
+
 class AccountListAPIView(generics.ListAPIView):
     queryset = Account.objects.all()
     serializer_class = AccountSerializer
 
     def get_queryset(self):
         queryset = AccountFilter(self.request.query_params, queryset=self.queryset).qs
-        return queryset
+        if settings.FAST_JSON:
+            return AccountValuesSerializer.queryset(queryset)
+        return self.serializer_class.setup_eager_loading(queryset)
+
+    def get_serializer_class(self):
+        return AccountValuesSerializer if settings.FAST_JSON else self.serializer_class
+
+    @replica_reads
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
 
 class TransferAPIView(APIView):
+    pagination_class = ProcessingDateCursorPagination
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
+    stream_chunk_size = 2000
 
+    @replica_reads
     def get(self, request):
-        transfers = Transfer.objects.all().order_by("-processing_date")
-        transfers = TransferFilter(request.GET, queryset=transfers).qs
-        serializer = TransferSerializer(transfers, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        """
+        Paginated with an opaque `cursor` (and optional `page_size`).
+        Request `?format=ndjson` or `Accept: application/x-ndjson` to stream every matching row instead.
+        """
+        transfers = TransferFilter(request.GET, queryset=Transfer.objects.all()).qs
+        serializer_class = self.get_serializer_class()
+        if serializer_class is TransferValuesSerializer:
+            transfers = serializer_class.queryset(transfers)
+        else:
+            transfers = serializer_class.setup_eager_loading(transfers)
+        paginator = self.pagination_class()
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            transfers = paginator.filter_after_cursor(transfers, request)
+            return StreamingHttpResponse(self.stream(transfers, serializer_class),
+                                         content_type=NDJSONRenderer.media_type)
+        page = paginator.paginate_queryset(transfers, request, view=self)
+        serializer = serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
+    def get_serializer_class(self):
+        # FAST_JSON reads rows as tuples instead of model instances; the output is the same.
+        return TransferValuesSerializer if settings.FAST_JSON else TransferSerializer
+
+    def stream(self, transfers, serializer_class):
+        for transfer in transfers.iterator(chunk_size=self.stream_chunk_size):
+            yield NDJSONRenderer.render_line(serializer_class(transfer).data)
+
+    @idempotent('transfer')
     def post(self, request):
         """
         {
@@ -108,23 +431,80 @@ class TransferAPIView(APIView):
             "transfer_to":9
         }
         """
-        with transaction.atomic():
-            serializer = TransferSerializer(data=request.data)
-            if serializer.is_valid(raise_exception=True):
-                serializer.save()
-                serializer.validated_data['transfer_from'].balance = F('balance') - serializer.validated_data.get(
-                    'amount')
-                serializer.validated_data['transfer_to'].balance = F('balance') + serializer.validated_data.get(
-                    'amount')
-                serializer.validated_data['transfer_from'].save()
-                serializer.validated_data['transfer_to'].save()
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            else:
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(create_transfer(request.data), status=status.HTTP_201_CREATED)
+
+
+class TransferVolumeAPIView(APIView):
+
+    def get(self, request):
+        """Transfer count and total per ?interval=day (default) or month, filtered with TransferFilter."""
+        interval = request.query_params.get('interval', 'day')
+        if interval not in analytics.INTERVALS:
+            raise ValidationError({'interval': [f'Must be one of: {", ".join(analytics.INTERVALS)}.']})
+
+        def compute():
+            return analytics.volume(TransferFilter(request.GET, queryset=Transfer.objects.all()).qs, interval)
+
+        return aggregate_response(request, 'transfer-volume', compute)
+
+
+class TransferBatchAPIView(APIView):
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES + [NDJSONParser]
+    max_batch_size = 10000
+
+    @idempotent('transfer-batch')
+    def post(self, request):
+        """
+        JSON array or NDJSON body of transfers:
+        [
+            {"amount": 50, "transfer_from": 10, "transfer_to": 9},
+            {"amount": 20, "transfer_from": 9, "transfer_to": 11}
+        ]
+        ?mode=atomic (default) writes nothing unless every transfer is accepted,
+        ?mode=partial settles the valid transfers and reports the rest per item.
+        """
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Expected a non-empty list of transfers.']})
+        if len(items) > self.max_batch_size:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                f'A batch can contain at most {self.max_batch_size} transfers.']})
+        mode = request.query_params.get('mode', 'atomic')
+        if mode not in ('atomic', 'partial'):
+            raise ValidationError({'mode': ['Must be "atomic" or "partial".']})
+
+        results = [None] * len(items)
+        valid = []
+        item_serializer = TransferBatchItemSerializer()
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, item_serializer.run_validation(item)))
+            except ValidationError as exc:
+                results[index] = {'index': index, 'status': 'rejected', 'errors': exc.detail}
+
+        rejected = len(valid) < len(items)
+        if valid and not (rejected and mode == 'atomic'):
+            accounts = {item[side] for _, item in valid for side in ('transfer_from', 'transfer_to')}
+            with admitted(accounts):
+                settled = execute_transfer_batch([item for _, item in valid], all_or_nothing=mode == 'atomic')
+            for (index, _), (transfer, error) in zip(valid, settled):
+                if error is not None:
+                    rejected = True
+                    results[index] = {'index': index, 'status': 'rejected', 'errors': movement_error_detail(error)}
+                elif transfer is not None:
+                    results[index] = {'index': index, 'status': 'created',
+                                      'transfer': TransferSerializer(transfer).data}
+
+        if mode == 'atomic' and rejected:
+            return Response({'results': [result for result in results if result and result['status'] == 'rejected']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': results},
+                        status=status.HTTP_207_MULTI_STATUS if rejected else status.HTTP_201_CREATED)
 
 
 class DepositListCreateAPIView(APIView):
 
+    @idempotent('deposit')
     def post(self, request):
         """
         {
@@ -132,16 +512,8 @@ class DepositListCreateAPIView(APIView):
             "account": 9
         }
         """
-        with transaction.atomic():
-            serializer = DepositSerializer(data=request.data)
-            if serializer.is_valid(raise_exception=True):
-                account = serializer.validated_data.get('account')
-                account.balance += serializer.validated_data.get('amount')
-                account.save()
-                serializer.save()
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            else:
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(create_movement(balances.deposit, DepositSerializer, request.data),
+                        status=status.HTTP_201_CREATED)
 
 
 class WithdrawListCreateAPIView(APIView):
@@ -152,6 +524,7 @@ class WithdrawListCreateAPIView(APIView):
         }
     """
 
+    @idempotent('withdraw')
     def post(self, request):
         """
         {
@@ -159,13 +532,5 @@ class WithdrawListCreateAPIView(APIView):
             "account": 9
         }
         """
-        with transaction.atomic():
-            serializer = WithdrawSerializer(data=request.data)
-            if serializer.is_valid(raise_exception=True):
-                account = serializer.validated_data.get('account')
-                account.balance -= serializer.validated_data.get('amount')
-                account.save()
-                serializer.save()
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            else:
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(create_movement(balances.withdraw, WithdrawSerializer, request.data),
+                        status=status.HTTP_201_CREATED)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class AppConfig(AppConfig):
     name = 'app'
+
+    def ready(self):
+        # Registers the background tasks.
+        from app import tasks  # noqa: F401
@@ -0,0 +1,66 @@
+"""
+Database helpers. The statement timeouts are for the production profile and a no-op on SQLite.
+
+Statement timeouts come in kinds, configured in STATEMENT_TIMEOUTS (milliseconds):
+'default' for every connection, 'write' for the short transactions that move money, and
+'report' for exports and the other batch jobs run as management commands. Those jobs spread
+their work with `chunked` and `process_pool`.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_session_timeout = 'default'
+
+
+def statement_timeout(kind, using=DEFAULT_DB_ALIAS):
+    """Limit the statements of the current transaction to STATEMENT_TIMEOUTS[kind]. Call it inside atomic()."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql' or not connection.in_atomic_block:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL statement_timeout = %s', [settings.STATEMENT_TIMEOUTS[kind]])
+
+
+def use_session_timeout(kind):
+    """
+    Open every later connection of this process with STATEMENT_TIMEOUTS[kind] instead of
+    the default. For management commands, whose connections are never handed to a request;
+    call it before the first query.
+    """
+    global _session_timeout
+    settings.STATEMENT_TIMEOUTS[kind]
+    _session_timeout = kind
+
+
+def session_timeout():
+    """Statement timeout new connections start with, in milliseconds."""
+    return settings.STATEMENT_TIMEOUTS[_session_timeout]
+
+
+def process_pool(workers):
+    """
+    A ProcessPoolExecutor of `workers` processes that each open their own database connection.
+    Children must not share the parent's sockets, so the parent's connections are closed first.
+    """
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+
+def _init_worker():
+    django.setup()
+    connections.close_all()
+
+
+def chunked(iterable, size):
+    """Lists of `size` consecutive items of `iterable`, the last one possibly shorter."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
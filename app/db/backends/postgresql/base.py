@@ -0,0 +1,89 @@
+"""
+Django's PostgreSQL backend with the production profile's extras. Extra DATABASES keys:
+
+- CONN_HEALTH_CHECKS: before a persistent connection is reused by a new request, check it
+  still works and reconnect if not (the Django 4.1 setting of the same name).
+- POOL_SIZE / POOL_TIMEOUT: borrow connections from a per-process pool of POOL_SIZE instead
+  of opening one per thread; closing a connection hands it back. Waits up to POOL_TIMEOUT
+  seconds for a free one. 0 turns the pool off.
+
+New connections start with the statement timeout of app.db.session_timeout().
+"""
+import psycopg2.extras
+from django.db import OperationalError
+from django.db.backends.postgresql import base
+
+from app import db
+from app.db.pool import PoolTimeout, get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    health_check_done = False
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        timeouts = (f'-c statement_timeout={db.session_timeout()} '
+                    f'-c idle_in_transaction_session_timeout={self.settings_dict.get("IDLE_IN_TRANSACTION_TIMEOUT", 0)}')
+        conn_params['options'] = f'{conn_params["options"]} {timeouts}' if conn_params.get('options') else timeouts
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        if not self.settings_dict.get('POOL_SIZE'):
+            return super().get_new_connection(conn_params)
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        pool = get_pool((self.alias, tuple(sorted(conn_params.items()))),
+                        lambda: _connect(conn_params, isolation_level),
+                        self.settings_dict['POOL_SIZE'], self.settings_dict.get('POOL_TIMEOUT', 10),
+                        check=_is_usable if self.settings_dict.get('CONN_HEALTH_CHECKS') else None)
+        try:
+            connection = pool.get()
+        except PoolTimeout as exc:
+            raise OperationalError(str(exc)) from exc
+        self.isolation_level = isolation_level if isolation_level is not None else connection.isolation_level
+        self._pool = pool
+        return connection
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done and not self.in_atomic_block
+                and self.settings_dict.get('CONN_HEALTH_CHECKS')):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        # Runs when a request starts and ends: the next request checks the connection again.
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def _close(self):
+        pool = getattr(self, '_pool', None)
+        if pool is None or self.connection is None:
+            return super()._close()
+        self._pool = None
+        with self.wrap_database_errors:
+            pool.put(self.connection)
+
+
+def _connect(conn_params, isolation_level):
+    connection = psycopg2.connect(**conn_params)
+    if isolation_level is not None and isolation_level != connection.isolation_level:
+        connection.set_session(isolation_level=isolation_level)
+    # Like Django's backend: JSONField decodes the text itself.
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+def _is_usable(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+        return True
+    except psycopg2.Error:
+        return False
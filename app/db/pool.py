@@ -0,0 +1,84 @@
+import os
+import threading
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    A bounded set of open DB-API connections shared by the threads of one process.
+
+    `get` hands out an idle connection (opening one while fewer than `size` exist) and
+    waits up to `timeout` seconds for one to come back otherwise. `put` rolls back whatever
+    the borrower left open and keeps the connection for the next one, unless it is closed.
+    """
+
+    def __init__(self, connect, size, timeout, check=None):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.check = check
+        self.pid = os.getpid()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def get(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f'No database connection free after {self.timeout}s ({self.size} in use)')
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    return self.connect()
+                if not connection.closed and (self.check is None or self.check(connection)):
+                    return connection
+                _close_quietly(connection)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def put(self, connection):
+        try:
+            if not connection.closed:
+                try:
+                    connection.rollback()
+                except Exception:
+                    _close_quietly(connection)
+            if not connection.closed:
+                with self._lock:
+                    self._idle.append(connection)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            _close_quietly(connection)
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, connect, size, timeout, check=None):
+    """
+    The process-wide pool for `key`. A forked child gets its own pool rather than reusing
+    the sockets it inherited from its parent.
+    """
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[key] = ConnectionPool(connect, size, timeout, check)
+        return pool
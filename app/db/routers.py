@@ -0,0 +1,116 @@
+"""
+Read replicas for the read-only list and history endpoints.
+
+Nothing goes to a replica by default. Views opt in with app.api.replicas.replica_reads,
+which runs the view inside `reading_from(alias)`, and ReplicaRouter sends the reads made
+there to that alias. Writes always use 'default'.
+
+A client that has just written is pinned to the primary for REPLICA_PIN_SECONDS (see
+ReplicaPinMiddleware), so it reads its own writes despite replication lag. A replica that
+fails its health check, or lags more than REPLICA_MAX_LAG seconds, is skipped for
+REPLICA_HEALTH_CHECK_INTERVAL seconds.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.connection import ConnectionDoesNotExist
+
+_reading_from = ContextVar('reading_from', default=None)
+
+_health = {}
+_health_lock = threading.Lock()
+
+# Lag is 0 when everything received has been replayed; otherwise the age of the last replayed
+# transaction. The primary reports NULL for both.
+POSTGRES_LAG_SQL = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return _reading_from.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Explicit, or an instance loaded from a replica would be saved back to it.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+@contextmanager
+def reading_from(alias):
+    token = _reading_from.set(alias)
+    try:
+        yield
+    finally:
+        _reading_from.reset(token)
+
+
+def stream_from(alias, iterable):
+    """Iterate `iterable` with reads routed to `alias`, for response bodies consumed after the view returned."""
+    iterator = iter(iterable)
+    while True:
+        with reading_from(alias):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def pick_replica():
+    """A healthy replica alias at random, or None to read from the primary."""
+    healthy = [alias for alias in settings.REPLICA_DATABASES if is_healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+def is_healthy(alias):
+    now = time.monotonic()
+    with _health_lock:
+        state = _health.get(alias)
+    if state is not None and now - state[1] < settings.REPLICA_HEALTH_CHECK_INTERVAL:
+        return state[0]
+    healthy = _check(alias)
+    with _health_lock:
+        _health[alias] = (healthy, now)
+    return healthy
+
+
+def mark_unhealthy(alias):
+    """Skip `alias` until the next health check is due, after a query on it failed."""
+    with _health_lock:
+        _health[alias] = (False, time.monotonic())
+
+
+def reset_health():
+    with _health_lock:
+        _health.clear()
+
+
+def _check(alias):
+    try:
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            if connection.vendor != 'postgresql':
+                cursor.execute('SELECT 1')
+                return True
+            cursor.execute(POSTGRES_LAG_SQL)
+            lag = cursor.fetchone()[0]
+        return lag is None or float(lag) <= settings.REPLICA_MAX_LAG
+    except ConnectionDoesNotExist:
+        return False
+    except DatabaseError:
+        connections[alias].close()
+        return False
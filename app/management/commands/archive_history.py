@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app import db
+from app.services import archive
+
+
+class Command(BaseCommand):
+    help = 'Move transfers, deposits and withdraws older than ARCHIVE_AFTER_DAYS to the archive tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                            help='Archive rows processed more than this many days ago (default ARCHIVE_AFTER_DAYS).')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows moved per transaction.')
+        parser.add_argument('--model', action='append', choices=sorted(archive.TIERS),
+                            help='Only archive this history (repeatable). Default: all of them.')
+
+    def handle(self, *args, **options):
+        db.use_session_timeout('report')
+        if options['older_than_days'] < settings.ARCHIVE_AFTER_DAYS:
+            self.stderr.write(self.style.WARNING(
+                'Archiving rows newer than ARCHIVE_AFTER_DAYS: queries limited to the hot tier will miss them.'))
+        for name in options['model'] or archive.TIERS:
+            moved = archive.archive(name, options['older_than_days'], chunk_size=options['chunk_size'],
+                                    stdout=self.stdout)
+            self.stdout.write(self.style.SUCCESS(f'{moved} {name} rows archived.'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app import db
+from app.services import ledger
+
+
+class Command(BaseCommand):
+    help = 'Build ledger entries from the existing Transfer, Deposit and Withdraw rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Accounts per transaction.')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Replace existing entries instead of skipping accounts that have them.')
+
+    def handle(self, *args, **options):
+        db.use_session_timeout('report')
+        done = ledger.backfill(chunk_size=options['chunk_size'], rebuild=options['rebuild'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Ledger backfilled for {done} accounts.'))
+        if options['rebuild']:
+            self.stdout.write('Entries were replaced: run `manage.py project_balances --rebuild` next.')
@@ -0,0 +1,55 @@
+from calendar import monthrange
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from app import db
+from app.services import statements
+
+
+class Command(BaseCommand):
+    help = 'Write one gzip statement file per account, optionally in parallel worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir', help='Directory the statement files are written to.')
+        parser.add_argument('--month', help='Statement month as YYYY-MM; sets --from and --to.')
+        parser.add_argument('--from', dest='start', help='ISO 8601 timestamp of the first movement.')
+        parser.add_argument('--to', dest='end', help='ISO 8601 timestamp of the last movement.')
+        parser.add_argument('--format', choices=statements.FORMATS, default='csv')
+        parser.add_argument('--account', type=int, action='append', dest='accounts',
+                            help='Only export this account; can be repeated.')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes.')
+
+    def handle(self, *args, **options):
+        db.use_session_timeout('report')
+        label = 'statement'
+        if options['month']:
+            start, end = self.month_range(options['month'])
+            label = f'statement-{options["month"]}'
+        else:
+            start, end = self.parse(options['start']), self.parse(options['end'])
+        paths = statements.export_all(options['output_dir'], start=start, end=end, fmt=options['format'],
+                                      label=label, account_ids=options['accounts'], workers=options['workers'],
+                                      stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'{len(paths)} statements written to {options["output_dir"]}.'))
+
+    @staticmethod
+    def parse(value):
+        if value is None:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f'Invalid timestamp: {value}')
+        return parsed
+
+    @staticmethod
+    def month_range(value):
+        try:
+            first = datetime.strptime(value, '%Y-%m')
+        except ValueError:
+            raise CommandError(f'Invalid month: {value}, expected YYYY-MM')
+        last = first.replace(day=monthrange(first.year, first.month)[1])
+        return (timezone.make_aware(datetime.combine(first, time.min)),
+                timezone.make_aware(datetime.combine(last, time.max)))
@@ -0,0 +1,37 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import db
+from app.services import imports
+
+
+class Command(BaseCommand):
+    help = 'Import customers with their opening account and deposit from a CSV or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row, or NDJSON file.')
+        parser.add_argument('--format', choices=imports.FORMATS,
+                            help='Input format; by default taken from the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per transaction.')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes.')
+        parser.add_argument('--checkpoint', help='Chunks already written; an interrupted import resumes from it. '
+                                                 'Defaults to <path>.checkpoint.')
+        parser.add_argument('--report', help='CSV of the rejected rows. Defaults to <path>.rejects.csv.')
+
+    def handle(self, *args, **options):
+        db.use_session_timeout('report')
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        report = options['report'] or f'{path}.rejects.csv'
+        try:
+            with open(path, newline='', encoding='utf-8') as stream:
+                created, rejected = imports.run(imports.read(stream, fmt), chunk_size=options['chunk_size'],
+                                                workers=options['workers'],
+                                                checkpoint=options['checkpoint'] or f'{path}.checkpoint',
+                                                report=report, stdout=self.stdout)
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'{created} customers imported, {rejected} rows rejected.'))
+        if rejected:
+            self.stdout.write(f'Rejected rows are listed in {os.path.abspath(report)}.')
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app import db
+from app.services import projection
+
+
+class Command(BaseCommand):
+    help = 'Fold the ledger entries appended since the last run into the projected balances. Meant to run periodically.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Ledger entries per transaction.')
+        parser.add_argument('--rebuild', action='store_true', help='Recompute every projected balance from scratch.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Accounts per rebuild job.')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes of a rebuild.')
+        parser.add_argument('--check', action='store_true',
+                            help='List the accounts whose balance differs from the projection; exit 1 if any.')
+
+    def handle(self, *args, **options):
+        db.use_session_timeout('report')
+        if options['rebuild']:
+            projected = projection.rebuild(chunk_size=options['chunk_size'], workers=options['workers'],
+                                           stdout=self.stdout)
+            self.stdout.write(f'{projected} balances rebuilt.')
+        try:
+            applied = projection.catch_up(batch_size=options['batch_size'], stdout=self.stdout)
+        except projection.ProjectionRebuilding as exc:
+            raise CommandError(f'{exc} Run with --rebuild.')
+        self.stdout.write(self.style.SUCCESS(
+            f'{applied} ledger entries projected, up to entry {projection.checkpoint_position()}.'))
+        if options['check']:
+            drifted = 0
+            for account_id, balance, projected in projection.drift().iterator():
+                drifted += 1
+                self.stdout.write(f'Account {account_id}: balance {balance}, projected {projected}')
+            if drifted:
+                raise CommandError(f'{drifted} accounts differ from the projection.')
+            self.stdout.write(self.style.SUCCESS('Every balance matches the projection.'))
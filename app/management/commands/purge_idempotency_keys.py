@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app.services import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Delete expired Idempotency-Key records. Meant to run periodically.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Keys per DELETE.')
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'{deleted} expired idempotency keys deleted.'))
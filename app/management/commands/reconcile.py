@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app import db
+from app.services import reconcile
+
+
+class Command(BaseCommand):
+    help = ('Check every account balance against its deposits, withdraws and transfers, and report the '
+            'discrepancies. Meant to run nightly.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only the accounts with movements since the last run.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Accounts per job.')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes.')
+        parser.add_argument('--overlap', type=int, default=10000,
+                            help='Ids before the last run\'s marks read again by an incremental run.')
+        parser.add_argument('--report', help='CSV of the discrepancies. Defaults to reconcile-<timestamp>.csv.')
+
+    def handle(self, *args, **options):
+        db.use_session_timeout('report')
+        report = options['report'] or f'reconcile-{timezone.now():%Y%m%dT%H%M%S}.csv'
+        result = reconcile.reconcile(chunk_size=options['chunk_size'], workers=options['workers'],
+                                     incremental=options['incremental'], overlap=options['overlap'],
+                                     report=report, stdout=self.stdout)
+        if result.discrepancies:
+            raise CommandError(f'{len(result.discrepancies)} of {result.accounts} accounts do not reconcile, '
+                               f'see {report}.')
+        self.stdout.write(self.style.SUCCESS(f'{result.accounts} accounts reconciled, no discrepancies.'))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.services import tasks
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks. Several workers can run side by side.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Tasks claimed per round trip.')
+        parser.add_argument('--threads', type=int, default=0, help='Run each batch on this many threads.')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due instead of polling.')
+        parser.add_argument('--retry-dead', action='store_true',
+                            help='Queue the dead-lettered tasks again before starting.')
+
+    def handle(self, *args, **options):
+        if options['retry_dead']:
+            self.stdout.write(f'{tasks.retry_dead()} dead tasks queued again.')
+        done = 0
+        try:
+            while True:
+                claimed = tasks.run_once(batch_size=options['batch_size'], threads=options['threads'])
+                done += claimed
+                if claimed:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'{done} tasks run.'))
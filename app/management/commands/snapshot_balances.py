@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from app import db
+from app.services import ledger
+
+
+class Command(BaseCommand):
+    help = 'Store the balance of every account at a point in time (default: now). Meant to run periodically.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--at', help='ISO 8601 timestamp of the snapshot.')
+
+    def handle(self, *args, **options):
+        db.use_session_timeout('report')
+        taken_at = None
+        if options['at']:
+            taken_at = parse_datetime(options['at'])
+            if taken_at is None:
+                raise CommandError(f'Invalid timestamp: {options["at"]}')
+        created = ledger.take_snapshots(taken_at)
+        self.stdout.write(self.style.SUCCESS(f'{created} balance snapshots written.'))
@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+def hot_since():
+    """
+    Oldest processing_date guaranteed to still be in the hot tables. `archive_history` only
+    moves rows older than ARCHIVE_AFTER_DAYS, so the boundary holds as long as the setting is
+    never raised after archiving.
+    """
+    return timezone.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+
+
+class TieredQuerySet(models.QuerySet):
+    """
+    QuerySet of a hot table whose old rows are archived. It remembers its filters, so
+    `for_period(start)` can replay them on the model's `<Model>History` view (hot and archive
+    tables together) when `start` reaches past the hot tier. Only filters carry over: route
+    before ordering or eager loading, and combine conditions with Q objects rather than `|`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tier_filters = []
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._tier_filters = None if self._tier_filters is None else list(self._tier_filters)
+        return clone
+
+    def _filter_or_exclude(self, negate, args, kwargs):
+        clone = super()._filter_or_exclude(negate, args, kwargs)
+        if clone._tier_filters is not None:
+            clone._tier_filters.append((negate, args, kwargs))
+        return clone
+
+    def _combine(self, other, connector):
+        combined = getattr(super(), connector)(other)
+        combined._tier_filters = None
+        return combined
+
+    def __and__(self, other):
+        return self._combine(other, '__and__')
+
+    def __or__(self, other):
+        return self._combine(other, '__or__')
+
+    def for_period(self, start=None):
+        """This queryset if rows since `start` are all hot, otherwise the same filters over every tier."""
+        if start is not None and start >= hot_since():
+            return self
+        return self.all_tiers()
+
+    def all_tiers(self):
+        if self._tier_filters is None:
+            raise TypeError('Querysets combined with & or | cannot be routed to the archive; use Q objects.')
+        queryset = apps.get_model(self.model._meta.app_label, f'{self.model.__name__}History').objects.all()
+        for negate, args, kwargs in self._tier_filters:
+            queryset = queryset._filter_or_exclude(negate, args, kwargs)
+        return queryset
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from app.api import replicas
+from app.services import metrics
+
+slow_request_logger = logging.getLogger('app.slow_requests')
+
+# The QueryRecorder of the async request being served, seen by the sync_to_async threads it calls.
+_async_queries = ContextVar('async_queries', default=None)
+
+
+class QueryRecorder:
+    """
+    connection.execute_wrapper that counts the queries of one request and remembers the
+    slowest. Only the request's own thread is watched, so work handed to thread pools (the
+    async views' writes, background tasks) is not counted.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_sql = ''
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            if elapsed > self.slowest_seconds:
+                self.slowest_seconds = elapsed
+                self.slowest_sql = sql
+
+
+def record_async_queries(execute, sql, params, many, context):
+    """execute_wrapper handing the query to the current async request's QueryRecorder, if any."""
+    queries = _async_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+def _install_async_recorder():
+    # Connections are per thread: runs in the thread that executes the request's queries.
+    for alias in connections:
+        wrappers = connections[alias].execute_wrappers
+        if record_async_queries not in wrappers:
+            wrappers.append(record_async_queries)
+
+
+class InstrumentationMiddleware:
+    """
+    Records wall time, query count, SQL time and the slowest query of every request under
+    its view name, and logs a sample of the requests slower than SLOW_REQUEST_SECONDS with
+    their slowest SQL. With METRICS_ENABLED off Django drops it from the chain entirely.
+
+    Under ASGI it runs as async middleware, so the async views keep their concurrency; their
+    queries are recorded on Django's sync thread through a context variable.
+
+    Streaming responses are timed up to the first byte; the queries run while streaming are
+    not counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks the instance as a coroutine function for Django's handler, like MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        queries = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(queries))
+            response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = QueryRecorder()
+        started = time.perf_counter()
+        token = _async_queries.set(queries)
+        try:
+            await sync_to_async(_install_async_recorder)()
+            response = await self.get_response(request)
+        finally:
+            _async_queries.reset(token)
+        self.observe(request, response, time.perf_counter() - started, queries)
+        return response
+
+    def observe(self, request, response, elapsed, queries):
+        view = view_name(request)
+        metrics.registry.observe(view, request.method, response.status_code, elapsed, queries)
+        if elapsed >= settings.SLOW_REQUEST_SECONDS and random.random() < settings.SLOW_REQUEST_SAMPLE_RATE:
+            slow_request_logger.warning(
+                'Slow request %s %s (%s) %s in %.3fs: %d queries, %.3fs in SQL, slowest %.3fs: %s',
+                request.method, request.path, view, response.status_code, elapsed, queries.count,
+                queries.seconds, queries.slowest_seconds, queries.slowest_sql)
+
+
+def view_name(request):
+    """The URL name of the matched view (namespaced), its dotted path without one, or '<unresolved>'."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name
+
+
+class ReplicaPinMiddleware:
+    """
+    Pins a client to the primary for REPLICA_PIN_SECONDS after each successful write, so
+    the replica_reads views show it its own changes. Not loaded without REPLICA_DATABASES.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            replicas.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            await sync_to_async(replicas.pin)(request, response)
+        return response
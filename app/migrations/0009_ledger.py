@@ -0,0 +1,45 @@
+# Generated by Django 3.2.18 on 2026-10-18 17:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_alter_account_is_active'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('deposit', 'Deposit'), ('withdraw', 'Withdraw'), ('transfer_in', 'Incoming transfer'), ('transfer_out', 'Outgoing transfer'), ('adjustment', 'Manual adjustment')], max_length=20)),
+                ('amount', models.FloatField()),
+                ('balance', models.FloatField()),
+                ('processing_date', models.DateTimeField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='app.account')),
+                ('deposit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='app.deposit')),
+                ('transfer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='app.transfer')),
+                ('withdraw', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='app.withdraw')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('balance', models.FloatField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='app.account')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['account', 'processing_date', 'id'], name='ledger_account_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='balancesnapshot',
+            constraint=models.UniqueConstraint(fields=('account', 'taken_at'), name='unique_account_snapshot'),
+        ),
+    ]
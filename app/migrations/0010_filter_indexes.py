@@ -0,0 +1,49 @@
+# Generated by Django 3.2.18 on 2026-10-18 17:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['open_date'], name='account_open_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['type', 'open_date'], name='account_type_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['customer', 'open_date'], name='account_customer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deposit',
+            index=models.Index(fields=['account', 'processing_date'], name='deposit_account_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['processing_date', 'id'], name='transfer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['transfer_from', 'processing_date', 'id'], name='transfer_from_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['transfer_to', 'processing_date', 'id'], name='transfer_to_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['amount'], name='transfer_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='withdraw',
+            index=models.Index(fields=['account', 'processing_date'], name='withdraw_account_date_idx'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+"""
+Expand step of the move from float money to integer minor units.
+
+Adds a nullable BIGINT `<field>_minor` column next to every float money column and makes the
+float columns nullable, so code that only knows one of the two can still insert rows. On
+Postgres a trigger keeps both columns in step while old and new application servers run side
+by side; 0012 backfills the existing rows and 0013 switches the models over.
+"""
+from django.db import migrations, models
+
+MONEY_FIELDS = (
+    ('account', 'balance'),
+    ('transfer', 'amount'),
+    ('deposit', 'amount'),
+    ('withdraw', 'amount'),
+    ('ledgerentry', 'amount'),
+    ('ledgerentry', 'balance'),
+    ('balancesnapshot', 'balance'),
+)
+
+
+def _tables():
+    tables = {}
+    for model_name, field in MONEY_FIELDS:
+        tables.setdefault(f'app_{model_name}', []).append(field)
+    return tables
+
+
+def install_sync_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, fields in _tables().items():
+        statements = []
+        for field in fields:
+            statements.append(f'''
+    IF TG_OP = 'INSERT' THEN
+        IF NEW.{field}_minor IS NULL THEN NEW.{field}_minor := ROUND(NEW.{field} * 100); END IF;
+        IF NEW.{field} IS NULL THEN NEW.{field} := NEW.{field}_minor / 100.0; END IF;
+    ELSIF NEW.{field} IS DISTINCT FROM OLD.{field} AND NEW.{field}_minor IS NOT DISTINCT FROM OLD.{field}_minor THEN
+        NEW.{field}_minor := ROUND(NEW.{field} * 100);
+    ELSIF NEW.{field}_minor IS DISTINCT FROM OLD.{field}_minor AND NEW.{field} IS NOT DISTINCT FROM OLD.{field} THEN
+        NEW.{field} := NEW.{field}_minor / 100.0;
+    END IF;''')
+        schema_editor.execute(f'''
+CREATE OR REPLACE FUNCTION {table}_money_sync() RETURNS trigger AS $$
+BEGIN{''.join(statements)}
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql''')
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_money_sync ON {table}')
+        schema_editor.execute(f'CREATE TRIGGER {table}_money_sync BEFORE INSERT OR UPDATE ON {table} '
+                              f'FOR EACH ROW EXECUTE PROCEDURE {table}_money_sync()')
+
+
+def remove_sync_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in _tables():
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_money_sync ON {table}')
+        schema_editor.execute(f'DROP FUNCTION IF EXISTS {table}_money_sync()')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='currency',
+            field=models.CharField(choices=[('TRY', 'Turkish lira'), ('USD', 'US dollar'), ('EUR', 'Euro'),
+                                            ('GBP', 'Pound sterling')], default='TRY', max_length=3),
+        ),
+    ] + [
+        operation
+        for model_name, field in MONEY_FIELDS
+        for operation in (
+            migrations.AlterField(model_name=model_name, name=field, field=models.FloatField(null=True)),
+            migrations.AddField(model_name=model_name, name=f'{field}_minor', field=models.BigIntegerField(null=True)),
+        )
+    ] + [
+        migrations.RunPython(install_sync_triggers, remove_sync_triggers),
+    ]
@@ -0,0 +1,48 @@
+"""
+Backfill the minor unit columns added in 0011.
+
+Runs outside a migration-wide transaction: rows are converted in primary key ranges of
+CHUNK_SIZE, each range in its own short transaction, so no lock is held on a whole table and
+an interrupted run picks up where it stopped (only rows still NULL are touched).
+"""
+from django.db import migrations, models, transaction
+from django.db.models import F, Max, Min
+from django.db.models.functions import Cast, Round
+
+CHUNK_SIZE = 10000
+
+MONEY_FIELDS = (
+    ('Account', 'balance'),
+    ('Transfer', 'amount'),
+    ('Deposit', 'amount'),
+    ('Withdraw', 'amount'),
+    ('LedgerEntry', 'amount'),
+    ('LedgerEntry', 'balance'),
+    ('BalanceSnapshot', 'balance'),
+)
+
+
+def backfill(apps, schema_editor):
+    for model_name, field in MONEY_FIELDS:
+        model = apps.get_model('app', model_name)
+        minor = f'{field}_minor'
+        pending = model.objects.filter(**{f'{minor}__isnull': True})
+        bounds = pending.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            continue
+        for start in range(bounds['first'], bounds['last'] + 1, CHUNK_SIZE):
+            with transaction.atomic():
+                pending.filter(id__gte=start, id__lt=start + CHUNK_SIZE).update(
+                    **{minor: Cast(Round(F(field) * 100), models.BigIntegerField())})
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('app', '0011_money_minor_units'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop, elidable=True),
+    ]
@@ -0,0 +1,104 @@
+"""
+Switch the models to the minor unit columns.
+
+The models' `balance` / `amount` fields now read and write the `<field>_minor` columns; the
+float columns stay in the table, unused, so servers still running the previous release keep
+working (the 0011 trigger fills them in). Dropping them, and the trigger, is a separate
+contract migration once no such server is left.
+
+On Postgres nothing here holds a lock that blocks writes for longer than a catalog update,
+so the migration runs outside a transaction:
+
+- SET NOT NULL would scan each table under an ACCESS EXCLUSIVE lock. A NOT VALID
+  `CHECK (<field>_minor IS NOT NULL)` is added and validated first (the scan only takes a
+  SHARE UPDATE EXCLUSIVE lock), which lets Postgres 12+ set NOT NULL without scanning; the
+  check is dropped afterwards.
+- transfer_amount_idx is built on the new column CONCURRENTLY under a temporary name, and the
+  old one is dropped CONCURRENTLY only then, so amount filters always have an index.
+"""
+from django.db import migrations, models
+
+MONEY_FIELDS = (
+    ('account', 'balance'),
+    ('transfer', 'amount'),
+    ('deposit', 'amount'),
+    ('withdraw', 'amount'),
+    ('ledgerentry', 'amount'),
+    ('ledgerentry', 'balance'),
+    ('balancesnapshot', 'balance'),
+)
+
+AMOUNT_INDEX = 'transfer_amount_idx'
+
+
+def _not_null_checks():
+    for model_name, field in MONEY_FIELDS:
+        table = f'app_{model_name}'
+        yield table, f'{field}_minor', f'{table}_{field}_minor_not_null'
+
+
+def add_not_null_checks(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column, name in _not_null_checks():
+        schema_editor.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}')
+        schema_editor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} CHECK ({column} IS NOT NULL) NOT VALID')
+        schema_editor.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {name}')
+
+
+def drop_not_null_checks(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, _, name in _not_null_checks():
+        schema_editor.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}')
+
+
+def index_amount(column):
+    def rebuild(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            schema_editor.execute(f'DROP INDEX IF EXISTS {AMOUNT_INDEX}')
+            schema_editor.execute(f'CREATE INDEX {AMOUNT_INDEX} ON app_transfer ({column})')
+            return
+        # A failed CONCURRENTLY build leaves an invalid index behind; drop it so a rerun starts over.
+        schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS transfer_amount_new_idx')
+        schema_editor.execute(f'CREATE INDEX CONCURRENTLY transfer_amount_new_idx ON app_transfer ({column})')
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {AMOUNT_INDEX}')
+        schema_editor.execute(f'ALTER INDEX transfer_amount_new_idx RENAME TO {AMOUNT_INDEX}')
+    return rebuild
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('app', '0012_backfill_money_minor_units'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_not_null_checks, drop_not_null_checks),
+    ] + [
+        migrations.AlterField(model_name=model_name, name=f'{field}_minor', field=models.BigIntegerField())
+        for model_name, field in MONEY_FIELDS
+    ] + [
+        migrations.RunPython(drop_not_null_checks, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(model_name='transfer', name=AMOUNT_INDEX),
+            ] + [
+                operation
+                for model_name, field in MONEY_FIELDS
+                for operation in (
+                    migrations.RemoveField(model_name=model_name, name=field),
+                    migrations.RenameField(model_name=model_name, old_name=f'{field}_minor', new_name=field),
+                    migrations.AlterField(model_name=model_name, name=field,
+                                          field=models.BigIntegerField(db_column=f'{field}_minor')),
+                )
+            ] + [
+                migrations.AddIndex(model_name='transfer',
+                                    index=models.Index(fields=['amount'], name=AMOUNT_INDEX)),
+            ],
+            database_operations=[
+                migrations.RunPython(index_amount('amount_minor'), index_amount('amount')),
+            ],
+        ),
+    ]
@@ -0,0 +1,141 @@
+# Generated by Django 3.2.18 on 2026-10-18 17:24
+
+"""
+Cold tier for transfer, deposit and withdraw history.
+
+`archive_history` moves rows older than ARCHIVE_AFTER_DAYS into the archived_* tables with
+their ids unchanged. The <model>history views put both tiers back together for the queries
+whose date range reaches past the hot tables. Ledger entries keep pointing at archived
+movements, so their foreign keys lose the database constraint.
+
+The views depend on the tables they read: a later migration that rebuilds or alters
+app_transfer, app_deposit, app_withdraw or their archive tables has to drop the view first and
+create it again afterwards.
+"""
+from django.db import migrations, models
+import django.db.models.deletion
+
+HISTORY_VIEWS = (
+    ('transfer', 'transfer_from_id, transfer_to_id'),
+    ('deposit', 'account_id'),
+    ('withdraw', 'account_id'),
+)
+
+
+def create_view(model_name, columns):
+    return (f'CREATE VIEW app_{model_name}history AS '
+            f'SELECT id, amount_minor, {columns}, processing_date FROM app_{model_name} '
+            f'UNION ALL '
+            f'SELECT id, amount_minor, {columns}, processing_date FROM app_archived{model_name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_tasks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepositHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.BigIntegerField(db_column='amount_minor')),
+                ('processing_date', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'app_deposithistory',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TransferHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.BigIntegerField(db_column='amount_minor')),
+                ('processing_date', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'app_transferhistory',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='WithdrawHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.BigIntegerField(db_column='amount_minor')),
+                ('processing_date', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'app_withdrawhistory',
+                'managed': False,
+            },
+        ),
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='deposit',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='app.deposit'),
+        ),
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='transfer',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='app.transfer'),
+        ),
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='withdraw',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='app.withdraw'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedWithdraw',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('amount', models.BigIntegerField(db_column='amount_minor')),
+                ('processing_date', models.DateTimeField(blank=True, null=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.account')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransfer',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('amount', models.BigIntegerField(db_column='amount_minor')),
+                ('processing_date', models.DateTimeField(blank=True, null=True)),
+                ('transfer_from', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.account')),
+                ('transfer_to', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.account')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedDeposit',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('amount', models.BigIntegerField(db_column='amount_minor')),
+                ('processing_date', models.DateTimeField(blank=True, null=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.account')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedwithdraw',
+            index=models.Index(fields=['account', 'processing_date'], name='archived_withdraw_account_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransfer',
+            index=models.Index(fields=['processing_date', 'id'], name='archived_transfer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransfer',
+            index=models.Index(fields=['transfer_from', 'processing_date', 'id'], name='archived_transfer_from_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransfer',
+            index=models.Index(fields=['transfer_to', 'processing_date', 'id'], name='archived_transfer_to_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archiveddeposit',
+            index=models.Index(fields=['account', 'processing_date'], name='archived_deposit_account_idx'),
+        ),
+    ] + [
+        migrations.RunSQL(create_view(model_name, columns), f'DROP VIEW app_{model_name}history')
+        for model_name, columns in HISTORY_VIEWS
+    ]
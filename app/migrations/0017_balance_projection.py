@@ -0,0 +1,29 @@
+# Generated by Django 3.2.18 on 2026-10-18 17:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_history_tiers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectedBalance',
+            fields=[
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='projected_balance', serialize=False, to='app.account')),
+                ('balance', models.BigIntegerField(db_column='balance_minor')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProjectorCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('position', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:02
+
+"""
+Trigram indexes for customer search, on Postgres only.
+
+The plain indexes serve the similarity operator, the upper-case ones the icontains lookups,
+which Django compiles to UPPER(column::text) LIKE UPPER(...). They are built CONCURRENTLY, so
+the migration does not block writes to the customer table, and cannot run in a transaction.
+"""
+from django.db import migrations
+
+INDEXES = (
+    ('customer_name_trgm', 'name gin_trgm_ops'),
+    ('customer_name_upper_trgm', 'UPPER(name::text) gin_trgm_ops'),
+    ('customer_address_trgm', 'address gin_trgm_ops'),
+    ('customer_address_upper_trgm', 'UPPER(address::text) gin_trgm_ops'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, expression in INDEXES:
+        schema_editor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON app_customer USING gin ({expression})')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('app', '0017_balance_projection'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
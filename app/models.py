@@ -1,6 +1,9 @@
 from django.db import models
 from datetime import datetime
 
+from app.managers import TieredQuerySet
+from app.money import CURRENCY_CHOICES, DEFAULT_CURRENCY, to_major
+
 
 class Customer(models.Model):
     name = models.CharField(max_length=100)
@@ -22,10 +25,20 @@ class Account(models.Model):
     """Bank Hesabı Oluşturulması"""
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     open_date = models.DateTimeField(null=True, blank=True)
-    balance = models.FloatField()
+    # Minor units. The column keeps its transition name until the float column is dropped.
+    balance = models.BigIntegerField(db_column='balance_minor')
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default=DEFAULT_CURRENCY)
     type = models.CharField(max_length=100)
     is_active = models.BooleanField(default=True, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # AccountFilter: open_date range alone, or combined with type / customer__id.
+            models.Index(fields=['open_date'], name='account_open_date_idx'),
+            models.Index(fields=['type', 'open_date'], name='account_type_date_idx'),
+            models.Index(fields=['customer', 'open_date'], name='account_customer_date_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.open_date:
             self.open_date = datetime.now()
@@ -34,7 +47,7 @@ class Account(models.Model):
     def json_object(self):
         return {
             "open_date": self.open_date,
-            "balance": self.balance,
+            "balance": to_major(self.balance),
             "customer": self.customer.id,
             "type": self.type
         }
@@ -44,11 +57,24 @@ class Account(models.Model):
 
 
 class Transfer(models.Model):
-    amount = models.FloatField()
+    amount = models.BigIntegerField(db_column='amount_minor')
     transfer_from = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='transfer_from')
     transfer_to = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='transfer_to')
     processing_date = models.DateTimeField(null=True, blank=True)
 
+    # Rows older than ARCHIVE_AFTER_DAYS move to ArchivedTransfer; TransferHistory spans both.
+    objects = TieredQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # History is read newest first by (processing_date, id), optionally narrowed to one side
+            # of the transfer; the account transfers UNION uses one index per arm.
+            models.Index(fields=['processing_date', 'id'], name='transfer_date_idx'),
+            models.Index(fields=['transfer_from', 'processing_date', 'id'], name='transfer_from_date_idx'),
+            models.Index(fields=['transfer_to', 'processing_date', 'id'], name='transfer_to_date_idx'),
+            models.Index(fields=['amount'], name='transfer_amount_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.processing_date:
             self.processing_date = datetime.now()
@@ -56,20 +82,27 @@ class Transfer(models.Model):
 
     def json_object(self):
         return {
-            "amount": self.amount,
+            "amount": to_major(self.amount),
             "transfer_from": self.transfer_from,
             "transfer_to": self.transfer_to
         }
 
     def __str__(self):
-        return f"{self.transfer_from.customer.name} - {self.transfer_to.customer.name} - Amount:{self.amount}"
+        return f"{self.transfer_from.customer.name} - {self.transfer_to.customer.name} - Amount:{to_major(self.amount)}"
 
 
 class Deposit(models.Model):
-    amount = models.FloatField()
+    amount = models.BigIntegerField(db_column='amount_minor')
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
     processing_date = models.DateTimeField(null=True, blank=True)
 
+    objects = TieredQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'processing_date'], name='deposit_account_date_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.processing_date:
             self.processing_date = datetime.now()
@@ -77,11 +110,210 @@ class Deposit(models.Model):
 
 
 class Withdraw(models.Model):
-    amount = models.FloatField()
+    amount = models.BigIntegerField(db_column='amount_minor')
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
     processing_date = models.DateTimeField(null=True, blank=True)
 
+    objects = TieredQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'processing_date'], name='withdraw_account_date_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.processing_date:
             self.processing_date = datetime.now()
         super(Withdraw, self).save(*args, **kwargs)
+
+
+class ArchivedTransfer(models.Model):
+    """Cold tier of Transfer: rows older than ARCHIVE_AFTER_DAYS, with their original ids."""
+    id = models.IntegerField(primary_key=True)
+    amount = models.BigIntegerField(db_column='amount_minor')
+    transfer_from = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='+')
+    transfer_to = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='+')
+    processing_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processing_date', 'id'], name='archived_transfer_date_idx'),
+            models.Index(fields=['transfer_from', 'processing_date', 'id'], name='archived_transfer_from_idx'),
+            models.Index(fields=['transfer_to', 'processing_date', 'id'], name='archived_transfer_to_idx'),
+        ]
+
+
+class ArchivedDeposit(models.Model):
+    """Cold tier of Deposit."""
+    id = models.IntegerField(primary_key=True)
+    amount = models.BigIntegerField(db_column='amount_minor')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='+')
+    processing_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'processing_date'], name='archived_deposit_account_idx'),
+        ]
+
+
+class ArchivedWithdraw(models.Model):
+    """Cold tier of Withdraw."""
+    id = models.IntegerField(primary_key=True)
+    amount = models.BigIntegerField(db_column='amount_minor')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='+')
+    processing_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'processing_date'], name='archived_withdraw_account_idx'),
+        ]
+
+
+class TransferHistory(models.Model):
+    """Read-only view over Transfer and ArchivedTransfer (UNION ALL). Query it through Transfer.objects.for_period."""
+    amount = models.BigIntegerField(db_column='amount_minor')
+    transfer_from = models.ForeignKey(Account, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    transfer_to = models.ForeignKey(Account, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    processing_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        managed = False
+        db_table = 'app_transferhistory'
+
+
+class DepositHistory(models.Model):
+    """Read-only view over Deposit and ArchivedDeposit."""
+    amount = models.BigIntegerField(db_column='amount_minor')
+    account = models.ForeignKey(Account, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    processing_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        managed = False
+        db_table = 'app_deposithistory'
+
+
+class WithdrawHistory(models.Model):
+    """Read-only view over Withdraw and ArchivedWithdraw."""
+    amount = models.BigIntegerField(db_column='amount_minor')
+    account = models.ForeignKey(Account, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    processing_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        managed = False
+        db_table = 'app_withdrawhistory'
+
+
+class LedgerEntry(models.Model):
+    """Append-only history of every balance change, with the balance right after it."""
+    OPENING = 'opening'
+    DEPOSIT = 'deposit'
+    WITHDRAW = 'withdraw'
+    TRANSFER_IN = 'transfer_in'
+    TRANSFER_OUT = 'transfer_out'
+    ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = (
+        (OPENING, 'Opening balance'),
+        (DEPOSIT, 'Deposit'),
+        (WITHDRAW, 'Withdraw'),
+        (TRANSFER_IN, 'Incoming transfer'),
+        (TRANSFER_OUT, 'Outgoing transfer'),
+        (ADJUSTMENT, 'Manual adjustment'),
+    )
+
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='ledger_entries')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    amount = models.BigIntegerField(db_column='amount_minor')
+    balance = models.BigIntegerField(db_column='balance_minor')
+    processing_date = models.DateTimeField()
+    # No database constraint: the movement may have been moved to its archive table, same id.
+    transfer = models.ForeignKey(Transfer, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True)
+    deposit = models.ForeignKey(Deposit, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True)
+    withdraw = models.ForeignKey(Withdraw, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'processing_date', 'id'], name='ledger_account_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.account_id} - {self.kind} - Amount:{to_major(self.amount)} - Balance:{to_major(self.balance)}"
+
+
+class BalanceSnapshot(models.Model):
+    """Balance of an account at a point in time, taken periodically from the ledger."""
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='balance_snapshots')
+    taken_at = models.DateTimeField()
+    balance = models.BigIntegerField(db_column='balance_minor')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'taken_at'], name='unique_account_snapshot'),
+        ]
+
+
+class ProjectedBalance(models.Model):
+    """Balance of an account as the sum of its ledger entries, kept by app.services.projection."""
+    account = models.OneToOneField(Account, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='projected_balance')
+    balance = models.BigIntegerField(db_column='balance_minor')
+
+
+class ProjectorCheckpoint(models.Model):
+    """
+    Id of the last row a batch job has processed in a table it follows: the ledger entries of
+    the balance projection (-1 while it is being rebuilt), each table reconcile reads.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+
+
+class IdempotencyKey(models.Model):
+    """
+    One Idempotency-Key per endpoint scope. A row without status_code is a claim held by the
+    request that is running; once it succeeds the response is kept until expires_at.
+    """
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=50)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'scope'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} - {self.key}"
+
+
+class Task(models.Model):
+    """A queued background task (see app.services.tasks). Done tasks are deleted, dead ones kept."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DEAD = 'dead'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DEAD, 'Dead'),
+    )
+
+    name = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField()
+    run_at = models.DateTimeField()
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the earliest due rows of a status.
+            models.Index(fields=['status', 'run_at', 'id'], name='task_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} - {self.status}"
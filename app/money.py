@@ -0,0 +1,34 @@
+"""
+Money is stored as integer minor units (kuruş, cents) and only converted to major units at
+the API edge. Every supported currency has two decimal places.
+"""
+from decimal import Decimal
+
+MINOR_UNIT_EXPONENT = 2
+MINOR_UNITS = 10 ** MINOR_UNIT_EXPONENT
+
+# Amounts and balances are BIGINT columns. A single amount is capped far below the column's
+# limit, so balances have room for any realistic number of them.
+MAX_AMOUNT = 10 ** 15
+MAX_BALANCE = 2 ** 63 - 1
+
+DEFAULT_CURRENCY = 'TRY'
+CURRENCY_CHOICES = (
+    ('TRY', 'Turkish lira'),
+    ('USD', 'US dollar'),
+    ('EUR', 'Euro'),
+    ('GBP', 'Pound sterling'),
+)
+
+
+def to_minor(amount):
+    """12.5 / '12.50' / Decimal('12.5') -> 1250. Raises ValueError on sub-minor precision."""
+    minor = Decimal(str(amount)).scaleb(MINOR_UNIT_EXPONENT)
+    if not minor.is_finite() or minor != minor.to_integral_value():
+        raise ValueError(f'{amount} has more than {MINOR_UNIT_EXPONENT} decimal places.')
+    return int(minor)
+
+
+def to_major(minor):
+    """1250 -> 12.5. Correctly rounded division, so the float prints as the exact decimal amount."""
+    return minor / MINOR_UNITS
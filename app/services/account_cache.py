@@ -0,0 +1,85 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+
+def get_cache():
+    return caches[getattr(settings, 'ACCOUNT_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'ACCOUNT_CACHE_TIMEOUT', 300)
+
+
+def _keys(account_id):
+    return f'account:{account_id}:version', f'account:{account_id}:payload'
+
+
+def get(account_id):
+    """
+    Cached `{'payload': ..., 'etag': ...}` of an account, or None.
+
+    Every write bumps the account's version, and an entry is only served while it was
+    filled under the current version. That way a reader that loaded the row just before a
+    write can not leave a stale entry behind once the write's bump has happened.
+    """
+    version_key, payload_key = _keys(account_id)
+    cached = get_cache().get_many([version_key, payload_key])
+    entry = cached.get(payload_key)
+    if entry is None or cached.get(version_key) is None or entry['version'] != cached[version_key]:
+        return None
+    return entry
+
+
+def fill(account_id, load):
+    """Store the payload returned by `load()` (None when the account does not exist) and return the entry."""
+    version = _current_version(account_id)
+    payload = load()
+    if payload is None:
+        return None
+    entry = {'version': version, 'payload': payload, 'etag': make_etag(payload)}
+    get_cache().set(_keys(account_id)[1], entry, get_timeout())
+    return entry
+
+
+def get_or_fill(account_id, load):
+    return get(account_id) or fill(account_id, load)
+
+
+def invalidate(*account_ids):
+    """Drop cached payloads of the accounts once the current transaction commits."""
+    transaction.on_commit(lambda: _bump(account_ids))
+
+
+def version(account_id):
+    """The account's cache version; changes whenever a write to the account commits."""
+    return _current_version(account_id)
+
+
+def make_etag(payload):
+    body = json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True).encode('utf-8')
+    return f'"{hashlib.md5(body).hexdigest()}"'
+
+
+def _current_version(account_id):
+    cache = get_cache()
+    version_key = _keys(account_id)[0]
+    # Seed versions from the clock so an evicted counter does not restart where an old entry left off.
+    cache.add(version_key, time.time_ns(), None)
+    return cache.get(version_key)
+
+
+def _bump(account_ids):
+    cache = get_cache()
+    for account_id in set(account_ids):
+        version_key, payload_key = _keys(account_id)
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            cache.set(version_key, time.time_ns(), None)
+        cache.delete(payload_key)
@@ -0,0 +1,60 @@
+"""
+Admission control for money movements.
+
+A movement waits on its accounts' row locks for as long as the movements ahead of it hold
+them, and every waiting request holds a database connection. Past ADMISSION_MAX_IN_FLIGHT
+movements running in this process, or ADMISSION_MAX_PER_ACCOUNT on one account, new ones are
+refused at once with Overloaded instead, which the API turns into a 429 with Retry-After.
+
+The counts are per process: with several workers the database sees up to workers times the
+limits. 0 turns a limit off.
+"""
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Too many transactions in progress, retry later.')
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.per_account = Counter()
+        self.rejected = 0
+
+    @contextmanager
+    def admit(self, account_ids):
+        """Hold a slot, and one on each of `account_ids`, for the duration of the block."""
+        account_ids = set(account_ids)
+        with self._lock:
+            max_in_flight, max_per_account = settings.ADMISSION_MAX_IN_FLIGHT, settings.ADMISSION_MAX_PER_ACCOUNT
+            if ((max_in_flight and self.in_flight >= max_in_flight)
+                    or (max_per_account and any(self.per_account[id] >= max_per_account for id in account_ids))):
+                self.rejected += 1
+                raise Overloaded(settings.ADMISSION_RETRY_AFTER)
+            self.in_flight += 1
+            self.per_account.update(account_ids)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.per_account.subtract(account_ids)
+                for id in account_ids:
+                    if self.per_account[id] <= 0:
+                        del self.per_account[id]
+
+    def snapshot(self):
+        with self._lock:
+            return {'in_flight': self.in_flight, 'rejected': self.rejected}
+
+
+controller = AdmissionController()
@@ -0,0 +1,98 @@
+"""
+Aggregates computed in SQL, so clients get totals instead of downloading every row.
+
+Functions take querysets the caller already filtered and return plain dicts with amounts in
+major units. `cached` stores those dicts per query string.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import Trunc
+
+from app.money import to_major
+from app.services import account_cache
+
+INTERVALS = ('day', 'month')
+
+
+def totals(queryset):
+    """{'count', 'total'} of the amounts in `queryset` (total in minor units), one aggregate query."""
+    result = queryset.order_by().aggregate(count=Count('id'), total=Sum('amount'))
+    return {'count': result['count'], 'total': result['total'] or 0}
+
+
+def account_flows(account_id, sent, received, deposits, withdraws):
+    """Inflow and outflow of one account from its filtered transfer, deposit and withdraw querysets."""
+    flows = {'transfers_in': totals(received), 'deposits': totals(deposits),
+             'transfers_out': totals(sent), 'withdraws': totals(withdraws)}
+    inflow = flows['transfers_in']['total'] + flows['deposits']['total']
+    outflow = flows['transfers_out']['total'] + flows['withdraws']['total']
+    for flow in flows.values():
+        flow['total'] = to_major(flow['total'])
+    return dict(flows, account=account_id, inflow=to_major(inflow), outflow=to_major(outflow),
+                net=to_major(inflow - outflow))
+
+
+def volume(transfers, interval):
+    """Transfer count and total per day or month bucket of processing_date, oldest first."""
+    buckets = (transfers.order_by().annotate(period=Trunc('processing_date', interval)).values('period')
+               .annotate(count=Count('id'), total=Sum('amount')).order_by('period'))
+    period_format = '%Y-%m-%d' if interval == 'day' else '%Y-%m'
+    return [{'period': bucket['period'].strftime(period_format), 'count': bucket['count'],
+             'total': to_major(bucket['total'])} for bucket in buckets]
+
+
+def customer_balances(accounts, after=None, limit=100):
+    """
+    Total balance per customer and currency, `limit` customers at a time in customer id order.
+    Returns (rows, last customer id or None when there are no more).
+    """
+    accounts = accounts.order_by()
+    customer_ids = accounts.values_list('customer_id', flat=True).distinct().order_by('customer_id')
+    if after is not None:
+        customer_ids = customer_ids.filter(customer_id__gt=after)
+    customer_ids = list(customer_ids[:limit + 1])
+    has_more = len(customer_ids) > limit
+    customer_ids = customer_ids[:limit]
+    groups = (accounts.filter(customer_id__in=customer_ids).values('customer_id', 'currency')
+              .annotate(accounts=Count('id'), balance=Sum('balance')).order_by('customer_id', 'currency'))
+    rows = [{'customer': group['customer_id'], 'currency': group['currency'], 'accounts': group['accounts'],
+             'balance': to_major(group['balance'])} for group in groups]
+    return rows, (customer_ids[-1] if has_more else None)
+
+
+def counterparties(sent, received, limit=10):
+    """
+    The accounts this account moved the most money with, in either direction. Each side is
+    one GROUP BY on its own (account, processing_date) index; the two are merged here.
+    """
+    parties = {}
+    for queryset, column, direction in ((sent, 'transfer_to_id', 'sent'), (received, 'transfer_from_id', 'received')):
+        for group in queryset.order_by().values(column).annotate(count=Count('id'), total=Sum('amount')):
+            party = parties.setdefault(group[column], {'account': group[column], 'sent': 0, 'sent_count': 0,
+                                                       'received': 0, 'received_count': 0})
+            party[direction] = group['total']
+            party[f'{direction}_count'] = group['count']
+    ranked = sorted(parties.values(), key=lambda party: (-(party['sent'] + party['received']), party['account']))
+    return [dict(party, total=to_major(party['sent'] + party['received']), sent=to_major(party['sent']),
+                 received=to_major(party['received'])) for party in ranked[:limit]]
+
+
+def cached(name, params, compute, account_id=None):
+    """
+    `{'payload', 'etag'}` for `compute()`, cached per query string. Results about one account
+    are keyed on that account's cache version, so any movement on it makes them miss; the rest
+    live for ANALYTICS_CACHE_TIMEOUT seconds.
+    """
+    query = '&'.join(f'{key}={value}' for key, value in sorted(params.items()) if value != '')
+    key = f'analytics:{name}:{hashlib.md5(query.encode("utf-8")).hexdigest()}'
+    if account_id is not None:
+        key = f'{key}:{account_id}:{account_cache.version(account_id)}'
+    cache = account_cache.get_cache()
+    entry = cache.get(key)
+    if entry is None:
+        payload = compute()
+        entry = {'payload': payload, 'etag': account_cache.make_etag(payload)}
+        cache.set(key, entry, settings.ANALYTICS_CACHE_TIMEOUT)
+    return entry
@@ -0,0 +1,43 @@
+"""
+Hot and cold tiers of the movement history.
+
+Transfers, deposits and withdraws older than ARCHIVE_AFTER_DAYS are moved, ids unchanged,
+into ArchivedTransfer / ArchivedDeposit / ArchivedWithdraw, so the hot tables and their
+indexes only hold the recent rows nearly every query asks for. `<Model>.objects.for_period`
+reads the <Model>History view over both tiers when a date range reaches past the hot one.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from app.models import ArchivedDeposit, ArchivedTransfer, ArchivedWithdraw, Deposit, Transfer, Withdraw
+
+TIERS = {
+    'transfer': (Transfer, ArchivedTransfer),
+    'deposit': (Deposit, ArchivedDeposit),
+    'withdraw': (Withdraw, ArchivedWithdraw),
+}
+
+
+def archive(name, older_than_days, chunk_size=1000, stdout=None):
+    """
+    Move `name`'s rows processed more than `older_than_days` ago to its archive table, one
+    transaction per `chunk_size` rows, oldest first. Returns how many rows were moved.
+    """
+    model, archived_model = TIERS[name]
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    fields = [field.attname for field in archived_model._meta.concrete_fields]
+    moved = 0
+    while True:
+        with transaction.atomic():
+            # The chunk is locked so a concurrent archiver cannot copy the same rows.
+            rows = list(model.objects.select_for_update().filter(processing_date__lt=cutoff)
+                        .order_by('processing_date', 'id').values(*fields)[:chunk_size])
+            if not rows:
+                return moved
+            archived_model.objects.bulk_create([archived_model(**row) for row in rows])
+            model.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+        if stdout:
+            stdout.write(f'{moved} {name} rows archived')
@@ -0,0 +1,116 @@
+import sqlite3
+
+from django.db import connection, transaction
+from django.db.models.expressions import F
+from django.utils import timezone
+
+from app.db import statement_timeout
+from app.models import Account, Deposit, LedgerEntry, Withdraw
+from app.services import account_cache, ledger
+from app.services.exceptions import AccountNotFound, InactiveAccount, InsufficientBalance, InvalidAmount
+
+
+def deposit(account_id, amount):
+    """Credit an active account with `amount` minor units. Returns the Deposit row and the new balance."""
+    return apply_movement(Deposit, account_id, amount, amount)
+
+
+def withdraw(account_id, amount):
+    """Debit an active account if it covers `amount`. Returns the Withdraw row and the new balance."""
+    return apply_movement(Withdraw, account_id, amount, -amount)
+
+
+def apply_movement(model, account_id, amount, delta):
+    """
+    Change the balance with one conditional UPDATE and record the movement row.
+
+    The active and sufficient-balance checks live in the UPDATE's WHERE clause, so there is
+    no read-modify-write window. On Postgres the UPDATE and the history and ledger INSERTs
+    share a single statement; elsewhere the INSERTs follow in the same transaction.
+    """
+    if amount <= 0:
+        # delta carries the sign, so a negative withdraw would credit the account and pass the check.
+        raise InvalidAmount()
+    kind = model._meta.model_name
+    processing_date = timezone.now()
+    with transaction.atomic():
+        statement_timeout('write')
+        if connection.vendor == 'postgresql':
+            row = _update_and_insert(model, account_id, amount, delta, processing_date)
+            movement_id, balance = row if row else (None, None)
+        else:
+            balance = update_balance(account_id, delta)
+            if balance is not None:
+                movement = model.objects.create(amount=amount, account_id=account_id,
+                                                processing_date=processing_date)
+                movement_id = movement.id
+                ledger.record(account_id, kind, delta, balance, processing_date, **{kind: movement})
+        if balance is not None:
+            account_cache.invalidate(account_id)
+    if balance is None:
+        raise movement_failure(account_id)
+    return model(id=movement_id, amount=amount, account_id=account_id, processing_date=processing_date), balance
+
+
+def update_balance(account_id, delta):
+    """Add `delta` to an active account unless that would take it below zero; None when refused."""
+    if supports_update_returning():
+        with connection.cursor() as cursor:
+            cursor.execute(_update_sql() + f' RETURNING {_column(Account, "balance")}', [delta, account_id, delta])
+            row = cursor.fetchone()
+        return row[0] if row else None
+    updated = Account.objects.filter(id=account_id, is_active=True, balance__gte=-delta).update(
+        balance=F('balance') + delta)
+    if not updated:
+        return None
+    return Account.objects.values_list('balance', flat=True).get(id=account_id)
+
+
+def movement_failure(account_id):
+    """Work out why a conditional update matched no row. Only runs on the refusal path."""
+    account = Account.objects.filter(id=account_id).values('is_active').first()
+    if account is None:
+        return AccountNotFound(account_id)
+    if not account['is_active']:
+        return InactiveAccount('Account is not active')
+    return InsufficientBalance()
+
+
+def supports_update_returning():
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 35)
+
+
+def _column(model, name):
+    return connection.ops.quote_name(model._meta.get_field(name).column)
+
+
+def _update_sql():
+    qn = connection.ops.quote_name
+    balance = _column(Account, 'balance')
+    return (f'UPDATE {qn(Account._meta.db_table)} SET {balance} = {balance} + %s '
+            f'WHERE {qn("id")} = %s AND {qn("is_active")} AND {balance} + %s >= 0')
+
+
+def _update_and_insert(model, account_id, amount, delta, processing_date):
+    qn = connection.ops.quote_name
+    kind = model._meta.model_name
+    processing_date = model._meta.get_field('processing_date').get_db_prep_save(processing_date, connection)
+    sql = (
+        f'WITH updated AS ({_update_sql()} RETURNING {qn("id")}, {_column(Account, "balance")} AS balance), '
+        f'movement AS ('
+        f'INSERT INTO {qn(model._meta.db_table)} ({_column(model, "amount")}, {qn("account_id")}, '
+        f'{qn("processing_date")}) '
+        f'SELECT %s, {qn("id")}, %s FROM updated RETURNING {qn("id")}), '
+        f'entry AS ('
+        f'INSERT INTO {qn(LedgerEntry._meta.db_table)} ({qn("account_id")}, {qn("kind")}, '
+        f'{_column(LedgerEntry, "amount")}, {_column(LedgerEntry, "balance")}, {qn("processing_date")}, '
+        f'{qn(kind + "_id")}) '
+        f'SELECT updated.{qn("id")}, %s, %s, updated.balance, %s, movement.{qn("id")} '
+        f'FROM updated, movement RETURNING {_column(LedgerEntry, "balance")} AS balance) '
+        f'SELECT movement.{qn("id")}, entry.balance FROM movement, entry'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [delta, account_id, delta, amount, processing_date, kind, delta, processing_date])
+        return cursor.fetchone()
@@ -0,0 +1,31 @@
+class MovementError(Exception):
+    """A money movement was refused; the message is safe to show to the client."""
+
+
+class AccountNotFound(MovementError):
+    def __init__(self, account_id):
+        super().__init__(f'Invalid pk "{account_id}" - object does not exist.')
+
+
+class InactiveAccount(MovementError):
+    pass
+
+
+class InvalidAmount(MovementError):
+    def __init__(self):
+        super().__init__('Amount must be greater than 0')
+
+
+class InsufficientBalance(MovementError):
+    def __init__(self):
+        super().__init__('Insufficent Balance')
+
+
+class BalanceLimitExceeded(MovementError):
+    def __init__(self):
+        super().__init__('The recipient balance would exceed the largest balance an account can hold.')
+
+
+class CurrencyMismatch(MovementError):
+    def __init__(self):
+        super().__init__('Transfers can only be made between accounts of the same currency.')
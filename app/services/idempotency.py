@@ -0,0 +1,119 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from app.models import IdempotencyKey
+from app.services import transfers
+
+
+class KeyReused(Exception):
+    """The key was already used for a request with a different body."""
+
+
+class RequestInProgress(Exception):
+    """Another request holding the key is still running."""
+
+
+def fingerprint(payload):
+    """Stable hash of a parsed request body, so key order and whitespace do not matter."""
+    body = json.dumps(payload, cls=JSONEncoder, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def run(key, scope, payload, work):
+    """
+    Run `work` at most once per (key, scope) and return (status_code, body, replayed).
+
+    `work` returns (status_code, body). A 2xx result is stored in the same transaction as the
+    work itself, so either both the money movement and its stored response commit or neither
+    does; repeats get the stored response back without running anything. Failed requests
+    release the key so the client can retry them.
+
+    The transaction is retried on deadlocks and serialization failures like any money
+    movement: `work` runs nested in it, where it could not retry by itself.
+    """
+    request_fingerprint = fingerprint(payload)
+    held = claim(key, scope, request_fingerprint)
+    if held.status_code is not None:
+        return held.status_code, json.loads(held.response), True
+
+    def work_and_store():
+        status_code, body = work()
+        if 200 <= status_code < 300:
+            # A request that outlives IDEMPOTENCY_LOCK_TIMEOUT loses its claim to a duplicate, which
+            # runs the work itself; only the claim this request inserted may store a response.
+            stored = _claimed(held).update(
+                status_code=status_code, response=json.dumps(body, cls=JSONEncoder),
+                expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL))
+            if not stored:
+                raise RequestInProgress()
+        return status_code, body
+
+    try:
+        status_code, body = transfers.run_locked((), work_and_store)
+    except BaseException:
+        release(held)
+        raise
+    if not 200 <= status_code < 300:
+        release(held)
+    return status_code, body, False
+
+
+def claim(key, scope, request_fingerprint):
+    """
+    Insert the claim row for the key; the unique constraint lets exactly one concurrent request
+    win. Returns the claim, without a status_code, for the winner and the finished IdempotencyKey
+    for a repeat. A duplicate of a request that is still running waits up to IDEMPOTENCY_WAIT
+    seconds for it to finish.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    key=key, scope=scope, fingerprint=request_fingerprint, created_at=now,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT))
+        except IntegrityError:
+            pass
+        stored = IdempotencyKey.objects.filter(key=key, scope=scope).first()
+        if stored is None:
+            continue
+        if stored.expires_at <= now:
+            # An expired response, or a claim whose request died before it could release it.
+            IdempotencyKey.objects.filter(id=stored.id, expires_at=stored.expires_at).delete()
+            continue
+        if stored.fingerprint != request_fingerprint:
+            raise KeyReused()
+        if stored.status_code is not None:
+            return stored
+        if time.monotonic() >= deadline:
+            raise RequestInProgress()
+        time.sleep(0.05)
+
+
+def release(held):
+    _claimed(held).delete()
+
+
+def _claimed(held):
+    """The claim row `held`, as long as it was not taken over by another request."""
+    return IdempotencyKey.objects.filter(key=held.key, scope=held.scope, fingerprint=held.fingerprint,
+                                         created_at=held.created_at, status_code__isnull=True)
+
+
+def purge(chunk_size=1000):
+    """Delete expired keys in chunks so the table stays small. Returns how many were deleted."""
+    deleted = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+                   .values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
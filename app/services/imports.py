@@ -0,0 +1,249 @@
+"""
+Bulk onboarding: customers, each with an opening account and its initial deposit, from a
+CSV or NDJSON stream.
+
+Rows carry the CustomerSerializer and AccountSerializer fields: name, address,
+identification_number, type and balance, optionally currency and is_active. They are read
+and validated `chunk_size` at a time, field by field with the serializers' own fields and
+validate_<field> methods. The identification numbers already taken are found with one IN
+query per chunk instead of the unique check per row, and the valid rows are written with
+bulk_create in one transaction per chunk. What AccountCreateAPIView writes for one account,
+the account, its Deposit and the deposit's ledger entry, is written here for the chunk.
+
+Chunks can run in worker processes. The numbers of the chunks written go to a checkpoint
+file, so an interrupted import started again with the same file and chunk size skips them,
+and the rejected rows go to a CSV report with their errors.
+"""
+import csv
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, wait
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+from rest_framework.validators import UniqueValidator
+
+from app.api.serializers import AccountSerializer, CustomerSerializer
+from app.db import process_pool
+from app.models import Account, Customer, Deposit, LedgerEntry
+
+FORMATS = ('csv', 'ndjson')
+REPORT_COLUMNS = ('row', 'identification_number', 'errors')
+CUSTOMER_FIELDS = ('name', 'address', 'identification_number')
+ACCOUNT_FIELDS = ('type', 'balance', 'currency', 'is_active')
+# A concurrent chunk can take an identification number between the IN query and the insert.
+INSERT_ATTEMPTS = 3
+
+Result = namedtuple('Result', 'chunk created rejected')
+
+
+def read(stream, fmt):
+    """Rows of a text stream as dicts. CSV empty cells count as missing."""
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield {key: value for key, value in row.items() if value != ''}
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def chunks(rows, chunk_size):
+    """(chunk number, first row number, rows) per `chunk_size` rows; rows are numbered from 1."""
+    rows = iter(rows)
+    number = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield number, number * chunk_size + 1, chunk
+        number += 1
+
+
+def import_chunk(number, first_row, rows):
+    """Validate and write one chunk. Returns a Result; `rejected` is (row number, identification number, errors)."""
+    invalid = validate(rows)
+    for attempt in range(INSERT_ATTEMPTS):
+        errors = dict(invalid)
+        try:
+            _taken(rows, errors)
+            valid = [row for index, row in enumerate(rows) if index not in errors]
+            with transaction.atomic():
+                _create(valid)
+            break
+        except IntegrityError:
+            if attempt == INSERT_ATTEMPTS - 1:
+                raise
+    rejected = [(first_row + index, rows[index].get('identification_number'), errors[index])
+                for index in sorted(errors)]
+    return Result(number, len(valid), rejected)
+
+
+def validate(rows):
+    """
+    {row index: {field: [messages]}} of the rows that break a CustomerSerializer or
+    AccountSerializer rule, checked one field at a time over the chunk. Valid values replace
+    the raw ones in the rows.
+    """
+    errors = {}
+    for name, field, validate_method in _rules():
+        for index, row in enumerate(rows):
+            try:
+                value = field.run_validation(row.get(name, serializers.empty))
+                if validate_method is not None:
+                    value = validate_method(value)
+            except SkipField:
+                continue
+            except serializers.ValidationError as exc:
+                errors.setdefault(index, {})[name] = exc.detail
+                continue
+            row[name] = value
+    return errors
+
+
+def _rules():
+    rules = []
+    for serializer_class, names in ((CustomerSerializer, CUSTOMER_FIELDS), (AccountSerializer, ACCOUNT_FIELDS)):
+        serializer = serializer_class()
+        for name in names:
+            field = serializer.fields[name]
+            # The uniqueness of a chunk is checked at once, by _taken.
+            field.validators = [validator for validator in field.validators
+                                if not isinstance(validator, UniqueValidator)]
+            rules.append((name, field, getattr(serializer, f'validate_{name}', None)))
+    return rules
+
+
+def _taken(rows, errors):
+    """Reject rows whose identification number is taken, or repeated earlier in the chunk."""
+    numbers = {row['identification_number'] for index, row in enumerate(rows) if index not in errors}
+    existing = set(Customer.objects.filter(identification_number__in=numbers)
+                   .values_list('identification_number', flat=True))
+    seen = set()
+    for index, row in enumerate(rows):
+        if index in errors:
+            continue
+        number = row['identification_number']
+        if number in existing:
+            errors[index] = {'identification_number': ['customer with this identification number already exists.']}
+        elif number in seen:
+            errors[index] = {'identification_number': ['Repeats an earlier row of the import.']}
+        seen.add(number)
+
+
+def _create(rows):
+    now = timezone.now()
+    customers = [Customer(**{name: row[name] for name in CUSTOMER_FIELDS}) for row in rows]
+    _bulk_create(Customer, customers, 'identification_number')
+    accounts = [Account(customer_id=customer.id, open_date=now,
+                        **{name: row[name] for name in ACCOUNT_FIELDS if name in row})
+                for customer, row in zip(customers, rows)]
+    _bulk_create(Account, accounts, 'customer_id')
+    deposits = [Deposit(account_id=account.id, amount=account.balance, processing_date=now) for account in accounts]
+    _bulk_create(Deposit, deposits, 'account_id')
+    LedgerEntry.objects.bulk_create(
+        [LedgerEntry(account_id=deposit.account_id, kind=LedgerEntry.DEPOSIT, amount=deposit.amount,
+                     balance=deposit.amount, processing_date=now, deposit=deposit) for deposit in deposits],
+        batch_size=1000)
+
+
+def _bulk_create(model, objects, key):
+    """
+    bulk_create `objects` with their ids set. Backends that do not return them (SQLite before
+    Django 4.0) get one query on `key`, a column unique among the new rows.
+    """
+    model.objects.bulk_create(objects, batch_size=1000)
+    if objects and objects[0].pk is None:
+        ids = dict(model.objects.filter(**{f'{key}__in': [getattr(obj, key) for obj in objects]})
+                   .values_list(key, 'id'))
+        for obj in objects:
+            obj.pk = ids[getattr(obj, key)]
+
+
+def run(rows, chunk_size=1000, workers=1, checkpoint=None, report=None, stdout=None):
+    """
+    Import `rows` (dicts, e.g. from read()) and return (created, rejected). Chunks listed in
+    the `checkpoint` file are skipped; rejected rows are appended to the `report` CSV.
+    """
+    done = _load_checkpoint(checkpoint, chunk_size)
+    pending = ((number, first_row, chunk) for number, first_row, chunk in chunks(rows, chunk_size)
+               if number not in done)
+    with _Report(report) as rejects:
+        created = rejected = 0
+        for result in _results(pending, workers):
+            created += result.created
+            rejected += len(result.rejected)
+            rejects.write(result.rejected)
+            done.add(result.chunk)
+            _save_checkpoint(checkpoint, chunk_size, done)
+            if stdout:
+                stdout.write(f'{created} customers imported, {rejected} rows rejected\n')
+    return created, rejected
+
+
+def _results(pending, workers):
+    if workers <= 1:
+        for job in pending:
+            yield import_chunk(*job)
+        return
+    with process_pool(workers) as executor:
+        # A bounded number of chunks in flight, so a large input is never read ahead into memory.
+        running = set()
+        for job in pending:
+            running.add(executor.submit(import_chunk, *job))
+            if len(running) >= workers * 2:
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                yield from (future.result() for future in finished)
+        for future in running:
+            yield future.result()
+
+
+def _load_checkpoint(path, chunk_size):
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as checkpoint:
+        state = json.load(checkpoint)
+    if state['chunk_size'] != chunk_size:
+        raise ValueError(f'{path} was written with a chunk size of {state["chunk_size"]}, not {chunk_size}.')
+    return set(state['done'])
+
+
+def _save_checkpoint(path, chunk_size, done):
+    if not path:
+        return
+    with open(path + '.tmp', 'w') as checkpoint:
+        json.dump({'chunk_size': chunk_size, 'done': sorted(done)}, checkpoint)
+    os.replace(path + '.tmp', path)
+
+
+class _Report:
+    """The reject report CSV, appended to across resumed runs; a no-op without a path."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = self.writer = None
+
+    def __enter__(self):
+        if self.path:
+            new = not os.path.exists(self.path)
+            self.file = open(self.path, 'a', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.file)
+            if new:
+                self.writer.writerow(REPORT_COLUMNS)
+        return self
+
+    def write(self, rejected):
+        if self.writer is None:
+            return
+        for row, identification_number, errors in rejected:
+            self.writer.writerow([row, identification_number or '', json.dumps(errors)])
+        self.file.flush()
+
+    def __exit__(self, *exc_info):
+        if self.file is not None:
+            self.file.close()
@@ -0,0 +1,123 @@
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from app.db import chunked
+from app.models import Account, BalanceSnapshot, Deposit, LedgerEntry, Transfer, Withdraw
+from app.services import projection
+
+
+def record(account_id, kind, amount, balance, processing_date, **source):
+    """
+    Append one entry. Call it inside the transaction that changed the balance, with the
+    balance as it is after the change (from a locked row or an UPDATE ... RETURNING).
+    """
+    return LedgerEntry.objects.create(account_id=account_id, kind=kind, amount=amount, balance=balance,
+                                      processing_date=processing_date, **source)
+
+
+def transfer_entries(transfer, from_balance, to_balance):
+    """The outgoing and incoming entries of a transfer, given both balances after it."""
+    return [
+        LedgerEntry(account_id=transfer.transfer_from_id, kind=LedgerEntry.TRANSFER_OUT, amount=-transfer.amount,
+                    balance=from_balance, processing_date=transfer.processing_date, transfer=transfer),
+        LedgerEntry(account_id=transfer.transfer_to_id, kind=LedgerEntry.TRANSFER_IN, amount=transfer.amount,
+                    balance=to_balance, processing_date=transfer.processing_date, transfer=transfer),
+    ]
+
+
+def balance_at(account_id, when):
+    """
+    Balance of the account at `when`: the running balance of the last entry up to then,
+    one read on the (account, processing_date, id) index. Snapshots cover dates whose
+    entries are no longer in the ledger.
+    """
+    entry = (LedgerEntry.objects.filter(account_id=account_id, processing_date__lte=when)
+             .order_by('-processing_date', '-id').values_list('balance', flat=True).first())
+    if entry is not None:
+        return entry
+    snapshot = (BalanceSnapshot.objects.filter(account_id=account_id, taken_at__lte=when)
+                .order_by('-taken_at').values_list('balance', flat=True).first())
+    return snapshot if snapshot is not None else 0
+
+
+def take_snapshots(taken_at=None, chunk_size=1000):
+    """Write one BalanceSnapshot per account with ledger history up to `taken_at`. Returns the count."""
+    taken_at = taken_at or timezone.now()
+    last_balance = (LedgerEntry.objects.filter(account_id=OuterRef('id'), processing_date__lte=taken_at)
+                    .order_by('-processing_date', '-id').values('balance')[:1])
+    accounts = (Account.objects.order_by('id').annotate(ledger_balance=Subquery(last_balance))
+                .filter(ledger_balance__isnull=False).values_list('id', 'ledger_balance'))
+    created = 0
+    for chunk in chunked(accounts.iterator(chunk_size=chunk_size), chunk_size):
+        snapshots = [BalanceSnapshot(account_id=account_id, taken_at=taken_at, balance=balance)
+                     for account_id, balance in chunk]
+        BalanceSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+        created += len(snapshots)
+    return created
+
+
+def backfill(chunk_size=500, rebuild=False, stdout=None):
+    """
+    Build ledger entries from the Transfer, Deposit and Withdraw tables, `chunk_size`
+    accounts per transaction. Accounts that already have entries are skipped unless
+    `rebuild` is set. Running balances are anchored on the current balance, so an account
+    whose history does not add up gets an opening entry for the difference.
+
+    Rebuilt entries get new ids, which the balance projection would apply a second time, so
+    a rebuild invalidates it: run `project_balances --rebuild` afterwards.
+    """
+    if rebuild:
+        projection.invalidate()
+    account_ids = Account.objects.order_by('id').values_list('id', flat=True)
+    done = 0
+    for chunk in chunked(account_ids.iterator(chunk_size=chunk_size), chunk_size):
+        with transaction.atomic():
+            accounts = Account.objects.select_for_update().order_by('id').in_bulk(chunk)
+            if rebuild:
+                LedgerEntry.objects.filter(account_id__in=chunk).delete()
+            else:
+                existing = set(LedgerEntry.objects.filter(account_id__in=chunk)
+                               .values_list('account_id', flat=True).distinct())
+                accounts = {id: account for id, account in accounts.items() if id not in existing}
+            LedgerEntry.objects.bulk_create(_history_entries(accounts), batch_size=1000)
+        done += len(chunk)
+        if stdout:
+            stdout.write(f'{done} accounts processed')
+    return done
+
+
+def _history_entries(accounts):
+    if not accounts:
+        return []
+    ids = list(accounts)
+    movements = {id: [] for id in ids}
+    # Every tier: the ledger starts at the account's first movement, archived or not.
+    for deposit in Deposit.objects.filter(account_id__in=ids).all_tiers().order_by('processing_date', 'id'):
+        movements[deposit.account_id].append(
+            (deposit.processing_date, LedgerEntry.DEPOSIT, deposit.amount, {'deposit_id': deposit.id}))
+    for withdraw in Withdraw.objects.filter(account_id__in=ids).all_tiers().order_by('processing_date', 'id'):
+        movements[withdraw.account_id].append(
+            (withdraw.processing_date, LedgerEntry.WITHDRAW, -withdraw.amount, {'withdraw_id': withdraw.id}))
+    transfers = Transfer.objects.filter(Q(transfer_from_id__in=ids) | Q(transfer_to_id__in=ids)).all_tiers()
+    for transfer in transfers.order_by('processing_date', 'id'):
+        if transfer.transfer_from_id in movements:
+            movements[transfer.transfer_from_id].append(
+                (transfer.processing_date, LedgerEntry.TRANSFER_OUT, -transfer.amount, {'transfer_id': transfer.id}))
+        if transfer.transfer_to_id in movements:
+            movements[transfer.transfer_to_id].append(
+                (transfer.processing_date, LedgerEntry.TRANSFER_IN, transfer.amount, {'transfer_id': transfer.id}))
+
+    entries = []
+    for account_id, account in accounts.items():
+        # Stable sort keeps deposits before withdrawals before transfers on equal timestamps.
+        history = sorted(movements[account_id], key=lambda movement: movement[0] or account.open_date)
+        balance = account.balance - sum(amount for _, _, amount, _ in history)
+        if balance:
+            entries.append(LedgerEntry(account_id=account_id, kind=LedgerEntry.OPENING, amount=balance,
+                                       balance=balance, processing_date=account.open_date or timezone.now()))
+        for processing_date, kind, amount, source in history:
+            balance += amount
+            entries.append(LedgerEntry(account_id=account_id, kind=kind, amount=amount, balance=balance,
+                                       processing_date=processing_date or account.open_date, **source))
+    return entries
@@ -0,0 +1,138 @@
+"""
+In-process request metrics, exposed in the Prometheus text format at /metrics.
+
+InstrumentationMiddleware feeds `registry` with one observation per request. Every process
+keeps its own numbers, so with several workers each one has to be scraped (or the numbers
+summed) separately.
+"""
+import threading
+from bisect import bisect_left
+
+# Upper bounds of the histogram buckets; +Inf is implied.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """Counts per bucket plus sum and count, like a Prometheus histogram. Not locked by itself."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, observations <= bound) pairs, ending with '+Inf'."""
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class ViewStats:
+    """What one view costs: wall time, queries, SQL time and its slowest query."""
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.sql_duration = Histogram(DURATION_BUCKETS)
+        self.responses = {}
+        self.slowest_query_seconds = 0.0
+        self.slowest_query = ''
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, method, status_code, seconds, queries):
+        """Record one request; `queries` is the QueryRecorder that watched it."""
+        with self._lock:
+            stats = self._views.get((view, method))
+            if stats is None:
+                stats = self._views[(view, method)] = ViewStats()
+            stats.duration.observe(seconds)
+            stats.queries.observe(queries.count)
+            stats.sql_duration.observe(queries.seconds)
+            stats.responses[status_code] = stats.responses.get(status_code, 0) + 1
+            if queries.slowest_seconds > stats.slowest_query_seconds:
+                stats.slowest_query_seconds = queries.slowest_seconds
+                stats.slowest_query = queries.slowest_sql
+
+    def slowest_query(self, view, method):
+        """(seconds, sql) of the slowest query seen in `view`, or None."""
+        with self._lock:
+            stats = self._views.get((view, method))
+            return (stats.slowest_query_seconds, stats.slowest_query) if stats else None
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self, extra=()):
+        """Everything in the Prometheus text exposition format; `extra` adds (name, help, type, samples)."""
+        with self._lock:
+            views = sorted(self._views.items())
+            families = [
+                ('app_request_duration_seconds', 'Wall time of requests per view.', 'histogram',
+                 _histogram_samples(views, 'duration')),
+                ('app_request_queries', 'SQL queries run per request.', 'histogram',
+                 _histogram_samples(views, 'queries')),
+                ('app_request_sql_duration_seconds', 'Time spent in SQL per request.', 'histogram',
+                 _histogram_samples(views, 'sql_duration')),
+                ('app_requests_total', 'Responses per view and status code.', 'counter',
+                 [('', {'view': view, 'method': method, 'status': str(status_code)}, count)
+                  for (view, method), stats in views for status_code, count in sorted(stats.responses.items())]),
+                ('app_request_slowest_query_seconds', 'Slowest single query seen per view.', 'gauge',
+                 [('', {'view': view, 'method': method}, stats.slowest_query_seconds)
+                  for (view, method), stats in views]),
+            ]
+        lines = []
+        for name, help_text, kind, samples in families + list(extra):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in samples:
+                lines.append(f'{name}{suffix}{_labels(labels)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_samples(views, attribute):
+    samples = []
+    for (view, method), stats in views:
+        histogram = getattr(stats, attribute)
+        labels = {'view': view, 'method': method}
+        for bound, count in histogram.cumulative():
+            samples.append(('_bucket', dict(labels, le=_number(bound)), count))
+        samples.append(('_sum', labels, histogram.sum))
+        samples.append(('_count', labels, histogram.count))
+    return samples
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+registry = Registry()
@@ -0,0 +1,174 @@
+"""
+Account balances projected from the ledger.
+
+LedgerEntry is the event log of every money movement. The projector folds it into
+ProjectedBalance, one row per account holding the sum of its entries, and records in a
+ProjectorCheckpoint the id of the last entry applied. catch_up() applies what was appended
+since; rebuild() recomputes every account from scratch, `chunk_size` accounts per job,
+spread over worker processes.
+
+Account.balance stays the balance the movements lock and check. The projection is derived
+independently of it, so drift() shows the accounts where the two disagree.
+
+Entry ids only grow, except when `backfill_ledger --rebuild` replaces an account's entries
+with new ones: it calls invalidate(), and catch_up() refuses to run until a rebuild.
+
+Ids are assigned when an entry is inserted but become visible when its transaction commits,
+so a recent gap in the ids may still be filled by a transaction in flight. The projector
+stops before gaps younger than PROJECTION_GAP_SECONDS, going by the entries' processing_date,
+and treats older ones as rolled back.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from app.db import chunked, process_pool
+from app.models import Account, LedgerEntry, ProjectedBalance, ProjectorCheckpoint
+
+NAME = 'balances'
+REBUILDING = -1
+
+
+class ProjectionRebuilding(Exception):
+    """catch_up() was called while a rebuild is running, after one was interrupted, or after invalidate()."""
+
+
+def catch_up(batch_size=10000, stdout=None):
+    """Apply the entries appended since the checkpoint, `batch_size` per transaction. Returns how many."""
+    applied = 0
+    while True:
+        with transaction.atomic():
+            checkpoint = _checkpoint(lock=True)
+            if checkpoint.position == REBUILDING:
+                raise ProjectionRebuilding('The balance projection is being rebuilt or was invalidated; '
+                                            'run rebuild() to finish it.')
+            entries = _committed_entries(checkpoint.position, batch_size)
+            if entries:
+                _apply(entries)
+                checkpoint.position = entries[-1][0]
+                checkpoint.save(update_fields=['position'])
+        applied += len(entries)
+        if stdout and entries:
+            stdout.write(f'{applied} ledger entries projected\n')
+        # Fewer than asked for: caught up, or stopped at a gap that may still be filled.
+        if len(entries) < batch_size:
+            return applied
+
+
+def rebuild(chunk_size=1000, workers=1, window=10000, stdout=None):
+    """
+    Recompute every projected balance from the ledger and move the checkpoint to the last
+    entry included. Only the last `window` entries are checked for gaps that may still be
+    filled. Returns the number of accounts with a projected balance.
+    """
+    position = _rebuild_position(window)
+    with transaction.atomic():
+        checkpoint = _checkpoint(lock=True)
+        checkpoint.position = REBUILDING
+        checkpoint.save(update_fields=['position'])
+    account_ids = list(Account.objects.order_by('id').values_list('id', flat=True))
+    jobs = [(chunk[0], chunk[-1], position) for chunk in chunked(account_ids, chunk_size)]
+    if workers <= 1:
+        counts = map(_rebuild_job, jobs)
+        projected = _collect(counts, stdout)
+    else:
+        with process_pool(workers) as executor:
+            projected = _collect(executor.map(_rebuild_job, jobs), stdout)
+    # Entries of accounts created since the account ids were read are above `position`.
+    ProjectorCheckpoint.objects.filter(name=NAME).update(position=position)
+    return projected
+
+
+def invalidate():
+    """Mark the projection as needing a rebuild, because entries it has applied were replaced."""
+    ProjectorCheckpoint.objects.filter(name=NAME).update(position=REBUILDING)
+
+
+def rebuild_range(first_account_id, last_account_id, position):
+    """Recompute the projected balances of an account id range from its entries up to `position`."""
+    accounts = {'account_id__gte': first_account_id, 'account_id__lte': last_account_id}
+    with transaction.atomic():
+        ProjectedBalance.objects.filter(**accounts).delete()
+        sums = (LedgerEntry.objects.filter(id__lte=position, **accounts)
+                .values('account_id').annotate(total=Sum('amount')).order_by().values_list('account_id', 'total'))
+        balances = [ProjectedBalance(account_id=account_id, balance=total) for account_id, total in sums]
+        ProjectedBalance.objects.bulk_create(balances, batch_size=1000)
+    return len(balances)
+
+
+def drift():
+    """
+    Accounts whose balance differs from the projected one, as (account id, balance, projected
+    balance). Accounts with entries past the checkpoint are left out; catch up first.
+    """
+    position = _checkpoint().position
+    if position == REBUILDING:
+        raise ProjectionRebuilding('The balance projection is being rebuilt.')
+    projected = ProjectedBalance.objects.filter(account_id=OuterRef('id')).values('balance')
+    return (Account.objects.annotate(projected=Coalesce(Subquery(projected), Value(0)))
+            .exclude(balance=F('projected')).exclude(ledger_entries__id__gt=position)
+            .order_by('id').values_list('id', 'balance', 'projected'))
+
+
+def checkpoint_position():
+    """Id of the last ledger entry in the projection, REBUILDING during a rebuild."""
+    return _checkpoint().position
+
+
+def _checkpoint(lock=False):
+    checkpoint, _ = ProjectorCheckpoint.objects.get_or_create(name=NAME)
+    if lock:
+        checkpoint = ProjectorCheckpoint.objects.select_for_update().get(pk=checkpoint.pk)
+    return checkpoint
+
+
+def _committed_entries(after, limit):
+    """(id, account id, amount) of up to `limit` entries after id `after`, up to the first recent gap."""
+    rows = (LedgerEntry.objects.filter(id__gt=after).order_by('id')
+            .values_list('id', 'account_id', 'amount', 'processing_date')[:limit])
+    recent = timezone.now() - timedelta(seconds=settings.PROJECTION_GAP_SECONDS)
+    entries = []
+    expected = after + 1
+    for entry_id, account_id, amount, processing_date in rows:
+        if entry_id != expected and processing_date > recent:
+            break
+        entries.append((entry_id, account_id, amount))
+        expected = entry_id + 1
+    return entries
+
+
+def _apply(entries):
+    deltas = defaultdict(int)
+    for _, account_id, amount in entries:
+        deltas[account_id] += amount
+    existing = ProjectedBalance.objects.in_bulk(list(deltas))
+    for account_id, balance in existing.items():
+        balance.balance += deltas[account_id]
+    ProjectedBalance.objects.bulk_update(list(existing.values()), ['balance'], batch_size=1000)
+    ProjectedBalance.objects.bulk_create([ProjectedBalance(account_id=account_id, balance=delta)
+                                          for account_id, delta in deltas.items() if account_id not in existing])
+
+
+def _rebuild_position(window):
+    last = LedgerEntry.objects.aggregate(last=Max('id'))['last'] or 0
+    start = max(0, last - window)
+    entries = _committed_entries(start, window)
+    return entries[-1][0] if entries else start
+
+
+def _rebuild_job(job):
+    return rebuild_range(*job)
+
+
+def _collect(counts, stdout):
+    projected = 0
+    for count in counts:
+        projected += count
+        if stdout:
+            stdout.write(f'{projected} balances projected\n')
+    return projected
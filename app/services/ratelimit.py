@@ -0,0 +1,62 @@
+"""
+Token buckets: each key holds up to `capacity` tokens and gains `capacity / period` per
+second; a request takes one or is refused until the next token is due.
+
+Buckets are kept in the THROTTLE_CACHE_ALIAS cache, so with a shared backend every process
+draws from the same bucket. The cache has no compare-and-set, so two processes taking the
+last token at the same moment can both get it: a burst may overshoot by about one token per
+process. When the cache fails, buckets are kept in this process until it answers again.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+_local = {}
+_local_lock = threading.Lock()
+
+
+def parse_rate(rate):
+    """(capacity, period in seconds) of a DRF-style rate such as '20/s' or '1000/hour'; None for None."""
+    if rate is None:
+        return None
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def take(key, capacity, period):
+    """Take a token from `key`'s bucket. Returns 0 if one was available, else the seconds until one is."""
+    now = time.time()
+    try:
+        cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        state = cache.get(key)
+        wait, state = _take(state, now, capacity, period)
+        if not wait:
+            # The bucket is full again after `period`, so an idle key expires with it.
+            cache.set(key, state, period)
+        return wait
+    except Exception:
+        logger.warning('Throttle cache unavailable, limiting per process', exc_info=True)
+    with _local_lock:
+        wait, _local[key] = _take(_local.get(key), now, capacity, period)
+        return wait
+
+
+def reset():
+    with _local_lock:
+        _local.clear()
+
+
+def _take(state, now, capacity, period):
+    """(wait, new state) for a bucket `state` of (tokens, time they were counted)."""
+    tokens, counted_at = state or (capacity, now)
+    tokens = min(capacity, tokens + (now - counted_at) * capacity / period)
+    if tokens >= 1:
+        return 0, (tokens - 1, now)
+    return (1 - tokens) * period / capacity, (tokens, now)
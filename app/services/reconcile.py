@@ -0,0 +1,173 @@
+"""
+Reconciliation of the stored balances against the movement history.
+
+The expected balance of an account is its deposits (the opening deposit included) minus its
+withdraws, plus the transfers it received, minus the ones it sent, over both history tiers.
+Each is one GROUP BY query per chunk of accounts, so a run is four queries per `chunk_size`
+accounts, spread over worker processes when asked.
+
+An account whose balance does not match is checked again with its row locked, which waits
+for the movement writing to it, so a movement committed between the two reads is not
+reported.
+
+Incremental runs only reconcile the accounts with movements (or created) since the last
+run. The last id seen in each table is kept in a ProjectorCheckpoint. The `overlap` ids
+before it are read again, for rows whose transaction committed after the previous run
+passed their ids. A balance changed without a movement is only found by a full run.
+"""
+import csv
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Max, Sum
+
+from app.db import chunked, process_pool
+from app.models import Account, Deposit, ProjectorCheckpoint, Transfer, Withdraw
+from app.money import to_major
+
+REPORT_COLUMNS = ('account_id', 'balance', 'expected', 'difference', 'deposits', 'withdraws', 'transfers_in',
+                  'transfers_out')
+CHECKPOINT_PREFIX = 'reconcile.'
+
+Discrepancy = namedtuple('Discrepancy', 'account_id balance expected deposits withdraws transfers_in transfers_out')
+Result = namedtuple('Result', 'accounts discrepancies')
+
+# (checkpoint name, model, account columns of a row)
+TABLES = (
+    ('account', Account, ('id',)),
+    ('deposit', Deposit, ('account_id',)),
+    ('withdraw', Withdraw, ('account_id',)),
+    ('transfer', Transfer, ('transfer_from_id', 'transfer_to_id')),
+)
+TOTALS = ('deposits', 'withdraws', 'transfers_in', 'transfers_out')
+
+
+def reconcile(chunk_size=1000, workers=1, incremental=False, overlap=10000, report=None, stdout=None):
+    """
+    Reconcile every account, or with `incremental` those touched since the last run, and
+    write the discrepancies to the `report` CSV. Returns a Result.
+    """
+    marks = {name: model.objects.aggregate(last=Max('id'))['last'] or 0 for name, model, _ in TABLES}
+    previous = _previous_marks()
+    if incremental and previous is not None:
+        jobs = [(None, None, chunk) for chunk in chunked(sorted(touched(previous, marks, overlap)), chunk_size)]
+    else:
+        jobs = [(first, last, None) for first, last in _ranges(chunk_size)]
+    accounts, discrepancies = 0, []
+    for result in _results(jobs, workers):
+        accounts += result.accounts
+        discrepancies += result.discrepancies
+        if stdout:
+            stdout.write(f'{accounts} accounts reconciled, {len(discrepancies)} discrepancies\n')
+    if report:
+        write_report(report, discrepancies)
+    _save_marks(marks)
+    return Result(accounts, discrepancies)
+
+
+def touched(previous, marks, overlap):
+    """Ids of the accounts with rows in (previous mark - overlap, mark] of any table."""
+    ids = set()
+    for name, model, columns in TABLES:
+        rows = model.objects.filter(id__gt=max(0, previous.get(name, 0) - overlap), id__lte=marks[name])
+        for column in columns:
+            ids.update(rows.values_list(column, flat=True).distinct().order_by())
+    return ids
+
+
+def reconcile_accounts(first_account_id=None, last_account_id=None, account_ids=None):
+    """Reconcile an account id range, or the `account_ids`. Returns a Result."""
+    if account_ids is not None:
+        accounts, rows = {'id__in': account_ids}, {'account_id__in': account_ids}
+    else:
+        accounts = {'id__gte': first_account_id, 'id__lte': last_account_id}
+        rows = {'account_id__gte': first_account_id, 'account_id__lte': last_account_id}
+    balances = dict(Account.objects.filter(**accounts).values_list('id', 'balance'))
+    totals = _totals(rows)
+    discrepancies = []
+    for account_id, balance in balances.items():
+        if balance != _expected(totals, account_id):
+            discrepancy = recheck(account_id)
+            if discrepancy is not None:
+                discrepancies.append(discrepancy)
+    return Result(len(balances), discrepancies)
+
+
+def recheck(account_id):
+    """The account's Discrepancy with its row locked, or None if it reconciles after all."""
+    with transaction.atomic():
+        balance = Account.objects.select_for_update().values_list('balance', flat=True).filter(id=account_id).first()
+        if balance is None:
+            return None
+        totals = _totals({'account_id__in': [account_id]})
+        expected = _expected(totals, account_id)
+    if balance == expected:
+        return None
+    return Discrepancy(account_id, balance, expected, *(totals[key].get(account_id, 0) for key in TOTALS))
+
+
+def _totals(rows):
+    """{'deposits': {account id: sum}, ...} over both tiers, one GROUP BY query each."""
+    transfers_in = {key.replace('account_id', 'transfer_to_id'): value for key, value in rows.items()}
+    transfers_out = {key.replace('account_id', 'transfer_from_id'): value for key, value in rows.items()}
+    return {
+        'deposits': _sums(Deposit.objects.filter(**rows), 'account_id'),
+        'withdraws': _sums(Withdraw.objects.filter(**rows), 'account_id'),
+        'transfers_in': _sums(Transfer.objects.filter(**transfers_in), 'transfer_to_id'),
+        'transfers_out': _sums(Transfer.objects.filter(**transfers_out), 'transfer_from_id'),
+    }
+
+
+def _sums(queryset, column):
+    return dict(queryset.all_tiers().values(column).annotate(total=Sum('amount')).order_by()
+                .values_list(column, 'total'))
+
+
+def _expected(totals, account_id):
+    return (totals['deposits'].get(account_id, 0) - totals['withdraws'].get(account_id, 0)
+            + totals['transfers_in'].get(account_id, 0) - totals['transfers_out'].get(account_id, 0))
+
+
+def write_report(path, discrepancies):
+    with open(path, 'w', newline='', encoding='utf-8') as output:
+        writer = csv.writer(output)
+        writer.writerow(REPORT_COLUMNS)
+        for item in discrepancies:
+            writer.writerow([item.account_id, to_major(item.balance), to_major(item.expected),
+                             to_major(item.balance - item.expected), to_major(item.deposits),
+                             to_major(item.withdraws), to_major(item.transfers_in), to_major(item.transfers_out)])
+
+
+def _previous_marks():
+    marks = dict(ProjectorCheckpoint.objects.filter(name__startswith=CHECKPOINT_PREFIX)
+                 .values_list('name', 'position'))
+    if not marks:
+        return None
+    return {name[len(CHECKPOINT_PREFIX):]: position for name, position in marks.items()}
+
+
+def _save_marks(marks):
+    for name, position in marks.items():
+        ProjectorCheckpoint.objects.update_or_create(name=CHECKPOINT_PREFIX + name, defaults={'position': position})
+
+
+def _ranges(chunk_size):
+    """(first, last) account ids of consecutive chunks of `chunk_size` accounts, without loading every id."""
+    ids = Account.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size)
+    for chunk in chunked(ids, chunk_size):
+        yield chunk[0], chunk[-1]
+
+
+def _results(jobs, workers):
+    if workers <= 1:
+        return map(_job, jobs)
+    return _parallel(jobs, workers)
+
+
+def _parallel(jobs, workers):
+    with process_pool(workers) as executor:
+        yield from executor.map(_job, jobs, chunksize=4)
+
+
+def _job(job):
+    return reconcile_accounts(*job)
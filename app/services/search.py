@@ -0,0 +1,231 @@
+"""
+Customer search by name, address and identification number.
+
+A customer matches when its identification number starts with the query, its name or
+address contains it, or either is similar to it by trigrams (pg_trgm's similarity: the
+shared share of the two sets of three-letter sequences, so a typo still matches). Results are
+ranked by that similarity, identification number prefixes first, then by id. A query without
+three letters or digits in a row has no trigram an index could look up, so it only matches
+identification number prefixes.
+
+On Postgres every branch is answered by an index: the trigram GIN indexes of migration 0018
+on name and address (and on their upper case, which icontains compares), and the pattern
+index Django gives the unique identification number. The similarity threshold is
+pg_trgm.similarity_threshold.
+
+Elsewhere an in-process inverted index from trigram to customer ids stands in. It is built on
+the first search, picks up customers with new ids before every search, follows saves and
+deletes made by this process, and is rebuilt after CUSTOMER_SEARCH_INDEX_TTL seconds for the
+changes made by others. The rebuild reads the table into a new index while searches go on with
+the old one. Its threshold is CUSTOMER_SEARCH_SIMILARITY.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from app.models import Customer
+
+WORD = re.compile(r'[^\W_]+')
+TRIGRAM = re.compile(r'[^\W_]{3}')
+
+
+def search(term, offset=0, limit=20):
+    """([(customer, rank)], more) of the customers matching `term`, best first, skipping `offset`."""
+    term = term.strip()
+    if not term:
+        return [], False
+    text = TRIGRAM.search(term) is not None
+    if connections[Customer.objects.db].vendor == 'postgresql':
+        rows = _search_postgres(term, text, offset, limit + 1)
+    else:
+        rows = _search_index(term, text, offset, limit + 1)
+    return rows[:limit], len(rows) > limit
+
+
+def trigrams(text):
+    """pg_trgm's trigrams of `text`: lowercased words, padded with two spaces before and one after."""
+    result = set()
+    for word in WORD.findall(text.lower()):
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _search_postgres(term, text, offset, limit):
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    prefix = Q(identification_number__startswith=term)
+    if not text:
+        customers = Customer.objects.filter(prefix).order_by('id')[offset:offset + limit]
+        return [(customer, 1.0) for customer in customers]
+    matches = (prefix | Q(name__icontains=term) | Q(address__icontains=term)
+               | Q(name__trigram_similar=term) | Q(address__trigram_similar=term))
+    rank = Case(When(prefix, then=Value(1.0)),
+                default=Greatest(TrigramSimilarity('name', term), TrigramSimilarity('address', term)),
+                output_field=FloatField())
+    customers = Customer.objects.filter(matches).annotate(rank=rank).order_by('-rank', 'id')[offset:offset + limit]
+    return [(customer, customer.rank) for customer in customers]
+
+
+def _search_index(term, text, offset, limit):
+    ranked = get_index().search(term, settings.CUSTOMER_SEARCH_SIMILARITY, text)[offset:offset + limit]
+    customers = Customer.objects.in_bulk([id for id, _ in ranked])
+    return [(customers[id], rank) for id, rank in ranked if id in customers]
+
+
+class CustomerIndex:
+    """Trigram postings of customer names and addresses, and identification numbers in order."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.postings = defaultdict(set)
+        self.documents = {}
+        self.numbers = []
+        self.last_id = 0
+        self.built_at = time.monotonic()
+
+    def add(self, id, name, address, identification_number):
+        with self._lock:
+            self.remove(id)
+            name, address = name.lower(), address.lower()
+            name_trigrams, address_trigrams = trigrams(name), trigrams(address)
+            self.documents[id] = (identification_number, name, address, name_trigrams, address_trigrams)
+            for trigram in name_trigrams | address_trigrams:
+                self.postings[trigram].add(id)
+            insort(self.numbers, (identification_number, id))
+            self.last_id = max(self.last_id, id)
+
+    def remove(self, id):
+        with self._lock:
+            document = self.documents.pop(id, None)
+            if document is None:
+                return
+            identification_number, _, _, name_trigrams, address_trigrams = document
+            for trigram in name_trigrams | address_trigrams:
+                self.postings[trigram].discard(id)
+                if not self.postings[trigram]:
+                    del self.postings[trigram]
+            position = bisect_left(self.numbers, (identification_number, id))
+            if position < len(self.numbers) and self.numbers[position] == (identification_number, id):
+                del self.numbers[position]
+
+    def search(self, term, threshold, text=True):
+        """[(id, rank)] of the customers matching `term`, best first; without `text` by prefix only."""
+        with self._lock:
+            ranks = {id: 1.0 for id in self._prefixed(term)}
+            if not text:
+                return sorted(ranks.items())
+            query = trigrams(term)
+            # A customer sharing fewer trigrams than this cannot reach the threshold.
+            hits = Counter(id for trigram in query for id in self.postings.get(trigram, ()))
+            needed = threshold * len(query)
+            lowered = term.lower()
+            for id in self._containing(lowered) | {id for id, count in hits.items() if count >= needed}:
+                if id in ranks:
+                    continue
+                _, name, address, name_trigrams, address_trigrams = self.documents[id]
+                rank = max(similarity(query, name_trigrams), similarity(query, address_trigrams))
+                if rank >= threshold or lowered in name or lowered in address:
+                    ranks[id] = rank
+        return sorted(ranks.items(), key=lambda item: (-item[1], item[0]))
+
+    def _prefixed(self, term):
+        position = bisect_left(self.numbers, (term,))
+        while position < len(self.numbers) and self.numbers[position][0].startswith(term):
+            yield self.numbers[position][1]
+            position += 1
+
+    def _containing(self, term):
+        """Candidates for a substring match: the customers with every trigram inside `term`."""
+        inner = {term[i:i + 3] for i in range(len(term) - 2)}
+        inner = {trigram for trigram in inner if WORD.fullmatch(trigram)}
+        if not inner:
+            return set()
+        postings = sorted((self.postings.get(trigram, set()) for trigram in inner), key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+
+_index = None
+# Saves and deletes seen while a rebuild reads the table, applied to the new index before it
+# replaces the old one.
+_pending = None
+_index_lock = threading.Lock()
+_rebuild_lock = threading.Lock()
+
+
+def get_index():
+    """The fallback index, built or rebuilt when due and caught up with new customers."""
+    if _index is None:
+        with _rebuild_lock:
+            if _index is None:
+                _rebuild()
+    elif time.monotonic() - _index.built_at > settings.CUSTOMER_SEARCH_INDEX_TTL and _rebuild_lock.acquire(False):
+        # One thread rebuilds; the others keep searching the old index meanwhile.
+        try:
+            _rebuild()
+        finally:
+            _rebuild_lock.release()
+    return _build(_index)
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def _rebuild():
+    global _index, _pending
+    with _index_lock:
+        _pending = []
+    try:
+        index = _build(CustomerIndex())
+        with _index_lock:
+            for change in _pending:
+                change(index)
+            _index = index
+    finally:
+        with _index_lock:
+            _pending = None
+
+
+def _change(apply):
+    with _index_lock:
+        if _index is not None:
+            apply(_index)
+        if _pending is not None:
+            _pending.append(apply)
+
+
+def _build(index):
+    rows = (Customer.objects.filter(id__gt=index.last_id).order_by('id')
+            .values_list('id', 'name', 'address', 'identification_number').iterator(chunk_size=10000))
+    for row in rows:
+        index.add(*row)
+    return index
+
+
+@receiver(post_save, sender=Customer, dispatch_uid='search-index-save')
+def _customer_saved(sender, instance, **kwargs):
+    _change(lambda index: index.add(instance.id, instance.name, instance.address, instance.identification_number))
+
+
+@receiver(post_delete, sender=Customer, dispatch_uid='search-index-delete')
+def _customer_deleted(sender, instance, **kwargs):
+    id = instance.id
+    _change(lambda index: index.remove(id))
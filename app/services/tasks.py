@@ -0,0 +1,195 @@
+"""
+Deferred work that should not slow down the request that caused it.
+
+Tasks are plain functions registered with `@task` and queued with `enqueue(name, **payload)`.
+Nothing runs before the surrounding transaction commits, and nothing is queued if it rolls
+back. Two backends, picked with TASK_BACKEND:
+
+- 'database': the task is a row in the Task table, drained by `manage.py run_tasks`. The row
+  is written inside the caller's transaction, so it becomes visible to workers exactly when
+  the work that queued it commits.
+- 'thread': the task is handed to an in-process thread pool from `transaction.on_commit`.
+  Meant for tests and single-process setups; a crash loses what is still in the pool.
+
+Failed tasks are retried with exponential backoff up to their max_attempts and then kept as
+dead letters with the last error.
+"""
+import logging
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from app.models import Task
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def task(name=None, max_attempts=None):
+    """Register a function as a task under `name` (default: its dotted path)."""
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        func.task_name = task_name
+        func.max_attempts = max_attempts or settings.TASK_MAX_ATTEMPTS
+        registry[task_name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, delay=0, **payload):
+    """Queue task `name` to run with `payload` (JSON-serializable keyword arguments) after commit."""
+    func = registry[name]
+    if settings.TASK_BACKEND == 'thread':
+        transaction.on_commit(lambda: get_thread_backend().submit(name, payload))
+        return None
+    return Task.objects.create(name=name, payload=payload, max_attempts=func.max_attempts,
+                               run_at=timezone.now() + timedelta(seconds=delay))
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, capped at TASK_MAX_RETRY_DELAY seconds."""
+    delay = min(settings.TASK_MAX_RETRY_DELAY, settings.TASK_RETRY_DELAY * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.5, 1)
+
+
+def claim(limit):
+    """
+    Mark up to `limit` due tasks as running and return them. Concurrent workers skip each
+    other's rows with SKIP LOCKED instead of waiting on them; a task left running longer than
+    TASK_LOCK_TIMEOUT (its worker died) is due again.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.TASK_LOCK_TIMEOUT)
+    with transaction.atomic():
+        due = (Task.objects.filter(status=Task.QUEUED, run_at__lte=now) |
+               Task.objects.filter(status=Task.RUNNING, locked_at__lte=stale))
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        claimed = list(due.order_by('run_at', 'id')[:limit])
+        Task.objects.filter(id__in=[claimed_task.id for claimed_task in claimed]).update(
+            status=Task.RUNNING, locked_at=now, attempts=F('attempts') + 1)
+    for claimed_task in claimed:
+        claimed_task.attempts += 1
+    return claimed
+
+
+def execute(claimed_task):
+    """Run a claimed task and record the outcome: deleted when done, retried or dead-lettered when not."""
+    error = _call(claimed_task.name, claimed_task.payload)
+    if error is None:
+        Task.objects.filter(id=claimed_task.id).delete()
+        return True
+    if claimed_task.attempts >= claimed_task.max_attempts:
+        Task.objects.filter(id=claimed_task.id).update(status=Task.DEAD, last_error=error, locked_at=None)
+    else:
+        Task.objects.filter(id=claimed_task.id).update(
+            status=Task.QUEUED, last_error=error, locked_at=None,
+            run_at=timezone.now() + timedelta(seconds=retry_delay(claimed_task.attempts)))
+    return False
+
+
+def _call(name, payload):
+    """Run the task function; the formatted traceback on failure, None on success."""
+    func = registry.get(name)
+    if func is None:
+        return f'Unknown task "{name}"'
+    try:
+        func(**payload)
+    except Exception:
+        logger.exception('Task %s failed', name)
+        return traceback.format_exc()
+    return None
+
+
+def run_once(batch_size=100, threads=0):
+    """Claim one batch and run it, on `threads` threads if given. Returns how many tasks were claimed."""
+    claimed = claim(batch_size)
+    if threads and len(claimed) > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(_execute_in_thread, claimed))
+    else:
+        for claimed_task in claimed:
+            execute(claimed_task)
+    return len(claimed)
+
+
+def _execute_in_thread(claimed_task):
+    try:
+        return execute(claimed_task)
+    finally:
+        connection.close()
+
+
+def retry_dead(ids=None):
+    """Queue dead-lettered tasks (all, or the given ids) again with a fresh attempt budget."""
+    dead = Task.objects.filter(status=Task.DEAD)
+    if ids:
+        dead = dead.filter(id__in=ids)
+    return dead.update(status=Task.QUEUED, attempts=0, run_at=timezone.now(), locked_at=None)
+
+
+class ThreadBackend:
+    """Runs tasks on a local pool with the same retry and dead-letter rules, without the table."""
+
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='task')
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.dead = []
+
+    def submit(self, name, payload):
+        future = self.executor.submit(self._run, name, payload)
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.pending.discard(future)
+
+    def _run(self, name, payload):
+        close_old_connections()
+        try:
+            max_attempts = getattr(registry.get(name), 'max_attempts', 1)
+            for attempt in range(1, max_attempts + 1):
+                error = _call(name, payload)
+                if error is None:
+                    return True
+                if attempt < max_attempts:
+                    time.sleep(retry_delay(attempt))
+            with self.lock:
+                self.dead.append((name, payload, error))
+            return False
+        finally:
+            close_old_connections()
+
+    def join(self, timeout=None):
+        """Wait for every submitted task, including ones submitted while waiting."""
+        while True:
+            with self.lock:
+                pending = list(self.pending)
+            if not pending:
+                return
+            wait(pending, timeout=timeout)
+
+
+_thread_backend = None
+_thread_backend_lock = threading.Lock()
+
+
+def get_thread_backend():
+    global _thread_backend
+    with _thread_backend_lock:
+        if _thread_backend is None:
+            _thread_backend = ThreadBackend(settings.TASK_THREADS)
+        return _thread_backend
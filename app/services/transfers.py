@@ -0,0 +1,230 @@
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.db import OperationalError, connection, transaction
+from django.db.models.expressions import F
+from django.utils import timezone
+
+from app.db import statement_timeout
+from app.models import Account, LedgerEntry, Transfer
+from app.services import account_cache, ledger, tasks
+from app.tasks import AUDIT_TRANSFERS
+from app.money import MAX_BALANCE
+from app.services.exceptions import (AccountNotFound, BalanceLimitExceeded, CurrencyMismatch, InactiveAccount,
+                                     InsufficientBalance, InvalidAmount, MovementError)
+
+# Postgres SQLSTATEs that mean "roll back and try again".
+RETRYABLE_PGCODES = {'40001', '40P01'}  # serialization_failure, deadlock_detected
+
+
+class ContentionMetrics:
+    """Per-account counters for how hard transfers fight over row locks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._accounts = defaultdict(self._empty)
+
+    @staticmethod
+    def _empty():
+        return {'transfers': 0, 'retries': 0, 'lock_wait_seconds': 0.0, 'max_lock_wait_seconds': 0.0}
+
+    def record_lock_wait(self, account_ids, seconds):
+        with self._lock:
+            for account_id in account_ids:
+                stats = self._accounts[account_id]
+                stats['lock_wait_seconds'] += seconds
+                stats['max_lock_wait_seconds'] = max(stats['max_lock_wait_seconds'], seconds)
+
+    def record_retry(self, account_ids):
+        self._increment(account_ids, 'retries')
+
+    def record_transfer(self, account_ids, count=1):
+        self._increment(account_ids, 'transfers', count)
+
+    def _increment(self, account_ids, key, count=1):
+        with self._lock:
+            for account_id in account_ids:
+                self._accounts[account_id][key] += count
+
+    def snapshot(self, account_id=None):
+        with self._lock:
+            if account_id is not None:
+                return dict(self._accounts.get(account_id) or self._empty())
+            return {account_id: dict(stats) for account_id, stats in self._accounts.items()}
+
+    def reset(self):
+        with self._lock:
+            self._accounts.clear()
+
+
+contention_metrics = ContentionMetrics()
+
+
+def is_retryable(exc):
+    """Deadlocks and serialization failures on Postgres, lock timeouts on SQLite."""
+    cause = exc.__cause__
+    if getattr(cause, 'pgcode', None) in RETRYABLE_PGCODES:
+        return True
+    return 'database is locked' in str(exc)
+
+
+def backoff_delay(attempt, base=0.01, cap=0.5):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def run_locked(account_ids, work, max_attempts=5):
+    """
+    Run `work` in its own transaction, retrying deadlocks and serialization failures with
+    bounded backoff. Nested in a caller's transaction there is nothing we can restart, so
+    `work` gets a single attempt.
+    """
+    attempts = max_attempts if not connection.in_atomic_block else 1
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                statement_timeout('write')
+                return work()
+        except OperationalError as exc:
+            if attempt + 1 >= attempts or not is_retryable(exc):
+                raise
+            contention_metrics.record_retry(account_ids)
+            time.sleep(backoff_delay(attempt))
+
+
+def lock_accounts(account_ids):
+    """SELECT ... FOR UPDATE the accounts in ascending id order so lockers can not deadlock each other."""
+    account_ids = sorted(account_ids)
+    started = time.monotonic()
+    accounts = Account.objects.select_for_update().order_by('id').in_bulk(account_ids)
+    contention_metrics.record_lock_wait(account_ids, time.monotonic() - started)
+    return accounts
+
+
+def execute_transfer(transfer_from_id, transfer_to_id, amount, max_attempts=5):
+    """
+    Move `amount` (minor units) between two accounts and record the Transfer.
+
+    Both rows are locked before the balance is checked again, so a stale read in the
+    serializer can not lead to an overdraft.
+    """
+    account_ids = (transfer_from_id, transfer_to_id)
+    transfer = run_locked(account_ids, lambda: _transfer_locked(transfer_from_id, transfer_to_id, amount),
+                          max_attempts=max_attempts)
+    contention_metrics.record_transfer(account_ids)
+    return transfer
+
+
+def _transfer_locked(transfer_from_id, transfer_to_id, amount):
+    accounts = lock_accounts((transfer_from_id, transfer_to_id))
+    transfer_from, transfer_to = accounts.get(transfer_from_id), accounts.get(transfer_to_id)
+    check_transfer(transfer_from, transfer_to, transfer_from_id, transfer_to_id, amount)
+    Account.objects.filter(id=transfer_from_id).update(balance=F('balance') - amount)
+    Account.objects.filter(id=transfer_to_id).update(balance=F('balance') + amount)
+    transfer = Transfer.objects.create(amount=amount, transfer_from_id=transfer_from_id,
+                                       transfer_to_id=transfer_to_id, processing_date=timezone.now())
+    LedgerEntry.objects.bulk_create(ledger.transfer_entries(transfer, transfer_from.balance - amount,
+                                                            transfer_to.balance + amount))
+    account_cache.invalidate(transfer_from_id, transfer_to_id)
+    tasks.enqueue(AUDIT_TRANSFERS, transfers=[audit_row(transfer)])
+    return transfer
+
+
+def audit_row(transfer):
+    return [transfer.id, transfer.transfer_from_id, transfer.transfer_to_id, transfer.amount]
+
+
+def check_transfer(transfer_from, transfer_to, transfer_from_id, transfer_to_id, amount, balance=None):
+    """Raise the MovementError that refuses this transfer, if any. `balance` overrides the sender's balance."""
+    if amount <= 0:
+        # A negative amount would move money from the recipient to the sender, unchecked.
+        raise InvalidAmount()
+    if transfer_from is None:
+        raise AccountNotFound(transfer_from_id)
+    if transfer_to is None:
+        raise AccountNotFound(transfer_to_id)
+    if not transfer_from.is_active:
+        raise InactiveAccount('Sending account must be active.')
+    if not transfer_to.is_active:
+        raise InactiveAccount('Recipient account must be active')
+    if transfer_from.currency != transfer_to.currency:
+        raise CurrencyMismatch()
+    if (transfer_from.balance if balance is None else balance) < amount:
+        raise InsufficientBalance()
+
+
+def execute_transfer_batch(items, all_or_nothing=True, max_attempts=5):
+    """
+    Settle many transfers with a handful of queries.
+
+    `items` are dicts with transfer_from, transfer_to (account ids) and amount (minor units). Every account
+    involved is locked with one query, the items are checked in order against running
+    balances kept in memory, the accepted transfers are inserted with bulk_create and the net
+    change of each account is applied with a single UPDATE.
+
+    Returns one `(transfer, error)` pair per item. With `all_or_nothing` a single refused item
+    means nothing is written.
+    """
+    account_ids = {item['transfer_from'] for item in items} | {item['transfer_to'] for item in items}
+    results = run_locked(account_ids, lambda: _settle_batch_locked(items, account_ids, all_or_nothing),
+                         max_attempts=max_attempts)
+    accepted = Counter()
+    for transfer, _ in results:
+        if transfer is not None:
+            accepted.update((transfer.transfer_from_id, transfer.transfer_to_id))
+    for account_id, count in accepted.items():
+        contention_metrics.record_transfer((account_id,), count=count)
+    return results
+
+
+def _settle_batch_locked(items, account_ids, all_or_nothing):
+    accounts = lock_accounts(account_ids)
+    balances = {account_id: account.balance for account_id, account in accounts.items()}
+    deltas = defaultdict(int)
+    processing_date = timezone.now()
+    results = []
+    settled = []
+
+    for item in items:
+        transfer_from_id, transfer_to_id, amount = item['transfer_from'], item['transfer_to'], item['amount']
+        try:
+            check_transfer(accounts.get(transfer_from_id), accounts.get(transfer_to_id),
+                           transfer_from_id, transfer_to_id, amount, balance=balances.get(transfer_from_id))
+            # Each amount is capped, but many of them netted into one account are not.
+            if balances[transfer_to_id] + amount > MAX_BALANCE:
+                raise BalanceLimitExceeded()
+        except MovementError as exc:
+            results.append((None, exc))
+            continue
+        balances[transfer_from_id] -= amount
+        balances[transfer_to_id] += amount
+        deltas[transfer_from_id] -= amount
+        deltas[transfer_to_id] += amount
+        transfer = Transfer(amount=amount, transfer_from_id=transfer_from_id, transfer_to_id=transfer_to_id,
+                            processing_date=processing_date)
+        results.append((transfer, None))
+        settled.append((transfer, balances[transfer_from_id], balances[transfer_to_id]))
+
+    if all_or_nothing and any(error is not None for _, error in results):
+        return [(None, error) for _, error in results]
+
+    transfers = [transfer for transfer, _, _ in settled]
+    if connection.features.can_return_rows_from_bulk_insert:
+        Transfer.objects.bulk_create(transfers, batch_size=1000)
+    else:
+        # The ledger needs the transfer ids, which this backend can not hand back from a bulk insert.
+        for transfer in transfers:
+            transfer.save()
+    LedgerEntry.objects.bulk_create(
+        [entry for transfer, from_balance, to_balance in settled
+         for entry in ledger.transfer_entries(transfer, from_balance, to_balance)],
+        batch_size=1000)
+    for account_id, delta in deltas.items():
+        if delta:
+            Account.objects.filter(id=account_id).update(balance=F('balance') + delta)
+    account_cache.invalidate(*deltas)
+    if transfers:
+        tasks.enqueue(AUDIT_TRANSFERS, transfers=[audit_row(transfer) for transfer in transfers])
+    return results
@@ -0,0 +1,16 @@
+"""Background tasks, registered when the app is loaded. Queue them with app.services.tasks.enqueue."""
+import logging
+
+from app.services.tasks import task
+
+audit_logger = logging.getLogger('app.audit')
+
+AUDIT_TRANSFERS = 'audit.transfers'
+
+
+@task(name=AUDIT_TRANSFERS)
+def audit_transfers(transfers):
+    """Write settled transfers to the audit log. `transfers` are [id, from, to, amount in minor units] rows."""
+    for transfer_id, transfer_from_id, transfer_to_id, amount in transfers:
+        audit_logger.info('Transfer %s: account %s -> account %s, amount %s', transfer_id, transfer_from_id,
+                          transfer_to_id, amount)
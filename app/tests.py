@@ -1,20 +1,98 @@
-from django.test import TestCase
+from io import BytesIO, StringIO
+import asyncio
+import csv
+import gzip
+import os
+import tempfile
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.contrib.auth.models import User
+from django.db import OperationalError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from app.models import (Customer, Account, Transfer, Deposit, Withdraw)
-from app.api.serializers import (AccountSerializer, CustomerSerializer, TransferSerializer)
+import itertools
+import random
+import re
+import threading
+import time
+from datetime import timedelta
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+from app.models import (Customer, Account, Transfer, Deposit, Withdraw, LedgerEntry, BalanceSnapshot,
+                        IdempotencyKey, Task, ArchivedDeposit, ArchivedTransfer, TransferHistory, ProjectedBalance,
+                        ProjectorCheckpoint)
+from app.api.serializers import (AccountSerializer, AccountValuesSerializer, CustomerSerializer, TransferSerializer,
+                                 TransferValuesSerializer)
+from app.api.parsers import FastJSONParser
+from app.api.renderers import FastJSONRenderer
+from app.api.filters import AccountFilter, TransferFilter
+from app.api import fastjson, replicas
+from app.api.async_views import AsyncAccountDetailView, json_response
+from app.api.views import AccountDetailAPIView
+from app.api.pagination import ProcessingDateCursorPagination
+from app.db import routers, statement_timeout
+from app.db.pool import ConnectionPool, PoolTimeout
+from rest_framework.exceptions import ParseError
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from app.services import (account_cache, admission, balances, idempotency, imports, metrics, projection, ratelimit,
+                          reconcile, search, tasks)
+from app.tasks import AUDIT_TRANSFERS
+from benchmarks import dataset, report, workload
+from app.services import transfers as transfers_service
+from app.services.exceptions import InvalidAmount
+from app.services.transfers import (InsufficientBalance, contention_metrics, execute_transfer, execute_transfer_batch)
 import json
 
+# Every test is the same client, sending far more requests a second than the default rates let
+# a real one; and the token buckets outlive a test in the cache. ThrottleTests turns them back on.
+DEFAULT_THROTTLING = dict(REST_FRAMEWORK=settings.REST_FRAMEWORK)
+THROTTLES_OFF = override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK,
+                                                      DEFAULT_THROTTLE_RATES={'read': None, 'write': None}))
+
+
+def setUpModule():
+    THROTTLES_OFF.enable()
+
+
+def tearDownModule():
+    THROTTLES_OFF.disable()
+
+
+class QueryCountAssertionsMixin:
+
+    def assertConstantQueryCount(self, fetch, grow, rounds=3):
+        """Call `fetch` between calls to `grow` and fail if the number of queries changes with the row count."""
+        counts = []
+        for _ in range(rounds):
+            with CaptureQueriesContext(connection) as context:
+                response = fetch()
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(context.captured_queries))
+            grow()
+        self.assertEqual(len(set(counts)), 1, f'Query count grows with the result size: {counts}')
+
 
 class AccountTests(TestCase):
     print("test account apis and urls")
 
     def setUp(self):
+        cache.clear()
         self.customer = Customer.objects.create(name="Emily Rodriguez",
                                                 address="Example Address 3",
                                                 identification_number="12345678903")
 
         self.account = Account.objects.create(customer=self.customer,
-                                              balance=250,
+                                              balance=25000,
                                               type='Deposit')
 
         self.valid_account_dict = json.dumps({
@@ -129,14 +207,14 @@ class TransfersTests(TestCase):
                                                 identification_number="12345678903")
 
         self.from_account = Account.objects.create(customer=self.customer,
-                                                   balance=250,
+                                                   balance=25000,
                                                    type='Deposit')
 
         self.to_account = Account.objects.create(customer=self.customer,
-                                                 balance=10,
+                                                 balance=1000,
                                                  type='Deposit')
 
-        self.transfer = Transfer.objects.create(amount=20,
+        self.transfer = Transfer.objects.create(amount=2000,
                                                 transfer_from=self.from_account,
                                                 transfer_to=self.to_account)
 
@@ -165,7 +243,39 @@ class TransfersTests(TestCase):
         response = self.client.get(url, self.filter_dict)
         serializer = TransferSerializer(self.transfer)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.data[0], serializer.data)
+        self.assertEqual(response.data["results"][0], serializer.data)
+
+    def test_list_transfers_cursor_pagination(self):
+        for amount in range(1, 5):
+            Transfer.objects.create(amount=amount,
+                                    transfer_from=self.from_account,
+                                    transfer_to=self.to_account)
+        url = reverse("transfer")
+        seen = []
+        response = self.client.get(url, {"page_size": 2})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            seen.extend(item["id"] for item in response.data["results"])
+            if response.data["next"] is None:
+                break
+            response = self.client.get(response.data["next"])
+        expected = list(Transfer.objects.order_by("-processing_date", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_list_transfers_invalid_cursor(self):
+        url = reverse("transfer")
+        response = self.client.get(url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_transfers_ndjson(self):
+        url = reverse("transfer")
+        response = self.client.get(url, {"format": "ndjson"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [self.transfer.id])
 
     def test_valid_transfer_amount_between_different_accounts(self):
         url = reverse("transfer")
@@ -177,6 +287,184 @@ class TransfersTests(TestCase):
         response = self.client.post(url, data=self.invalid_transfer_dict, content_type='application/json')
         self.assertEqual(response.status_code, 400)
 
+    def test_transfer_moves_balances(self):
+        url = reverse("transfer")
+        response = self.client.post(url, data=self.valid_transfer_dict, content_type='application/json')
+        self.from_account.refresh_from_db()
+        self.to_account.refresh_from_db()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.from_account.balance, 15000)
+        self.assertEqual(self.to_account.balance, 11000)
+
+
+class TransferServiceTests(TestCase):
+
+    def setUp(self):
+        contention_metrics.reset()
+        self.customer = Customer.objects.create(name="Emily Rodriguez",
+                                                address="Example Address 3",
+                                                identification_number="12345678903")
+        self.from_account = Account.objects.create(customer=self.customer, balance=10000, type='Deposit')
+        self.to_account = Account.objects.create(customer=self.customer, balance=0, type='Deposit')
+
+    def test_balance_is_checked_inside_the_lock(self):
+        stale = Account.objects.get(id=self.from_account.id)
+        Account.objects.filter(id=self.from_account.id).update(balance=1000)
+        self.assertEqual(stale.balance, 10000)
+        with self.assertRaises(InsufficientBalance):
+            execute_transfer(self.from_account.id, self.to_account.id, 5000)
+        self.assertFalse(Transfer.objects.exists())
+
+    def test_stale_validation_can_not_overdraw(self):
+        url = reverse("transfer")
+        data = json.dumps({"amount": 80, "transfer_from": self.from_account.id, "transfer_to": self.to_account.id})
+        self.assertEqual(self.client.post(url, data=data, content_type='application/json').status_code, 201)
+        self.assertEqual(self.client.post(url, data=data, content_type='application/json').status_code, 400)
+        self.from_account.refresh_from_db()
+        self.assertEqual(self.from_account.balance, 2000)
+
+    def test_non_positive_amounts_are_refused(self):
+        for amount in (0, -5000):
+            with self.subTest(amount=amount):
+                with self.assertRaises(InvalidAmount):
+                    execute_transfer(self.from_account.id, self.to_account.id, amount)
+                items = [{'transfer_from': self.from_account.id, 'transfer_to': self.to_account.id, 'amount': amount}]
+                [(transfer, error)] = execute_transfer_batch(items)
+                self.assertIsNone(transfer)
+                self.assertIsInstance(error, InvalidAmount)
+        self.to_account.refresh_from_db()
+        self.assertEqual(self.to_account.balance, 0)
+        self.assertFalse(Transfer.objects.exists())
+
+
+class TransferRetryTests(TransactionTestCase):
+
+    def setUp(self):
+        contention_metrics.reset()
+        self.customer = Customer.objects.create(name="Emily Rodriguez",
+                                                address="Example Address 3",
+                                                identification_number="12345678903")
+        self.from_account = Account.objects.create(customer=self.customer, balance=10000, type='Deposit')
+        self.to_account = Account.objects.create(customer=self.customer, balance=0, type='Deposit')
+
+    def test_retries_deadlocks_with_backoff(self):
+        class DeadlockDetected(Exception):
+            pgcode = '40P01'
+
+        deadlock = OperationalError('deadlock detected')
+        deadlock.__cause__ = DeadlockDetected()
+        transfer_locked = transfers_service._transfer_locked
+        attempts = []
+
+        def deadlock_once(*args):
+            attempts.append(args)
+            if len(attempts) == 1:
+                raise deadlock
+            return transfer_locked(*args)
+
+        with mock.patch('app.services.transfers.time.sleep') as sleep, \
+                mock.patch('app.services.transfers._transfer_locked', side_effect=deadlock_once):
+            execute_transfer(self.from_account.id, self.to_account.id, 3000)
+
+        self.from_account.refresh_from_db()
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(self.from_account.balance, 7000)
+        self.assertEqual(Transfer.objects.count(), 1)
+        metrics = contention_metrics.snapshot(self.from_account.id)
+        self.assertEqual(metrics['retries'], 1)
+        self.assertEqual(metrics['transfers'], 1)
+
+    def test_requests_with_an_idempotency_key_are_retried(self):
+        transfer_locked = transfers_service._transfer_locked
+        attempts = []
+
+        def locked_once(*args):
+            attempts.append(args)
+            if len(attempts) == 1:
+                raise OperationalError('database is locked')
+            return transfer_locked(*args)
+
+        with mock.patch('app.services.transfers.time.sleep'), \
+                mock.patch('app.services.transfers._transfer_locked', side_effect=locked_once):
+            response = self.client.post(reverse("transfer"), content_type='application/json',
+                                        data=json.dumps({"amount": 30, "transfer_from": self.from_account.id,
+                                                         "transfer_to": self.to_account.id}),
+                                        HTTP_IDEMPOTENCY_KEY="key")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(Transfer.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get(key="key").status_code, 201)
+
+    def test_gives_up_on_other_errors(self):
+        with mock.patch('app.services.transfers._transfer_locked', side_effect=OperationalError('disk I/O error')):
+            with self.assertRaises(OperationalError):
+                execute_transfer(self.from_account.id, self.to_account.id, 3000)
+        self.assertEqual(contention_metrics.snapshot(self.from_account.id)['retries'], 0)
+
+
+class TransferBatchTests(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Emily Rodriguez",
+                                                address="Example Address 3",
+                                                identification_number="12345678903")
+        self.payroll = Account.objects.create(customer=self.customer, balance=100000, type='Deposit')
+        self.employees = [Account.objects.create(customer=self.customer, balance=0, type='Deposit')
+                          for _ in range(3)]
+        self.url = reverse("transfer-batch")
+
+    def payroll_items(self, amount=100):
+        return [{"amount": amount, "transfer_from": self.payroll.id, "transfer_to": employee.id}
+                for employee in self.employees]
+
+    def test_batch_settles_with_one_update_per_account(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, data=json.dumps(self.payroll_items()),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result["status"] for result in response.data["results"]], ["created"] * 3)
+        self.payroll.refresh_from_db()
+        self.assertEqual(self.payroll.balance, 70000)
+        self.assertEqual(Account.objects.get(id=self.employees[0].id).balance, 10000)
+        self.assertEqual(Transfer.objects.count(), 3)
+        updates = [query for query in context.captured_queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 4)
+
+    def test_atomic_batch_writes_nothing_when_an_item_fails(self):
+        items = self.payroll_items(400)
+        response = self.client.post(self.url, data=json.dumps(items), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result["index"] for result in response.data["results"]], [2])
+        self.assertFalse(Transfer.objects.exists())
+        self.payroll.refresh_from_db()
+        self.assertEqual(self.payroll.balance, 100000)
+
+    def test_partial_batch_reports_each_item(self):
+        items = self.payroll_items(400) + [{"amount": 5, "transfer_from": self.payroll.id,
+                                             "transfer_to": self.payroll.id}]
+        response = self.client.post(self.url + "?mode=partial", data=json.dumps(items),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result["status"] for result in response.data["results"]],
+                         ["created", "created", "rejected", "rejected"])
+        self.payroll.refresh_from_db()
+        self.assertEqual(self.payroll.balance, 20000)
+
+    def test_netted_amounts_cannot_overflow_a_balance(self):
+        Account.objects.filter(id=self.employees[0].id).update(balance=2 ** 63 - 1 - 100)
+        items = [{"amount": 1, "transfer_from": self.payroll.id, "transfer_to": self.employees[0].id}] * 2
+        response = self.client.post(self.url, data=json.dumps(items), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result["index"] for result in response.data["results"]], [1])
+        self.assertFalse(Transfer.objects.exists())
+
+    def test_ndjson_batch(self):
+        body = "\n".join(json.dumps(item) for item in self.payroll_items())
+        response = self.client.post(self.url, data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Transfer.objects.count(), 3)
+
 
 class DepositTests(TestCase):
     print("test customer apis and urls")
@@ -187,10 +475,10 @@ class DepositTests(TestCase):
                                                 identification_number="12345678903")
 
         self.active_account = Account.objects.create(customer=self.customer,
-                                                     balance=250,
+                                                     balance=25000,
                                                      type='Deposit')
         self.inactive_account = Account.objects.create(customer=self.customer,
-                                                       balance=250,
+                                                       balance=25000,
                                                        type='Deposit',
                                                        is_active=False)
 
@@ -213,6 +501,39 @@ class DepositTests(TestCase):
         response = self.client.post(url, data=self.invalid_deposit_dict, content_type='application/json')
         self.assertEqual(response.status_code, 400)
 
+    def test_deposit_updates_balance_in_one_statement(self):
+        url = reverse("deposit")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, data=self.valid_deposit_dict, content_type='application/json')
+        self.active_account.refresh_from_db()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["balance"], 300)
+        self.assertEqual(self.active_account.balance, 30000)
+        self.assertEqual(Deposit.objects.get(id=response.data["id"]).amount, 5000)
+        updates = [query for query in context.captured_queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn("SELECT", " ".join(query["sql"] for query in context.captured_queries
+                                             if "SAVEPOINT" not in query["sql"]))
+
+    def test_deposit_to_unknown_account(self):
+        url = reverse("deposit")
+        response = self.client.post(url, data=json.dumps({"amount": 50, "account": 0}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("account", response.data["error"]["details"])
+
+    def test_non_positive_deposits_are_refused(self):
+        url = reverse("deposit")
+        response = self.client.post(url, data=json.dumps({"amount": -500, "account": self.active_account.id}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        for amount in (0, -50000):
+            with self.subTest(amount=amount), self.assertRaises(InvalidAmount):
+                balances.deposit(self.active_account.id, amount)
+        self.active_account.refresh_from_db()
+        self.assertEqual(self.active_account.balance, 25000)
+        self.assertFalse(Deposit.objects.exists())
+
 
 class WithdrawTests(TestCase):
     print("test customer apis and urls")
@@ -223,7 +544,7 @@ class WithdrawTests(TestCase):
                                                 identification_number="12345678903")
 
         self.account = Account.objects.create(customer=self.customer,
-                                              balance=250,
+                                              balance=25000,
                                               type='Deposit')
 
         self.valid_withdraw_dict = json.dumps({
@@ -244,3 +565,1463 @@ class WithdrawTests(TestCase):
         url = reverse("withdraw")
         response = self.client.post(url, data=self.invalid_withdraw_dict, content_type='application/json')
         self.assertEqual(response.status_code, 400)
+
+    def test_withdraw_updates_balance(self):
+        url = reverse("withdraw")
+        response = self.client.post(url, data=self.valid_withdraw_dict, content_type='application/json')
+        self.account.refresh_from_db()
+        self.assertEqual(response.data["balance"], 200)
+        self.assertEqual(self.account.balance, 20000)
+
+    def test_refused_withdraw_leaves_balance(self):
+        url = reverse("withdraw")
+        self.client.post(url, data=self.invalid_withdraw_dict, content_type='application/json')
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 25000)
+        self.assertFalse(Withdraw.objects.exists())
+
+    def test_negative_withdraw_does_not_credit_the_account(self):
+        url = reverse("withdraw")
+        response = self.client.post(url, data=json.dumps({"amount": -500, "account": self.account.id}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        for amount in (0, -50000):
+            with self.subTest(amount=amount), self.assertRaises(InvalidAmount):
+                balances.withdraw(self.account.id, amount)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 25000)
+        self.assertFalse(Withdraw.objects.exists())
+
+
+class MoneyTests(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Test", address="Test", identification_number="12345678901")
+        self.account = Account.objects.create(customer=self.customer, balance=25000, type='Deposit')
+        self.euro_account = Account.objects.create(customer=self.customer, balance=0, type='Deposit', currency='EUR')
+
+    def post(self, name, data):
+        return self.client.post(reverse(name), data=json.dumps(data), content_type='application/json')
+
+    def test_amounts_are_exact_minor_units(self):
+        for _ in range(10):
+            self.assertEqual(self.post("deposit", {"amount": 0.1, "account": self.account.id}).status_code, 201)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 25100)
+        response = self.post("withdraw", {"amount": "0.29", "account": self.account.id})
+        self.assertEqual(response.data["amount"], 0.29)
+        self.assertEqual(response.data["balance"], 250.71)
+
+    def test_sub_minor_unit_amounts_are_rejected(self):
+        response = self.post("deposit", {"amount": 1.005, "account": self.account.id})
+        self.assertEqual(response.status_code, 400)
+        response = self.post("deposit", {"amount": "ten", "account": self.account.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Deposit.objects.exists())
+
+    def test_amounts_beyond_the_column_are_rejected(self):
+        for amount in (1e17, 1e20, "-1e17", 10 ** 13 + 0.01):
+            with self.subTest(amount=amount):
+                response = self.post("deposit", {"amount": amount, "account": self.account.id})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("amount", response.json()["error"]["details"])
+        self.assertFalse(Deposit.objects.exists())
+        self.assertEqual(self.post("deposit", {"amount": 10 ** 13, "account": self.account.id}).status_code, 201)
+
+    def test_amounts_to_move_must_be_positive(self):
+        other = Account.objects.create(customer=self.customer, balance=0, type='Deposit')
+        for amount in (0, -50, "-0.01"):
+            for name, data in (("deposit", {"account": self.account.id}), ("withdraw", {"account": self.account.id}),
+                               ("transfer", {"transfer_from": self.account.id, "transfer_to": other.id})):
+                with self.subTest(name=name, amount=amount):
+                    response = self.post(name, dict(data, amount=amount))
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn("amount", response.json()["error"]["details"])
+            batch = [{"amount": amount, "transfer_from": self.account.id, "transfer_to": other.id}]
+            self.assertEqual(self.post("transfer-batch", batch).status_code, 400)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 25000)
+        self.assertFalse(Deposit.objects.exists() or Withdraw.objects.exists() or Transfer.objects.exists())
+
+    def test_transfers_between_currencies_are_refused(self):
+        response = self.post("transfer", {"amount": 10, "transfer_from": self.account.id,
+                                          "transfer_to": self.euro_account.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Transfer.objects.exists())
+
+    def test_amount_filter_takes_major_units(self):
+        transfer = Transfer.objects.create(amount=1050, transfer_from=self.account, transfer_to=self.account)
+        url = reverse("transfer")
+        self.assertEqual([item["id"] for item in self.client.get(url, {"amount": "10.5"}).data["results"]],
+                         [transfer.id])
+        self.assertEqual(self.client.get(url, {"amount": "10.505"}).data["results"], [])
+        self.assertEqual(len(self.client.get(url, {"amount__gte": "10.501"}).data["results"]), 0)
+        self.assertEqual(len(self.client.get(url, {"amount__lte": "10.501"}).data["results"]), 1)
+
+
+class QueryCountTests(QueryCountAssertionsMixin, TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Emily Rodriguez",
+                                                address="Example Address 3",
+                                                identification_number="12345678903")
+        self.from_account = Account.objects.create(customer=self.customer, balance=25000, type='Deposit')
+        self.to_account = Account.objects.create(customer=self.customer, balance=1000, type='Deposit')
+
+    def add_transfers(self, count=5):
+        for _ in range(count):
+            Transfer.objects.create(amount=100, transfer_from=self.from_account, transfer_to=self.to_account)
+
+    def add_accounts(self, count=5):
+        for _ in range(count):
+            Account.objects.create(customer=self.customer, balance=10000, type='Deposit')
+
+    def test_transfer_list_query_count(self):
+        self.add_transfers(1)
+        self.assertConstantQueryCount(lambda: self.client.get(reverse("transfer"), {"page_size": 1000}),
+                                      self.add_transfers)
+
+    def test_account_transfers_query_count(self):
+        url = reverse("detail-account-transfer", kwargs={'id': self.from_account.id})
+        self.assertConstantQueryCount(lambda: self.client.get(url), self.add_transfers)
+
+    def test_account_list_query_count(self):
+        self.assertConstantQueryCount(lambda: self.client.get(reverse("list-account")), self.add_accounts)
+
+    def test_admin_changelist_query_count(self):
+        User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.login(username="admin", password="password")
+        for model in ("account", "transfer", "deposit", "withdraw"):
+            url = reverse(f"admin:app_{model}_changelist")
+            self.assertConstantQueryCount(lambda: self.client.get(url), self.add_movements)
+
+    def add_movements(self):
+        self.add_transfers(2)
+        self.add_accounts(2)
+        Deposit.objects.create(amount=500, account=self.from_account)
+        Withdraw.objects.create(amount=500, account=self.from_account)
+
+
+class LedgerTests(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Emily Rodriguez",
+                                                address="Example Address 3",
+                                                identification_number="12345678903")
+        response = self.client.post(reverse("create-account"), content_type='application/json',
+                                    data=json.dumps({"customer": self.customer.id, "type": "Deposit", "balance": 200}))
+        self.account = Account.objects.get(id=response.data["id"])
+        self.other = Account.objects.create(customer=self.customer, balance=0, type='Deposit')
+
+    def post(self, name, data):
+        return self.client.post(reverse(name), data=json.dumps(data), content_type='application/json')
+
+    def test_every_movement_appends_a_running_balance(self):
+        self.post("deposit", {"amount": 50, "account": self.account.id})
+        self.post("withdraw", {"amount": 20, "account": self.account.id})
+        self.post("transfer", {"amount": 30, "transfer_from": self.account.id, "transfer_to": self.other.id})
+        self.post("transfer-batch", [{"amount": 100, "transfer_from": self.account.id, "transfer_to": self.other.id}])
+
+        entries = LedgerEntry.objects.filter(account=self.account).order_by("id")
+        self.assertEqual([entry.kind for entry in entries],
+                         ["deposit", "deposit", "withdraw", "transfer_out", "transfer_out"])
+        self.assertEqual([entry.balance for entry in entries], [20000, 25000, 23000, 20000, 10000])
+        self.account.refresh_from_db()
+        self.assertEqual(entries.last().balance, self.account.balance)
+        self.assertEqual(LedgerEntry.objects.get(account=self.other, amount=10000).balance, 13000)
+
+    def test_ledger_endpoint_and_balance_at(self):
+        before_deposit = timezone.now()
+        self.post("deposit", {"amount": 50, "account": self.account.id})
+        response = self.client.get(reverse("detail-account-ledger", kwargs={'id': self.account.id}))
+        self.assertEqual([entry["balance"] for entry in response.data["results"]], [250, 200])
+
+        url = reverse("detail-account-balance", kwargs={'id': self.account.id})
+        self.assertEqual(self.client.get(url).data["balance"], 250)
+        self.assertEqual(self.client.get(url, {"at": before_deposit.isoformat()}).data["balance"], 200)
+
+    def test_backfill_and_snapshot_commands(self):
+        Deposit.objects.create(amount=5000, account=self.other)
+        Transfer.objects.create(amount=2000, transfer_from=self.account, transfer_to=self.other)
+        Account.objects.filter(id=self.other.id).update(balance=7000)
+        Account.objects.filter(id=self.account.id).update(balance=18000)
+        LedgerEntry.objects.all().delete()
+
+        call_command("backfill_ledger", chunk_size=1, stdout=StringIO())
+        self.assertEqual(list(LedgerEntry.objects.filter(account=self.other).order_by("id")
+                              .values_list("kind", "balance")), [("deposit", 5000), ("transfer_in", 7000)])
+        self.assertEqual(list(LedgerEntry.objects.filter(account=self.account).order_by("id")
+                              .values_list("kind", "balance")), [("deposit", 20000), ("transfer_out", 18000)])
+
+        call_command("backfill_ledger", stdout=StringIO())
+        self.assertEqual(LedgerEntry.objects.count(), 4)
+
+        taken_at = timezone.now() + timedelta(seconds=1)
+        call_command("snapshot_balances", at=taken_at.isoformat(), stdout=StringIO())
+        self.assertEqual(BalanceSnapshot.objects.get(account=self.other, taken_at=taken_at).balance, 7000)
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN every filter combination of the list endpoints and fail on full table scans."""
+
+    transfer_params = {
+        'transfer_from__id': 1,
+        'transfer_to__id': 2,
+        'processing_date__gte': '2023-01-01T00:00:00Z',
+        'processing_date__lte': '2024-01-01T00:00:00Z',
+        'amount__gte': 5,
+        'amount__lte': 50,
+        'amount': 10,
+    }
+    account_params = {
+        'open_date__gte': '2023-01-01T00:00:00Z',
+        'open_date__lte': '2024-01-01T00:00:00Z',
+        'type': 'Deposit',
+        'customer__id': 1,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        Customer.objects.bulk_create(
+            Customer(name=f"Customer {i}", address="Example Address", identification_number=f"{i:011d}")
+            for i in range(20))
+        customers = list(Customer.objects.all())
+        Account.objects.bulk_create(
+            Account(customer=customers[i % 20], balance=100000, type=('Deposit', 'Checking')[i % 2],
+                    open_date=now - timedelta(days=i))
+            for i in range(100))
+        accounts = list(Account.objects.values_list('id', flat=True))
+        Transfer.objects.bulk_create(
+            Transfer(amount=(i % 100) * 100, transfer_from_id=accounts[i % 100],
+                     transfer_to_id=accounts[(i * 7 + 1) % 100], processing_date=now - timedelta(minutes=i))
+            for i in range(2000))
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # On a small table the planner rightly prefers a sequential scan; make it show which index it
+            # would use instead, and keep only scans that have no index to fall back on.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertNoFullScan(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan)
+        else:
+            full_scans = [line for line in plan.splitlines() if re.search(r'\bSCAN (TABLE )?\w+$', line.strip())]
+            self.assertFalse(full_scans, plan)
+
+    def combinations(self, params):
+        for size in range(1, len(params) + 1):
+            for names in itertools.combinations(params, size):
+                yield {name: params[name] for name in names}
+
+    def test_transfer_filters(self):
+        paginator = ProcessingDateCursorPagination()
+        for params in self.combinations(self.transfer_params):
+            with self.subTest(params=params):
+                transfers = TransferFilter(params, queryset=Transfer.objects.all()).qs
+                self.assertNoFullScan(paginator.order_queryset(transfers)[:paginator.page_size + 1])
+
+    def test_transfer_history_pages(self):
+        paginator = ProcessingDateCursorPagination()
+        cursor = paginator.encode_cursor(Transfer.objects.order_by('-processing_date', '-id')[50])
+        request = Request(APIRequestFactory().get(reverse("transfer"), {"cursor": cursor}))
+        for params in ({}, {'transfer_from__id': 1}, {'transfer_to__id': 2}):
+            with self.subTest(params=params):
+                transfers = TransferFilter(params, queryset=Transfer.objects.all()).qs
+                self.assertNoFullScan(paginator.filter_after_cursor(transfers, request)[:paginator.page_size + 1])
+
+    def test_account_filters(self):
+        for params in self.combinations(self.account_params):
+            with self.subTest(params=params):
+                self.assertNoFullScan(AccountFilter(params, queryset=Account.objects.all()).qs)
+
+    def test_account_transfers_union(self):
+        # The same union AccountTransfersAPIView sends: both arms over every history tier.
+        account = Account.objects.first()
+        sent = TransferSerializer.setup_eager_loading(Transfer.objects.filter(transfer_from=account).all_tiers())
+        received = TransferSerializer.setup_eager_loading(Transfer.objects.filter(transfer_to=account).all_tiers())
+        self.assertNoFullScan(sent.union(received, all=True).order_by('-processing_date', '-id'))
+
+
+class AccountCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name="Emily Rodriguez",
+                                                address="Example Address 3",
+                                                identification_number="12345678903")
+        self.account = Account.objects.create(customer=self.customer, balance=25000, type='Deposit')
+        self.other = Account.objects.create(customer=self.customer, balance=0, type='Deposit')
+        self.url = reverse("detail-account", kwargs={'id': self.account.id})
+
+    def test_repeated_reads_skip_the_database(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first["ETag"], second["ETag"])
+
+    def test_if_none_match_returns_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_unknown_account(self):
+        response = self.client.get(reverse("detail-account", kwargs={'id': 0}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_writers_invalidate_on_commit(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("deposit"), content_type='application/json',
+                             data=json.dumps({"amount": 50, "account": self.account.id}))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["balance"], 300)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("transfer"), content_type='application/json',
+                             data=json.dumps({"amount": 100, "transfer_from": self.account.id,
+                                              "transfer_to": self.other.id}))
+        self.assertEqual(self.client.get(self.url).data["balance"], 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(self.url)
+        self.assertFalse(self.client.get(self.url).data["is_active"])
+
+    def test_entry_filled_before_a_write_is_not_served(self):
+        stale = account_cache.fill(self.account.id, lambda: {"balance": 250})
+        self.assertEqual(account_cache.get(self.account.id), stale)
+        with self.captureOnCommitCallbacks(execute=True):
+            account_cache.invalidate(self.account.id)
+        cache.set(f"account:{self.account.id}:payload", stale)
+        self.assertIsNone(account_cache.get(self.account.id))
+
+
+@override_settings(ASYNC_READ_WORKERS=0, ASYNC_WRITE_WORKERS=0)
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name="Emily Rodriguez",
+                                                address="Example Address 3",
+                                                identification_number="12345678903")
+        self.account = Account.objects.create(customer=self.customer, balance=25000, type='Deposit')
+        self.other = Account.objects.create(customer=self.customer, balance=0, type='Deposit')
+
+    def post(self, name, data):
+        return self.client.post(reverse(name), data=json.dumps(data), content_type='application/json')
+
+    def test_options_lists_the_allowed_methods(self):
+        response = self.client.options(reverse("async-detail-account", kwargs={'id': self.account.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Allow"], "GET, HEAD, OPTIONS")
+        response = self.client.options(reverse("async-deposit"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("POST", response["Allow"])
+        self.assertEqual(self.client.put(reverse("async-deposit")).status_code, 405)
+
+    def test_reads_match_the_sync_views(self):
+        Transfer.objects.create(amount=2000, transfer_from=self.account, transfer_to=self.other)
+        for sync_name, async_name, kwargs in (("detail-account", "async-detail-account", {'id': self.account.id}),
+                                              ("list-account", "async-list-account", {}),
+                                              ("transfer", "async-transfer", {})):
+            with self.subTest(view=async_name):
+                expected = self.client.get(reverse(sync_name, kwargs=kwargs)).json()
+                response = self.client.get(reverse(async_name, kwargs=kwargs))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), expected)
+
+    def test_detail_not_modified_and_not_found(self):
+        url = reverse("async-detail-account", kwargs={'id': self.account.id})
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get(reverse("async-detail-account", kwargs={'id': 0}))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["error"]["status_code"], 404)
+
+    def test_writes(self):
+        response = self.post("async-deposit", {"amount": 50, "account": self.account.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["balance"], 300)
+        response = self.post("async-withdraw", {"amount": 500, "account": self.account.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"]["details"]["non_field_errors"], ["Insufficent Balance"])
+        response = self.post("async-transfer", {"amount": 100, "transfer_from": self.account.id,
+                                                "transfer_to": self.other.id})
+        self.assertEqual(response.status_code, 201)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.balance, 10000)
+
+
+@override_settings(ASYNC_READ_WORKERS=2, ASYNC_WRITE_WORKERS=2)
+class AsyncPoolTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        customer = Customer.objects.create(name="Emily Rodriguez",
+                                           address="Example Address 3",
+                                           identification_number="12345678903")
+        self.account = Account.objects.create(customer=customer, balance=25000, type='Deposit')
+
+    def test_write_runs_on_the_pool(self):
+        response = self.client.post(reverse("async-deposit"), content_type='application/json',
+                                    data=json.dumps({"amount": 50, "account": self.account.id}))
+        self.assertEqual(response.status_code, 201)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 30000)
+
+    def test_reads_run_on_the_pool(self):
+        threads = []
+        load = AccountDetailAPIView.load
+
+        def record_thread(id):
+            threads.append(threading.current_thread().name)
+            return load(id)
+
+        with mock.patch.object(AccountDetailAPIView, "load", staticmethod(record_thread)):
+            response = self.client.get(reverse("async-detail-account", kwargs={'id': self.account.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["balance"], 250)
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith("async-read"), threads)
+
+
+class BenchmarkHarnessTests(TestCase):
+
+    def test_dataset_and_every_operation(self):
+        account_ids = dataset.generate(customers=3, accounts_per_customer=2, transfers=50, batch_size=20)
+        self.assertEqual(len(account_ids), 6)
+        self.assertEqual(Transfer.objects.count(), 50)
+        customer_ids = list(Customer.objects.values_list('id', flat=True))
+        factory = workload.RequestFactory(account_ids, customer_ids, random.Random(0))
+        for operation in workload.OPERATIONS:
+            with self.subTest(operation=operation):
+                method, path, data = factory.build(operation)
+                response = workload._call(self.client, method, path, data)
+                self.assertLess(response.status_code, 300, response.content)
+
+    def test_summary_and_baseline_comparison(self):
+        samples = [workload.Sample('GET detail-account', seconds / 1000, 1, 200) for seconds in range(1, 101)]
+        summary = report.summarize(samples, elapsed=2)
+        row = summary['GET detail-account']
+        self.assertEqual((row['requests'], row['p50_ms'], row['p99_ms'], row['throughput_rps']), (100, 50.5, 99.01, 50))
+        self.assertEqual(report.compare(summary, summary), [])
+
+        slower = report.summarize([sample._replace(seconds=sample.seconds * 2, queries=2) for sample in samples], 4)
+        regressions = report.compare(slower, summary)
+        self.assertTrue(any('p95_ms' in regression for regression in regressions))
+        self.assertTrue(any('queries_per_request' in regression for regression in regressions))
+        self.assertTrue(any('throughput_rps' in regression for regression in regressions))
+
+
+@override_settings(ASYNC_WRITE_WORKERS=0)
+class IdempotencyTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name="Test", address="Test", identification_number="12345678901")
+        self.account = Account.objects.create(customer=self.customer, balance=25000, type='Deposit')
+        self.other = Account.objects.create(customer=self.customer, balance=0, type='Deposit')
+
+    def post(self, name, data, key):
+        return self.client.post(reverse(name), data=json.dumps(data), content_type='application/json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_repeats_replay_the_first_response(self):
+        for name in ("deposit", "async-deposit"):
+            with self.subTest(view=name):
+                first = self.post(name, {"amount": 50, "account": self.account.id}, f"key-{name}")
+                with CaptureQueriesContext(connection) as context:
+                    repeat = self.post(name, {"account": self.account.id, "amount": 50}, f"key-{name}")
+                self.assertEqual(repeat.status_code, 201)
+                self.assertEqual(repeat.json(), first.json())
+                self.assertEqual(repeat["Idempotent-Replayed"], "true")
+                self.assertFalse(first.has_header("Idempotent-Replayed"))
+                self.assertFalse(any("app_deposit" in query["sql"] for query in context.captured_queries))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 35000)
+        self.assertEqual(Deposit.objects.count(), 2)
+
+    def test_scopes_and_keys_are_independent(self):
+        transfer = {"amount": 10, "transfer_from": self.account.id, "transfer_to": self.other.id}
+        self.assertEqual(self.post("transfer", transfer, "a").status_code, 201)
+        self.assertEqual(self.post("transfer", transfer, "b").status_code, 201)
+        self.assertEqual(self.post("transfer-batch", [transfer], "a").status_code, 201)
+        account = {"customer": self.customer.id, "type": "Deposit", "balance": 100}
+        self.assertEqual(self.post("create-account", account, "a").status_code, 201)
+        self.assertEqual(Transfer.objects.count(), 3)
+
+    def test_key_reused_with_another_body(self):
+        self.post("withdraw", {"amount": 50, "account": self.account.id}, "key")
+        response = self.post("withdraw", {"amount": 60, "account": self.account.id}, "key")
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Withdraw.objects.count(), 1)
+
+    def test_failed_requests_release_the_key(self):
+        response = self.post("withdraw", {"amount": 500, "account": self.account.id}, "key")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.post("deposit", {"amount": 500, "account": self.account.id}, "other-key")
+        response = self.post("withdraw", {"amount": 500, "account": self.account.id}, "key")
+        self.assertEqual(response.status_code, 201)
+
+    @override_settings(IDEMPOTENCY_WAIT=0)
+    def test_duplicate_of_a_running_request_waits_then_conflicts(self):
+        now = timezone.now()
+        data = {"amount": 50, "account": self.account.id}
+        claim = IdempotencyKey.objects.create(key="key", scope="deposit", fingerprint=idempotency.fingerprint(data),
+                                              created_at=now, expires_at=now + timedelta(minutes=1))
+        self.assertEqual(self.post("deposit", data, "key").status_code, 409)
+        self.assertFalse(Deposit.objects.exists())
+
+        # A claim whose request died is taken over once it expires.
+        IdempotencyKey.objects.filter(id=claim.id).update(expires_at=now - timedelta(seconds=1))
+        self.assertEqual(self.post("deposit", data, "key").status_code, 201)
+        self.assertEqual(Deposit.objects.count(), 1)
+
+    def test_request_that_lost_its_claim_rolls_back(self):
+        data = {"amount": 50, "account": self.account.id}
+
+        def work():
+            balances.deposit(self.account.id, 5000)
+            # The claim outlived IDEMPOTENCY_LOCK_TIMEOUT and a duplicate took the key over.
+            IdempotencyKey.objects.filter(key="key", scope="deposit").delete()
+            now = timezone.now()
+            IdempotencyKey.objects.create(key="key", scope="deposit", fingerprint=idempotency.fingerprint(data),
+                                          created_at=now + timedelta(seconds=1), expires_at=now + timedelta(minutes=1))
+            return 201, {}
+
+        with self.assertRaises(idempotency.RequestInProgress):
+            idempotency.run("key", "deposit", data, work)
+        self.assertFalse(Deposit.objects.exists())
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 25000)
+
+    def test_purge_deletes_expired_keys(self):
+        self.post("deposit", {"amount": 50, "account": self.account.id}, "key")
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.post("deposit", {"amount": 50, "account": self.account.id}, "fresh")
+        call_command("purge_idempotency_keys", stdout=StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["fresh"])
+
+
+class AnalyticsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name="Test", address="Test", identification_number="12345678901")
+        self.other_customer = Customer.objects.create(name="Other", address="Test",
+                                                      identification_number="12345678902")
+        self.account = Account.objects.create(customer=self.customer, balance=100000, type='Deposit')
+        self.savings = Account.objects.create(customer=self.customer, balance=5050, type='Savings')
+        self.euro = Account.objects.create(customer=self.customer, balance=700, type='Deposit', currency='EUR')
+        self.other = Account.objects.create(customer=self.other_customer, balance=0, type='Deposit')
+        self.day = timezone.now().replace(year=2024, month=3, day=15, hour=12)
+        for amount, target, days in ((1000, self.other, 0), (2000, self.other, 1), (550, self.savings, 40)):
+            Transfer.objects.create(amount=amount, transfer_from=self.account, transfer_to=target,
+                                    processing_date=self.day + timedelta(days=days))
+        Transfer.objects.create(amount=300, transfer_from=self.other, transfer_to=self.account,
+                                processing_date=self.day)
+        Deposit.objects.create(amount=5000, account=self.account, processing_date=self.day)
+        Withdraw.objects.create(amount=125, account=self.account, processing_date=self.day + timedelta(days=40))
+
+    def test_account_flows(self):
+        url = reverse("detail-account-flows", kwargs={'id': self.account.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["transfers_out"], {"count": 3, "total": 35.5})
+        self.assertEqual(response.data["transfers_in"], {"count": 1, "total": 3.0})
+        self.assertEqual((response.data["inflow"], response.data["outflow"], response.data["net"]),
+                         (53.0, 36.75, 16.25))
+
+        response = self.client.get(url, {"processing_date__lte": (self.day + timedelta(days=2)).isoformat()})
+        self.assertEqual((response.data["inflow"], response.data["outflow"]), (53.0, 30.0))
+        self.assertEqual(self.client.get(reverse("detail-account-flows", kwargs={'id': 0})).status_code, 404)
+
+    def test_account_aggregates_are_cached_until_the_account_changes(self):
+        url = reverse("detail-account-flows", kwargs={'id': self.account.id})
+        first = self.client.get(url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).data, first.data)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("deposit"), data=json.dumps({"amount": 10, "account": self.account.id}),
+                             content_type='application/json')
+        self.assertEqual(self.client.get(url).data["deposits"], {"count": 2, "total": 60.0})
+
+    def test_transfer_volume_buckets(self):
+        url = reverse("transfer-volume")
+        response = self.client.get(url)
+        self.assertEqual(response.data, [{"period": "2024-03-15", "count": 2, "total": 13.0},
+                                         {"period": "2024-03-16", "count": 1, "total": 20.0},
+                                         {"period": "2024-04-24", "count": 1, "total": 5.5}])
+        response = self.client.get(url, {"interval": "month", "transfer_from__id": self.account.id})
+        self.assertEqual(response.data, [{"period": "2024-03", "count": 2, "total": 30.0},
+                                         {"period": "2024-04", "count": 1, "total": 5.5}])
+        self.assertEqual(self.client.get(url, {"interval": "year"}).status_code, 400)
+
+    def test_customer_balances_per_currency_and_pages(self):
+        url = reverse("customer-balances")
+        response = self.client.get(url, {"page_size": 1})
+        self.assertEqual(response.data["results"], [
+            {"customer": self.customer.id, "currency": "EUR", "accounts": 1, "balance": 7.0},
+            {"customer": self.customer.id, "currency": "TRY", "accounts": 2, "balance": 1050.5},
+        ])
+        response = self.client.get(response.data["next"])
+        self.assertEqual(response.data, {"next": None, "results": [
+            {"customer": self.other_customer.id, "currency": "TRY", "accounts": 1, "balance": 0.0}]})
+        response = self.client.get(url, {"type": "Savings"})
+        self.assertEqual([row["balance"] for row in response.data["results"]], [50.5])
+
+    def test_cached_pages_link_to_the_requesting_host(self):
+        url = reverse("customer-balances")
+        first = self.client.get(url, {"page_size": 1}, HTTP_HOST="internal:8000")
+        second = self.client.get(url, {"page_size": 1}, HTTP_HOST="api.example.com", secure=True)
+        self.assertEqual(first["ETag"], second["ETag"])
+        self.assertTrue(first.data["next"].startswith("http://internal:8000/"))
+        self.assertTrue(second.data["next"].startswith("https://api.example.com/"))
+
+    def test_top_counterparties(self):
+        url = reverse("detail-account-counterparties", kwargs={'id': self.account.id})
+        response = self.client.get(url)
+        self.assertEqual(response.data, [
+            {"account": self.other.id, "sent": 30.0, "sent_count": 2, "received": 3.0, "received_count": 1,
+             "total": 33.0},
+            {"account": self.savings.id, "sent": 5.5, "sent_count": 1, "received": 0.0, "received_count": 0,
+             "total": 5.5},
+        ])
+        self.assertEqual(len(self.client.get(url, {"limit": 1}).data), 1)
+        self.assertEqual(self.client.get(url, {"limit": 0}).status_code, 400)
+
+
+class StatementTests(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Test", address="Test", identification_number="12345678901")
+        self.account = Account.objects.create(customer=self.customer, balance=100000, type='Deposit')
+        self.other = Account.objects.create(customer=self.customer, balance=0, type='Deposit', currency='TRY')
+        day = timezone.now().replace(year=2024, month=3, day=15, hour=12, minute=0, second=0, microsecond=0)
+        self.day = day
+        self.sent = Transfer.objects.create(amount=1000, transfer_from=self.account, transfer_to=self.other,
+                                            processing_date=day + timedelta(hours=2))
+        self.received = Transfer.objects.create(amount=250, transfer_from=self.other, transfer_to=self.account,
+                                                processing_date=day + timedelta(days=20))
+        self.deposit = Deposit.objects.create(amount=5000, account=self.account, processing_date=day)
+        self.withdraw = Withdraw.objects.create(amount=125, account=self.account,
+                                                processing_date=day + timedelta(hours=1))
+
+    def test_csv_statement_merges_movements_in_date_order(self):
+        response = self.client.get(reverse("detail-account-statement", kwargs={'id': self.account.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ["processing_date", "kind", "reference", "amount", "currency", "counterparty"])
+        self.assertEqual([row[1:] for row in rows[1:]], [
+            ["deposit", str(self.deposit.id), "50.0", "TRY", ""],
+            ["withdraw", str(self.withdraw.id), "-1.25", "TRY", ""],
+            ["transfer_out", str(self.sent.id), "-10.0", "TRY", str(self.other.id)],
+            ["transfer_in", str(self.received.id), "2.5", "TRY", str(self.other.id)],
+        ])
+
+    def test_ndjson_statement_for_a_date_range(self):
+        url = reverse("detail-account-statement", kwargs={'id': self.account.id})
+        response = self.client.get(url, {"format": "ndjson",
+                                         "processing_date__gte": (self.day + timedelta(minutes=30)).isoformat(),
+                                         "processing_date__lte": (self.day + timedelta(days=1)).isoformat()})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(line["kind"], line["amount"]) for line in lines],
+                         [("withdraw", -1.25), ("transfer_out", -10.0)])
+        self.assertEqual(self.client.get(url, {"processing_date__gte": "soon"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("detail-account-statement", kwargs={'id': 0})).status_code, 404)
+
+    def test_export_command_writes_one_gzip_file_per_account(self):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command("export_statements", directory, month="2024-03", format="ndjson", stdout=StringIO())
+            self.assertEqual(sorted(os.listdir(directory)),
+                             [f"statement-2024-03-{self.account.id}.ndjson.gz",
+                              f"statement-2024-03-{self.other.id}.ndjson.gz"])
+            with gzip.open(os.path.join(directory, f"statement-2024-03-{self.account.id}.ndjson.gz")) as statement:
+                kinds = [json.loads(line)["kind"] for line in statement]
+        self.assertEqual(kinds, ["deposit", "withdraw", "transfer_out"])
+
+
+calls = []
+
+
+@tasks.task(name='tests.record', max_attempts=2)
+def record_call(value, fail=False):
+    if fail:
+        raise ValueError(value)
+    calls.append(value)
+
+
+class TaskTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_database_queue_commits_with_the_work(self):
+        with transaction.atomic():
+            tasks.enqueue('tests.record', value=1)
+        try:
+            with transaction.atomic():
+                tasks.enqueue('tests.record', value=2)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        call_command("run_tasks", once=True, stdout=StringIO())
+        self.assertEqual(calls, [1])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failing_tasks_are_retried_then_dead_lettered(self):
+        tasks.enqueue('tests.record', value=3, fail=True)
+        with self.assertLogs("app.services.tasks", "ERROR"):
+            self.assertEqual(tasks.run_once(), 1)
+        queued = Task.objects.get()
+        self.assertEqual((queued.status, queued.attempts), (Task.QUEUED, 1))
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIn("ValueError: 3", queued.last_error)
+        self.assertEqual(tasks.run_once(), 0)
+
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs("app.services.tasks", "ERROR"):
+            tasks.run_once()
+        self.assertEqual(Task.objects.get().status, Task.DEAD)
+        self.assertEqual(tasks.run_once(), 0)
+        self.assertEqual(tasks.retry_dead(), 1)
+        self.assertEqual((Task.objects.get().status, Task.objects.get().attempts), (Task.QUEUED, 0))
+
+    def test_tasks_of_a_dead_worker_are_claimed_again(self):
+        tasks.enqueue('tests.record', value=4)
+        self.assertEqual(len(tasks.claim(10)), 1)
+        self.assertEqual(tasks.claim(10), [])
+        Task.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        call_command("run_tasks", once=True, threads=2, stdout=StringIO())
+        self.assertEqual(calls, [4])
+
+    def test_transfers_queue_an_audit_task(self):
+        customer = Customer.objects.create(name="Test", address="Test", identification_number="12345678901")
+        account = Account.objects.create(customer=customer, balance=25000, type='Deposit')
+        other = Account.objects.create(customer=customer, balance=0, type='Deposit')
+        transfer = execute_transfer(account.id, other.id, 1000)
+        audit = Task.objects.get(name=AUDIT_TRANSFERS)
+        self.assertEqual(audit.payload, {"transfers": [[transfer.id, account.id, other.id, 1000]]})
+        with self.assertLogs("app.audit") as logs:
+            tasks.run_once()
+        self.assertIn(f"Transfer {transfer.id}: account {account.id} -> account {other.id}", logs.output[0])
+
+
+@override_settings(TASK_BACKEND='thread', TASK_RETRY_DELAY=0)
+class ThreadTaskBackendTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_tasks_run_on_the_pool_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tasks.enqueue('tests.record', value=5)
+            self.assertEqual(calls, [])
+        with self.captureOnCommitCallbacks(execute=False):
+            tasks.enqueue('tests.record', value=6)
+        tasks.get_thread_backend().join()
+        self.assertEqual(calls, [5])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failures_are_retried_then_dead_lettered(self):
+        backend = tasks.get_thread_backend()
+        backend.dead.clear()
+        with self.assertLogs("app.services.tasks", "ERROR") as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                tasks.enqueue('tests.record', value=7, fail=True)
+            backend.join()
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual([(name, payload) for name, payload, _ in backend.dead],
+                         [('tests.record', {'value': 7, 'fail': True})])
+
+
+class HistoryTierTests(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Test", address="Test", identification_number="12345678901")
+        self.account = Account.objects.create(customer=self.customer, balance=100000, type='Deposit')
+        self.other = Account.objects.create(customer=self.customer, balance=0, type='Deposit')
+        now = timezone.now()
+        self.old = Transfer.objects.create(amount=1000, transfer_from=self.account, transfer_to=self.other,
+                                           processing_date=now - timedelta(days=400))
+        self.recent = Transfer.objects.create(amount=2000, transfer_from=self.account, transfer_to=self.other,
+                                              processing_date=now - timedelta(days=2))
+        self.old_deposit = Deposit.objects.create(amount=500, account=self.account,
+                                                  processing_date=now - timedelta(days=500))
+        LedgerEntry.objects.create(account=self.account, kind=LedgerEntry.TRANSFER_OUT, amount=-1000, balance=0,
+                                   processing_date=self.old.processing_date, transfer=self.old)
+        call_command("archive_history", stdout=StringIO())
+
+    def transfer_ids(self, **params):
+        response = self.client.get(reverse("transfer"), params)
+        self.assertEqual(response.status_code, 200)
+        return [transfer["id"] for transfer in response.data["results"]]
+
+    def test_archive_moves_old_rows_and_keeps_their_ids(self):
+        self.assertEqual(list(Transfer.objects.values_list("id", flat=True)), [self.recent.id])
+        self.assertFalse(Deposit.objects.exists())
+        self.assertEqual(list(ArchivedTransfer.objects.values_list("id", "amount")), [(self.old.id, 1000)])
+        self.assertEqual(list(ArchivedDeposit.objects.values_list("id", flat=True)), [self.old_deposit.id])
+        self.assertEqual(LedgerEntry.objects.get(kind=LedgerEntry.TRANSFER_OUT).transfer_id, self.old.id)
+
+    def test_ledger_rebuild_reads_archived_rows(self):
+        call_command("backfill_ledger", rebuild=True, stdout=StringIO())
+        self.assertEqual(list(LedgerEntry.objects.filter(account=self.account).order_by("id")
+                              .values_list("kind", "deposit_id", "transfer_id")),
+                         [(LedgerEntry.OPENING, None, None), (LedgerEntry.DEPOSIT, self.old_deposit.id, None),
+                          (LedgerEntry.TRANSFER_OUT, None, self.old.id),
+                          (LedgerEntry.TRANSFER_OUT, None, self.recent.id)])
+
+    def test_recent_ranges_read_the_hot_tier_only(self):
+        since = timezone.now() - timedelta(days=30)
+        queryset = Transfer.objects.filter(transfer_from=self.account).for_period(since)
+        self.assertIs(queryset.model, Transfer)
+        self.assertEqual(self.transfer_ids(processing_date__gte=since.isoformat()), [self.recent.id])
+
+    def test_old_or_open_ranges_union_the_archive(self):
+        since = timezone.now() - timedelta(days=600)
+        self.assertEqual(Transfer.objects.filter(transfer_from=self.account).for_period(since).model,
+                         TransferHistory)
+        self.assertEqual(self.transfer_ids(processing_date__gte=since.isoformat()), [self.recent.id, self.old.id])
+        self.assertEqual(self.transfer_ids(), [self.recent.id, self.old.id])
+        self.assertEqual(self.transfer_ids(amount__lte=10), [self.old.id])
+        with self.assertRaises(TypeError):
+            (Transfer.objects.filter(amount=1) | Transfer.objects.filter(amount=2)).all_tiers()
+
+    def test_statements_include_archived_movements(self):
+        response = self.client.get(reverse("detail-account-statement", kwargs={'id': self.account.id}),
+                                   {"format": "ndjson"})
+        kinds = [json.loads(line)["kind"] for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(kinds, ["deposit", "transfer_out", "transfer_out"])
+
+
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        metrics.registry.reset()
+        cache.clear()
+        customer = Customer.objects.create(name="Test", address="Test", identification_number="12345678901")
+        self.account = Account.objects.create(customer=customer, balance=25000, type='Deposit')
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get(reverse("detail-account-transfer", kwargs={'id': self.account.id}))
+        self.client.get(reverse("detail-account-transfer", kwargs={'id': 0}))
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        labels = 'view="detail-account-transfer",method="GET"'
+        self.assertIn(f'app_request_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn(f'app_request_queries_bucket{{{labels},le="+Inf"}} 2', body)
+        self.assertIn(f'app_requests_total{{{labels},status="200"}} 1', body)
+        self.assertIn(f'app_requests_total{{{labels},status="404"}} 1', body)
+        self.assertIn('app_account_lock_retries_total 0', body)
+        seconds, sql = metrics.registry.slowest_query("detail-account-transfer", "GET")
+        self.assertIn("SELECT", sql)
+
+    @override_settings(SLOW_REQUEST_SECONDS=0, SLOW_REQUEST_SAMPLE_RATE=1)
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with self.assertLogs("app.slow_requests", "WARNING") as logs:
+            self.client.get(reverse("detail-account", kwargs={'id': self.account.id}))
+        self.assertIn("(detail-account) 200", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+    @override_settings(SLOW_REQUEST_SECONDS=0, SLOW_REQUEST_SAMPLE_RATE=0)
+    def test_slow_request_log_is_sampled(self):
+        with self.assertRaises(AssertionError):
+            with self.assertLogs("app.slow_requests", "WARNING"):
+                self.client.get(reverse("detail-account", kwargs={'id': self.account.id}))
+
+    def test_async_views_stay_concurrent_under_asgi(self):
+        async def slow_get(view, request, id):
+            await sync_to_async(Account.objects.count)()
+            await asyncio.sleep(0.3)
+            return json_response({})
+
+        async def get(handler):
+            communicator = ApplicationCommunicator(handler, {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': f'/api/async/account/{self.account.id}', 'query_string': b'',
+                'headers': [], 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234)})
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(5)
+            await communicator.receive_output(5)
+            return start['status']
+
+        async def get_all():
+            handler = ASGIHandler()
+            return await asyncio.gather(*(get(handler) for _ in range(4)))
+
+        # Like Django's test clients: the request signals would close the test's connection.
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            with mock.patch.object(AsyncAccountDetailView, "get", slow_get):
+                started = time.perf_counter()
+                statuses = async_to_sync(get_all)()
+                elapsed = time.perf_counter() - started
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+        self.assertEqual(statuses, [200] * 4)
+        self.assertLess(elapsed, 0.9)
+        seconds, sql = metrics.registry.slowest_query("async-detail-account", "GET")
+        self.assertIn("COUNT", sql)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_middleware_is_not_loaded(self):
+        self.client.get(reverse("detail-account", kwargs={'id': self.account.id}))
+        self.assertIsNone(metrics.registry.slowest_query("detail-account", "GET"))
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = 0
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(TestCase):
+
+    def test_connections_are_reused_after_rollback(self):
+        pool = ConnectionPool(FakeConnection, size=2, timeout=0.01)
+        first = pool.get()
+        pool.put(first)
+        self.assertIs(pool.get(), first)
+        self.assertEqual(first.rollbacks, 1)
+
+    def test_size_bounds_open_connections(self):
+        pool = ConnectionPool(FakeConnection, size=2, timeout=0.01)
+        first, second = pool.get(), pool.get()
+        with self.assertRaises(PoolTimeout):
+            pool.get()
+        pool.put(second)
+        self.assertIs(pool.get(), second)
+
+    def test_closed_or_unhealthy_connections_are_replaced(self):
+        healthy = {}
+        pool = ConnectionPool(FakeConnection, size=1, timeout=0.01, check=lambda c: healthy.get(id(c), True))
+        broken = pool.get()
+        pool.put(broken)
+        healthy[id(broken)] = False
+        replacement = pool.get()
+        self.assertIsNot(replacement, broken)
+        self.assertTrue(broken.closed)
+        replacement.close()
+        pool.put(replacement)
+        self.assertIsNot(pool.get(), replacement)
+
+    @override_settings(STATEMENT_TIMEOUTS={'default': 30000, 'write': 5000, 'report': 0})
+    def test_statement_timeout_is_local_to_the_transaction(self):
+        with CaptureQueriesContext(connection) as queries:
+            statement_timeout('write')
+            with transaction.atomic():
+                statement_timeout('write')
+        expected = ['SET LOCAL statement_timeout = 5000'] if connection.vendor == 'postgresql' else []
+        self.assertEqual([query['sql'] for query in queries if query['sql'].startswith('SET')], expected)
+
+
+class ReplicaRouterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        routers.reset_health()
+        self.customer = Customer.objects.create(name="Test", address="Test", identification_number="12345678901")
+
+    def test_only_marked_reads_use_the_replica(self):
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Account), "default")
+        with routers.reading_from("replica1"):
+            self.assertEqual(router.db_for_read(Account), "replica1")
+            self.assertEqual(router.db_for_write(Account), "default")
+        self.assertEqual(list(routers.stream_from("replica1", (router.db_for_read(Account) for _ in range(2)))),
+                         ["replica1", "replica1"])
+
+    @override_settings(REPLICA_DATABASES=["replica1", "replica2"], REPLICA_HEALTH_CHECK_INTERVAL=60)
+    def test_health_checks_are_cached_and_failures_take_a_replica_out(self):
+        with mock.patch.object(routers, "_check", return_value=True) as check:
+            self.assertIn(routers.pick_replica(), ("replica1", "replica2"))
+            self.assertIn(routers.pick_replica(), ("replica1", "replica2"))
+            self.assertEqual(check.call_count, 2)
+            routers.mark_unhealthy("replica1")
+            self.assertEqual({routers.pick_replica() for _ in range(10)}, {"replica2"})
+
+    @override_settings(REPLICA_DATABASES=["missing"])
+    def test_unreachable_replica_falls_back_to_the_primary(self):
+        response = self.client.get(reverse("list-create-customer"))
+        self.assertEqual([customer["id"] for customer in response.data], [self.customer.id])
+        self.assertFalse(routers.is_healthy("missing"))
+
+    @override_settings(REPLICA_DATABASES=["missing"], REPLICA_PIN_SECONDS=5)
+    def test_writes_pin_the_client_to_the_primary(self):
+        factory = APIRequestFactory()
+        self.assertFalse(replicas.is_pinned(factory.get("/")))
+        response = self.client.post(reverse("list-create-customer"), {"name": "New", "address": "Somewhere",
+                                                                      "identification_number": "10987654321"})
+        self.assertEqual(response.status_code, 201)
+        cookie = response.cookies[replicas.PIN_COOKIE]
+        self.assertEqual(cookie["max-age"], 5)
+        request = factory.get("/", REMOTE_ADDR="10.0.0.1")
+        request.COOKIES[replicas.PIN_COOKIE] = cookie.value
+        self.assertTrue(replicas.is_pinned(request))
+        # Pinned by address too, for clients that do not keep cookies.
+        self.assertTrue(replicas.is_pinned(factory.get("/")))
+        request.COOKIES[replicas.PIN_COOKIE] = str(time.time() + 3600)
+        self.assertFalse(replicas.is_pinned(request))
+
+    def test_pin_cookie_holds_from_the_first_instant(self):
+        request, response = APIRequestFactory().post("/"), Response()
+        with mock.patch("app.api.replicas.time.time", return_value=1000.9996):
+            replicas.pin(request, response)
+            request.COOKIES[replicas.PIN_COOKIE] = response.cookies[replicas.PIN_COOKIE].value
+            cache.clear()
+            self.assertTrue(replicas.is_pinned(request))
+
+
+STAND_IN_REPLICAS = [alias for alias in settings.REPLICA_DATABASES
+                     if not settings.DATABASES[alias].get('TEST', {}).get('MIRROR')]
+
+
+@skipUnless(STAND_IN_REPLICAS, "Set DATABASE_REPLICAS to SQLite files to test against stand-in replicas")
+class ReplicaStandInTests(TestCase):
+    """The stand-in replicas get their own empty test databases: whatever a read finds shows where it went."""
+    databases = {'default', *STAND_IN_REPLICAS}
+
+    def setUp(self):
+        cache.clear()
+        routers.reset_health()
+        Customer.objects.create(name="Test", address="Test", identification_number="12345678901")
+
+    def test_list_reads_the_replica_until_the_client_writes(self):
+        self.assertEqual(self.client.get(reverse("list-create-customer")).data, [])
+        self.client.post(reverse("list-create-customer"), {"name": "New", "address": "Somewhere",
+                                                           "identification_number": "10987654321"})
+        self.assertEqual(len(self.client.get(reverse("list-create-customer")).data), 2)
+
+
+class FastJSONTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        customer = Customer.objects.create(name="Test", address="Test", identification_number="12345678901")
+        self.from_account = Account.objects.create(customer=customer, balance=25000, type='Deposit')
+        self.to_account = Account.objects.create(customer=customer, balance=1000, type='Deposit', currency='USD')
+        for amount in (1, 2050, 99999):
+            Transfer.objects.create(amount=amount, transfer_from=self.from_account, transfer_to=self.to_account)
+
+    def test_values_serializers_match_the_model_serializers(self):
+        transfers = Transfer.objects.order_by("id")
+        self.assertEqual(TransferValuesSerializer(TransferValuesSerializer.queryset(transfers), many=True).data,
+                         TransferSerializer(transfers, many=True).data)
+        with timezone.override("Europe/Istanbul"):
+            self.assertEqual(TransferValuesSerializer(TransferValuesSerializer.queryset(transfers), many=True).data,
+                             TransferSerializer(transfers, many=True).data)
+        accounts = Account.objects.order_by("id")
+        self.assertEqual(AccountValuesSerializer(AccountValuesSerializer.queryset(accounts), many=True).data,
+                         AccountSerializer(accounts, many=True).data)
+
+    def test_renderer_and_parser_round_trip(self):
+        data = TransferSerializer(Transfer.objects.order_by("id"), many=True).data
+        body = FastJSONRenderer().render(data)
+        self.assertEqual(json.loads(body), json.loads(json.dumps(data, cls=DjangoJSONEncoder)))
+        self.assertEqual(FastJSONParser().parse(BytesIO(body)), json.loads(body))
+        self.assertEqual(fastjson.dumps({"name": "Şule"}), '{"name":"Şule"}'.encode())
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(BytesIO(b'{"amount": '))
+
+    def test_list_responses_are_unchanged(self):
+        requests = [(reverse("transfer"), {}), (reverse("transfer"), {"format": "ndjson"}),
+                    (reverse("list-account"), {})]
+        for url, params in requests:
+            with self.subTest(url=url, **params):
+                expected = self._body(self.client.get(url, params))
+                with override_settings(FAST_JSON=True):
+                    self.assertEqual(self._body(self.client.get(url, params)), expected)
+
+    @staticmethod
+    def _body(response):
+        if response.streaming:
+            return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        return json.loads(response.content)
+
+
+class CustomerImportTests(TestCase):
+    HEADER = "name,address,identification_number,type,balance,currency,is_active\n"
+
+    def setUp(self):
+        Customer.objects.create(name="Taken", address="Test", identification_number="12345678901")
+
+    def csv_file(self, directory, rows):
+        path = os.path.join(directory, "customers.csv")
+        with open(path, "w") as output:
+            output.write(self.HEADER + "".join(row + "\n" for row in rows))
+        return path
+
+    def test_command_imports_valid_rows_and_reports_the_rest(self):
+        rows = ["Sarah,Address 1,10000000001,vadeli,100,,",
+                "Michael,Address 2,10000000002,vadesiz,75.5,USD,false",
+                "Taken,Address 3,12345678901,vadeli,100,,",
+                "Short,Address 4,123,vadeli,100,,",
+                "Poor,Address 5,10000000005,vadeli,10,,",
+                "Again,Address 6,10000000001,vadeli,100,,"]
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.csv_file(directory, rows)
+            call_command("import_customers", path, chunk_size=4, stdout=StringIO())
+            with open(path + ".rejects.csv") as report:
+                rejects = list(csv.DictReader(report))
+            with open(path + ".checkpoint") as checkpoint:
+                self.assertEqual(json.load(checkpoint), {"chunk_size": 4, "done": [0, 1]})
+            # Both chunks are in the checkpoint: running again writes and reports nothing.
+            call_command("import_customers", path, chunk_size=4, stdout=StringIO())
+            with open(path + ".rejects.csv") as report:
+                self.assertEqual(len(list(csv.DictReader(report))), len(rejects))
+
+        self.assertEqual([(int(row["row"]), list(json.loads(row["errors"]))) for row in rejects],
+                         [(3, ["identification_number"]), (4, ["identification_number"]), (5, ["balance"]),
+                          (6, ["identification_number"])])
+        sarah = Account.objects.get(customer__identification_number="10000000001")
+        self.assertEqual((sarah.balance, sarah.currency, sarah.is_active), (10000, "TRY", True))
+        michael = Account.objects.get(customer__identification_number="10000000002")
+        self.assertEqual((michael.balance, michael.currency, michael.is_active), (7550, "USD", False))
+        self.assertEqual(list(Deposit.objects.filter(account=michael).values_list("amount", flat=True)), [7550])
+        entry = LedgerEntry.objects.get(account=michael)
+        self.assertEqual((entry.kind, entry.amount, entry.balance), (LedgerEntry.DEPOSIT, 7550, 7550))
+        self.assertEqual(entry.deposit_id, Deposit.objects.get(account=michael).id)
+
+    def test_queries_per_chunk_do_not_grow_with_its_rows(self):
+        def import_rows(first, count):
+            rows = [{"name": "Test", "address": "Test", "identification_number": str(first + number),
+                     "type": "vadeli", "balance": 100} for number in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                result = imports.import_chunk(0, 1, rows)
+            self.assertEqual(result.created, count)
+            return len(queries)
+
+        self.assertEqual(import_rows(20000000000, 2), import_rows(30000000000, 50))
+
+    def test_endpoint_accepts_json_and_csv(self):
+        url = reverse("import-customer")
+        response = self.client.post(url, data=json.dumps([
+            {"name": "Sarah", "address": "Address 1", "identification_number": "10000000001", "type": "vadeli",
+             "balance": 100},
+            {"name": "Taken", "address": "Address 2", "identification_number": "12345678901", "type": "vadeli",
+             "balance": 100},
+        ]), content_type="application/json")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual([reject["row"] for reject in response.data["rejected"]], [2])
+
+        response = self.client.post(url, data=self.HEADER + "Michael,Address 2,10000000002,vadeli,60,,\n",
+                                    content_type="text/csv")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {"created": 1, "rejected": []})
+        self.assertTrue(Account.objects.filter(customer__identification_number="10000000002").exists())
+
+        response = self.client.post(url, data=json.dumps({"name": "Sarah"}), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class BalanceProjectionTests(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Test", address="Test", identification_number="12345678901")
+        response = self.post("create-account", {"customer": self.customer.id, "type": "Deposit", "balance": 200})
+        self.account = Account.objects.get(id=response.data["id"])
+        self.other = Account.objects.create(customer=self.customer, balance=0, type='Deposit')
+
+    def post(self, name, data):
+        return self.client.post(reverse(name), data=json.dumps(data), content_type='application/json')
+
+    def projected(self):
+        return dict(ProjectedBalance.objects.values_list("account_id", "balance"))
+
+    def test_catch_up_applies_new_entries_from_the_checkpoint(self):
+        self.assertEqual(projection.catch_up(), 1)
+        self.assertEqual(self.projected(), {self.account.id: 20000})
+        self.post("deposit", {"amount": 50, "account": self.account.id})
+        self.post("transfer", {"amount": 30, "transfer_from": self.account.id, "transfer_to": self.other.id})
+        self.assertEqual(projection.catch_up(batch_size=2), 3)
+        self.assertEqual(self.projected(), {self.account.id: 22000, self.other.id: 3000})
+        self.assertEqual(projection.checkpoint_position(), LedgerEntry.objects.latest("id").id)
+        self.assertEqual(projection.catch_up(), 0)
+        self.assertEqual(list(projection.drift()), [])
+
+    @override_settings(PROJECTION_GAP_SECONDS=60)
+    def test_catch_up_waits_for_recent_gaps(self):
+        projection.catch_up()
+        self.post("deposit", {"amount": 50, "account": self.account.id})
+        self.post("deposit", {"amount": 10, "account": self.account.id})
+        # As if the first deposit's transaction had not committed yet.
+        first, second = LedgerEntry.objects.order_by("id")[1:]
+        first.delete()
+        self.assertEqual(projection.catch_up(), 0)
+        LedgerEntry.objects.filter(id=second.id).update(processing_date=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(projection.catch_up(), 1)
+        self.assertEqual(self.projected(), {self.account.id: 21000})
+
+    def test_drift_and_rebuild(self):
+        self.post("deposit", {"amount": 50, "account": self.account.id})
+        call_command("project_balances", stdout=StringIO())
+        Account.objects.filter(id=self.other.id).update(balance=500)
+        with self.assertRaisesMessage(CommandError, "1 accounts differ"):
+            call_command("project_balances", check=True, stdout=StringIO())
+        self.assertEqual(list(projection.drift()), [(self.other.id, 500, 0)])
+
+        ProjectedBalance.objects.update(balance=0)
+        self.assertEqual(projection.rebuild(chunk_size=1), 1)
+        self.assertEqual(self.projected(), {self.account.id: 25000})
+        self.assertEqual(projection.checkpoint_position(), LedgerEntry.objects.latest("id").id)
+
+    def test_interrupted_rebuild_blocks_catch_up(self):
+        ProjectorCheckpoint.objects.create(name=projection.NAME, position=projection.REBUILDING)
+        with self.assertRaises(projection.ProjectionRebuilding):
+            projection.catch_up()
+        call_command("project_balances", rebuild=True, stdout=StringIO())
+        self.assertEqual(self.projected(), {self.account.id: 20000})
+
+    # Backfilled history is old; here it is seconds old, behind the gap the deleted entries leave.
+    @override_settings(PROJECTION_GAP_SECONDS=0)
+    def test_ledger_rebuild_invalidates_the_projection(self):
+        self.post("deposit", {"amount": 50, "account": self.account.id})
+        projection.catch_up()
+        call_command("backfill_ledger", rebuild=True, stdout=StringIO())
+        # The replaced entries have new ids: applying them again would double the balance.
+        with self.assertRaises(projection.ProjectionRebuilding):
+            projection.catch_up()
+        call_command("project_balances", rebuild=True, stdout=StringIO())
+        self.assertEqual(projection.catch_up(), 0)
+        self.assertEqual(self.projected(), {self.account.id: 25000})
+        self.assertEqual(list(projection.drift()), [])
+
+
+class ReconcileTests(TestCase):
+
+    def setUp(self):
+        customer = Customer.objects.create(name="Test", address="Test", identification_number="12345678901")
+        self.first, self.second = [
+            Account.objects.get(id=self.post("create-account", {"customer": customer.id, "type": "Deposit",
+                                                                "balance": balance}).data["id"])
+            for balance in (200, 100)]
+        self.post("deposit", {"amount": 50, "account": self.first.id})
+        self.post("withdraw", {"amount": 20, "account": self.second.id})
+        self.post("transfer", {"amount": 30, "transfer_from": self.first.id, "transfer_to": self.second.id})
+
+    def post(self, name, data):
+        return self.client.post(reverse(name), data=json.dumps(data), content_type='application/json')
+
+    def test_balances_reconcile_across_tiers(self):
+        deposit = Deposit.objects.get(account=self.first, amount=5000)
+        ArchivedDeposit.objects.create(id=deposit.id, amount=deposit.amount, account=self.first,
+                                       processing_date=deposit.processing_date)
+        deposit.delete()
+        result = reconcile.reconcile(chunk_size=1)
+        self.assertEqual(result, (2, []))
+
+    def test_discrepancies_are_reported(self):
+        Account.objects.filter(id=self.second.id).update(balance=F("balance") + 1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "report.csv")
+            with self.assertRaisesMessage(CommandError, "1 of 2 accounts do not reconcile"):
+                call_command("reconcile", report=path, stdout=StringIO())
+            with open(path) as report:
+                rows = list(csv.DictReader(report))
+        self.assertEqual(rows, [{"account_id": str(self.second.id), "balance": "110.01", "expected": "110.0",
+                                 "difference": "0.01", "deposits": "100.0", "withdraws": "20.0",
+                                 "transfers_in": "30.0", "transfers_out": "0.0"}])
+
+    def test_incremental_run_only_reads_touched_accounts(self):
+        self.assertEqual(reconcile.reconcile(incremental=True), (2, []))
+        # A balance changed without a movement is left to full runs.
+        Account.objects.filter(id=self.first.id).update(balance=0)
+        Account.objects.filter(id=self.second.id).update(balance=F("balance") + 1)
+        self.post("deposit", {"amount": 10, "account": self.second.id})
+        result = reconcile.reconcile(incremental=True, overlap=0)
+        self.assertEqual(result.accounts, 1)
+        self.assertEqual([item.account_id for item in result.discrepancies], [self.second.id])
+        self.assertEqual(reconcile.reconcile(incremental=True, overlap=0).accounts, 0)
+        self.assertEqual(len(reconcile.reconcile().discrepancies), 2)
+
+
+WRITE_LIMIT = dict(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES={'read': None, 'write': '2/m'}))
+
+
+class ThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset()
+        customer = Customer.objects.create(name="Test", address="Test", identification_number="12345678901")
+        self.account = Account.objects.create(customer=customer, balance=25000, type='Deposit')
+        self.other = Account.objects.create(customer=customer, balance=0, type='Deposit')
+
+    def post(self, name, data):
+        return self.client.post(reverse(name), data=json.dumps(data), content_type='application/json')
+
+    def test_token_bucket_refills_over_the_period(self):
+        with mock.patch("app.services.ratelimit.time.time", return_value=1000.0) as now:
+            self.assertEqual([ratelimit.take("bucket", 2, 1) for _ in range(3)], [0, 0, 0.5])
+            now.return_value = 1000.25
+            self.assertEqual(ratelimit.take("bucket", 2, 1), 0.25)
+            now.return_value = 1000.5
+            self.assertEqual(ratelimit.take("bucket", 2, 1), 0)
+
+    @override_settings(ASYNC_WRITE_WORKERS=0, **WRITE_LIMIT)
+    def test_writes_are_limited_per_client_and_endpoint(self):
+        for _ in range(2):
+            self.assertEqual(self.post("deposit", {"amount": 1, "account": self.account.id}).status_code, 201)
+        response = self.post("deposit", {"amount": 1, "account": self.account.id})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+        self.assertEqual(response.json()["error"]["status_code"], 429)
+        self.assertEqual(self.post("withdraw", {"amount": 1, "account": self.account.id}).status_code, 201)
+        self.assertEqual(self.client.post(reverse("deposit"), data=json.dumps({"amount": 1, "account": self.account.id}),
+                                          content_type='application/json', REMOTE_ADDR="10.0.0.2").status_code, 201)
+        self.assertEqual(self.client.get(reverse("detail-account", kwargs={'id': self.account.id})).status_code, 200)
+        response = self.post("async-deposit", {"amount": 1, "account": self.account.id})
+        self.assertEqual(response.status_code, 201)
+        self.post("async-deposit", {"amount": 1, "account": self.account.id})
+        response = self.post("async-deposit", {"amount": 1, "account": self.account.id})
+        self.assertEqual((response.status_code, response["Retry-After"]), (429, "30"))
+
+    @override_settings(**WRITE_LIMIT)
+    def test_forwarded_for_does_not_make_a_new_client(self):
+        statuses = [self.client.post(reverse("deposit"), data=json.dumps({"amount": 1, "account": self.account.id}),
+                                     content_type='application/json', HTTP_X_FORWARDED_FOR=f"10.0.0.{i}").status_code
+                    for i in range(3)]
+        self.assertEqual(statuses, [201, 201, 429])
+
+    @override_settings(**DEFAULT_THROTTLING)
+    def test_default_rates_are_enforced(self):
+        with mock.patch("app.services.ratelimit.time.time", return_value=1000.0):
+            statuses = [self.post("deposit", {"amount": 1, "account": self.account.id}).status_code
+                        for _ in range(21)]
+        self.assertEqual(statuses, [201] * 20 + [429])
+
+    @override_settings(**WRITE_LIMIT)
+    def test_buckets_stay_in_process_when_the_cache_fails(self):
+        with mock.patch("app.services.ratelimit.caches") as caches:
+            caches.__getitem__.return_value.get.side_effect = ConnectionError
+            with self.assertLogs("app.services.ratelimit", "WARNING"):
+                statuses = [self.post("deposit", {"amount": 1, "account": self.account.id}).status_code
+                            for _ in range(3)]
+        self.assertEqual(statuses, [201, 201, 429])
+
+    @override_settings(ADMISSION_MAX_PER_ACCOUNT=1, ADMISSION_RETRY_AFTER=2)
+    def test_busy_accounts_are_refused_instead_of_queued(self):
+        with admission.controller.admit([self.account.id]):
+            response = self.post("transfer", {"amount": 1, "transfer_from": self.account.id,
+                                              "transfer_to": self.other.id})
+            self.assertEqual((response.status_code, response["Retry-After"]), (429, "2"))
+            self.assertEqual(self.post("deposit", {"amount": 1, "account": self.other.id}).status_code, 201)
+        self.assertEqual(self.post("withdraw", {"amount": 1, "account": self.account.id}).status_code, 201)
+        self.assertEqual(admission.controller.snapshot()["in_flight"], 0)
+        self.assertIn("app_admission_rejected_total", self.client.get("/metrics").content.decode())
+
+    @override_settings(ADMISSION_MAX_IN_FLIGHT=1, ASYNC_WRITE_WORKERS=0)
+    def test_in_flight_movements_are_capped(self):
+        with admission.controller.admit([]):
+            response = self.post("transfer-batch", [{"amount": 1, "transfer_from": self.account.id,
+                                                     "transfer_to": self.other.id}])
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(self.post("async-withdraw", {"amount": 1, "account": self.account.id}).status_code, 429)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 25000)
+
+
+class CustomerSearchTests(TestCase):
+
+    def setUp(self):
+        search.reset_index()
+        Customer.objects.create(name="Sarah Johnson", address="Example Address 1", identification_number="12345678901")
+        Customer.objects.create(name="Michael Brown", address="Baker Street 221", identification_number="12399999999")
+        Customer.objects.create(name="Sara Jones", address="Sarah Johnson Avenue", identification_number="98765432101")
+
+    def tearDown(self):
+        search.reset_index()
+
+    def names(self, query, **params):
+        response = self.client.get(reverse("search-customer"), {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row["name"] for row in response.json()["results"]]
+
+    def test_trigram_similarity_matches_pg_trgm(self):
+        self.assertEqual(search.trigrams("Ab-c"), {"  a", " ab", "ab ", "  c", " c "})
+        self.assertAlmostEqual(search.similarity(search.trigrams("word"), search.trigrams("two words")), 4 / 11)
+
+    def test_identification_number_prefixes_rank_first(self):
+        self.assertEqual(self.names("123"), ["Sarah Johnson", "Michael Brown"])
+        self.assertEqual(self.names("1234"), ["Sarah Johnson"])
+
+    def test_misspelt_and_partial_names_and_addresses_match(self):
+        self.assertEqual(self.names("Sarah Jonson"), ["Sarah Johnson", "Sara Jones"])
+        self.assertEqual(self.names("baker str"), ["Michael Brown"])
+        self.assertEqual(self.names("ichae"), ["Michael Brown"])
+        self.assertEqual(self.names("xyz"), [])
+
+    def test_short_queries_only_match_identification_numbers(self):
+        self.assertEqual(self.names("ar"), [])
+        self.assertEqual(self.names("12"), ["Sarah Johnson", "Michael Brown"])
+        self.assertEqual(self.names("a b"), [])
+
+    @override_settings(CUSTOMER_SEARCH_INDEX_TTL=0)
+    def test_rebuild_runs_beside_searches_and_keeps_changes_made_meanwhile(self):
+        old = search.get_index()
+        # Another thread is rebuilding: searches go on with the old index instead of waiting.
+        with search._rebuild_lock:
+            self.assertIs(search.get_index(), old)
+        build = search._build
+
+        def build_then_delete(index):
+            build(index)
+            # Deleted after the rebuild read its row, before the new index replaces the old one.
+            Customer.objects.filter(name="Michael Brown").delete()
+            return index
+
+        with mock.patch("app.services.search._build", side_effect=build_then_delete):
+            index = search.get_index()
+        self.assertIsNot(index, old)
+        self.assertEqual(index.search("Michael", 0.3), [])
+        self.assertEqual(len(index.documents), 2)
+
+    def test_results_are_paginated(self):
+        response = self.client.get(reverse("search-customer"), {"q": "sarah", "page_size": 1})
+        body = response.json()
+        self.assertEqual([row["name"] for row in body["results"]], ["Sarah Johnson"])
+        self.assertEqual(body["results"][0]["rank"], 0.429)
+        self.assertIn("page=2", body["next"])
+        body = self.client.get(body["next"]).json()
+        self.assertEqual(([row["name"] for row in body["results"]], body["next"]), (["Sara Jones"], None))
+        self.assertEqual(self.client.get(reverse("search-customer")).status_code, 400)
+        self.assertEqual(self.client.get(reverse("search-customer"), {"q": "sarah", "page": 0}).status_code, 400)
+
+    def test_index_follows_new_changed_and_deleted_customers(self):
+        self.assertEqual(self.names("Johnson"), ["Sarah Johnson", "Sara Jones"])
+        # bulk_create sends no signals: new ids are picked up before the next search.
+        Customer.objects.bulk_create([Customer(name="Ann Johnson", address="Test", identification_number="55555555555")])
+        self.assertEqual(self.names("Johnson"), ["Ann Johnson", "Sarah Johnson", "Sara Jones"])
+        customer = Customer.objects.get(name="Sarah Johnson")
+        customer.name = "Sarah Smith"
+        customer.save()
+        Customer.objects.get(name="Ann Johnson").delete()
+        self.assertEqual(self.names("Johnson"), ["Sara Jones"])
+        self.assertEqual(self.names("smith"), ["Sarah Smith"])
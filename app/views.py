@@ -1,3 +1,40 @@
-from django.shortcuts import render
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from app.services import admission, metrics as metrics_service
+from app.services.transfers import contention_metrics
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@require_GET
+def metrics(request):
+    """Request metrics of this process, transfer lock contention and admission control, in the Prometheus text format."""
+    return HttpResponse(metrics_service.registry.render(_contention_families() + _admission_families()),
+                        content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def _contention_families():
+    # Summed over accounts, since a series per account would grow without bound. Every account a
+    # transfer touches counts it, so a transfer between two accounts adds 2.
+    accounts = contention_metrics.snapshot().values()
+    return [
+        ('app_account_transfers_total', 'Transfers per account involved, summed over accounts.', 'counter',
+         [('', {}, sum(stats['transfers'] for stats in accounts))]),
+        ('app_account_lock_retries_total', 'Retries after a deadlock or lock timeout, per account involved.',
+         'counter', [('', {}, sum(stats['retries'] for stats in accounts))]),
+        ('app_account_lock_wait_seconds_total', 'Time spent waiting for account row locks, per account involved.',
+         'counter', [('', {}, sum(stats['lock_wait_seconds'] for stats in accounts))]),
+        ('app_account_max_lock_wait_seconds', 'Longest single wait for account row locks.', 'gauge',
+         [('', {}, max((stats['max_lock_wait_seconds'] for stats in accounts), default=0.0))]),
+    ]
+
+
+def _admission_families():
+    state = admission.controller.snapshot()
+    return [
+        ('app_admission_in_flight', 'Money movements running in this process.', 'gauge',
+         [('', {}, state['in_flight'])]),
+        ('app_admission_rejected_total', 'Money movements refused with a 429 by admission control.', 'counter',
+         [('', {}, state['rejected'])]),
+    ]
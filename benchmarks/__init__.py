@@ -0,0 +1,11 @@
+"""
+Load-testing harness for the banking API.
+
+    python -m benchmarks --customers 1000 --transfers 1000000 --requests 5000 --concurrency 16
+
+builds a fresh test database, seeds it (see `dataset`), drives a weighted mix of reads and
+writes against the in-process WSGI or ASGI application (see `workload`) and prints p50 / p95 /
+p99 latency, throughput and queries per request for every endpoint (see `report`).
+`--save-baseline` stores the figures and `--baseline` compares a run against them, exiting
+non-zero on a regression.
+"""
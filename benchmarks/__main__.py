@@ -0,0 +1,71 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+import django
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark the banking API in-process.')
+    parser.add_argument('--customers', type=int, default=100)
+    parser.add_argument('--accounts-per-customer', type=int, default=2)
+    parser.add_argument('--transfers', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--mix', help='Operation weights, e.g. "account-detail=50,transfer=10".')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keepdb', action='store_true', help='Reuse the benchmark database and its data.')
+    parser.add_argument('--baseline', help='Compare against this baseline file and exit 1 on regressions.')
+    parser.add_argument('--save-baseline', help='Write the results to this baseline file.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative latency/throughput change.')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    # Every request comes from the one in-process client; measure the server, not its per-client limits.
+    os.environ.setdefault('THROTTLE_READ_RATE', '')
+    os.environ.setdefault('THROTTLE_WRITE_RATE', '')
+    django.setup()
+
+    from django.conf import settings
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+    from app.models import Account, Customer
+    from benchmarks import dataset, report, workload
+
+    weights = workload.parse_mix(args.mix)
+    # Failed requests are counted in the report, their tracebacks would only drown it.
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    database = settings.DATABASES['default']
+    if database['ENGINE'] == 'django.db.backends.sqlite3' and not database.get('TEST', {}).get('NAME'):
+        # The in-memory test database fails concurrent writers immediately instead of letting them wait.
+        database.setdefault('TEST', {})['NAME'] = os.path.join(tempfile.gettempdir(), 'banking_benchmark.sqlite3')
+    setup_test_environment()
+    databases = setup_databases(verbosity=1, interactive=False, keepdb=args.keepdb)
+    try:
+        if not (args.keepdb and Account.objects.exists()):
+            dataset.generate(customers=args.customers, accounts_per_customer=args.accounts_per_customer,
+                             transfers=args.transfers, seed=args.seed, stdout=sys.stdout)
+        account_ids = list(Account.objects.values_list('id', flat=True))
+        customer_ids = list(Customer.objects.values_list('id', flat=True))
+        samples, elapsed = workload.run(account_ids, customer_ids, requests=args.requests,
+                                        concurrency=args.concurrency, weights=weights, server=args.server,
+                                        seed=args.seed)
+    finally:
+        teardown_databases(databases, verbosity=1, keepdb=args.keepdb)
+
+    summary = report.summarize(samples, elapsed)
+    print(report.format_table(summary))
+    if args.save_baseline:
+        report.save(summary, args.save_baseline)
+    if args.baseline:
+        regressions = report.compare(summary, report.load(args.baseline), tolerance=args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import random
+from datetime import timedelta
+
+from django.db.models import Max
+from django.utils import timezone
+
+from app.models import Account, Customer, Transfer
+
+
+def generate(customers=100, accounts_per_customer=2, transfers=10000, days=365, batch_size=5000, seed=0,
+             stdout=None):
+    """
+    Seed the database with `bulk_create`, `batch_size` rows at a time so millions of
+    transfers never sit in memory at once. Balances are set high enough that the write
+    workload rarely runs into refusals. Returns the ids of the accounts created.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    types = ('Deposit', 'Checking', 'Savings')
+
+    first_customer = (Customer.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    for start in range(0, customers, batch_size):
+        Customer.objects.bulk_create(
+            Customer(name=f'Customer {first_customer + i}', address=f'Benchmark Address {i % 1000}',
+                     identification_number=f'{first_customer + i:011d}')
+            for i in range(start, min(start + batch_size, customers)))
+    customer_ids = list(Customer.objects.filter(id__gte=first_customer).values_list('id', flat=True))
+    _log(stdout, f'{len(customer_ids)} customers')
+
+    last_account = Account.objects.aggregate(last=Max('id'))['last'] or 0
+    accounts = (Account(customer_id=customer_id, balance=100_000_000, type=rng.choice(types),
+                        open_date=now - timedelta(days=rng.randint(days, days * 2)))
+                for customer_id in customer_ids for _ in range(accounts_per_customer))
+    _bulk_create(Account, accounts, batch_size)
+    account_ids = list(Account.objects.filter(id__gt=last_account).values_list('id', flat=True))
+    _log(stdout, f'{len(account_ids)} accounts')
+
+    def transfer_rows():
+        for _ in range(transfers):
+            transfer_from, transfer_to = rng.sample(account_ids, 2)
+            yield Transfer(amount=rng.randint(100, 50000), transfer_from_id=transfer_from,
+                           transfer_to_id=transfer_to,
+                           processing_date=now - timedelta(seconds=rng.randint(0, days * 86400)))
+
+    if len(account_ids) > 1:
+        _bulk_create(Transfer, transfer_rows(), batch_size, stdout=stdout)
+    return account_ids
+
+
+def _bulk_create(model, rows, batch_size, stdout=None):
+    chunk = []
+    created = 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == batch_size:
+            model.objects.bulk_create(chunk)
+            created += len(chunk)
+            chunk = []
+            if stdout and model is Transfer:
+                _log(stdout, f'{created} transfers')
+    if chunk:
+        model.objects.bulk_create(chunk)
+        created += len(chunk)
+    if stdout and model is Transfer:
+        _log(stdout, f'{created} transfers')
+
+
+def _log(stdout, message):
+    if stdout:
+        stdout.write(message + '\n')
@@ -0,0 +1,84 @@
+import json
+import math
+from collections import defaultdict
+
+TOTAL = 'all'
+
+
+def percentile(values, fraction):
+    """Linear interpolation between closest ranks; `values` must be sorted."""
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower, upper = math.floor(position), math.ceil(position)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(samples, elapsed):
+    """Per-endpoint latency percentiles (ms), throughput (req/s), error count and queries per request."""
+    groups = defaultdict(list)
+    for sample in samples:
+        groups[sample.endpoint].append(sample)
+        groups[TOTAL].append(sample)
+
+    summary = {}
+    for endpoint, group in sorted(groups.items()):
+        latencies = sorted(sample.seconds * 1000 for sample in group)
+        queries = [sample.queries for sample in group if sample.queries is not None]
+        summary[endpoint] = {
+            'requests': len(group),
+            'errors': sum(1 for sample in group if sample.status >= 500),
+            'rejected': sum(1 for sample in group if 400 <= sample.status < 500),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'throughput_rps': round(len(group) / elapsed, 2) if elapsed else None,
+            'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        }
+    return summary
+
+
+def compare(summary, baseline, tolerance=0.2):
+    """
+    Regressions of `summary` against `baseline`: p95 / p99 latency more than `tolerance`
+    slower, throughput more than `tolerance` lower, more queries per request or new errors.
+    """
+    regressions = []
+    for endpoint, current in summary.items():
+        previous = baseline.get(endpoint)
+        if not previous:
+            continue
+        for key in ('p95_ms', 'p99_ms'):
+            if previous.get(key) and current[key] > previous[key] * (1 + tolerance):
+                regressions.append(f'{endpoint}: {key} {previous[key]} -> {current[key]}')
+        if previous.get('throughput_rps') and current['throughput_rps'] is not None \
+                and current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+            regressions.append(f'{endpoint}: throughput_rps {previous["throughput_rps"]} -> {current["throughput_rps"]}')
+        if previous.get('queries_per_request') is not None and current['queries_per_request'] is not None \
+                and current['queries_per_request'] > previous['queries_per_request']:
+            regressions.append(f'{endpoint}: queries_per_request '
+                               f'{previous["queries_per_request"]} -> {current["queries_per_request"]}')
+        if current['errors'] > previous.get('errors', 0):
+            regressions.append(f'{endpoint}: errors {previous.get("errors", 0)} -> {current["errors"]}')
+    return regressions
+
+
+def format_table(summary):
+    columns = ('requests', 'errors', 'rejected', 'p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps',
+               'queries_per_request')
+    width = max([len(endpoint) for endpoint in summary] + [8])
+    lines = ['endpoint'.ljust(width) + ''.join(column.rjust(21) for column in columns)]
+    for endpoint, row in summary.items():
+        cells = ''.join(('-' if row[column] is None else str(row[column])).rjust(21) for column in columns)
+        lines.append(endpoint.ljust(width) + cells)
+    return '\n'.join(lines)
+
+
+def load(path):
+    with open(path) as baseline:
+        return json.load(baseline)
+
+
+def save(summary, path):
+    with open(path, 'w') as baseline:
+        json.dump(summary, baseline, indent=2, sort_keys=True)
@@ -0,0 +1,81 @@
+"""
+Rows per second through the list serialization paths: ModelSerializer plus DRF's JSONRenderer
+against the FAST_JSON path (values serializer plus FastJSONRenderer).
+
+    python -m benchmarks.serialization --transfers 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import django
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.serialization',
+                                     description='Compare the JSON serialization paths of the list endpoints.')
+    parser.add_argument('--customers', type=int, default=100)
+    parser.add_argument('--accounts-per-customer', type=int, default=2)
+    parser.add_argument('--transfers', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3, help='Best of this many runs per path.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keepdb', action='store_true', help='Reuse the benchmark database and its data.')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    django.setup()
+
+    from django.conf import settings
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+    from rest_framework.renderers import JSONRenderer
+    from app.api import fastjson
+    from app.api.renderers import FastJSONRenderer
+    from app.api.serializers import (AccountSerializer, AccountValuesSerializer, TransferSerializer,
+                                     TransferValuesSerializer)
+    from app.models import Account, Transfer
+    from benchmarks import dataset
+
+    database = settings.DATABASES['default']
+    if database['ENGINE'] == 'django.db.backends.sqlite3' and not database.get('TEST', {}).get('NAME'):
+        database.setdefault('TEST', {})['NAME'] = os.path.join(tempfile.gettempdir(), 'banking_benchmark.sqlite3')
+    setup_test_environment()
+    databases = setup_databases(verbosity=1, interactive=False, keepdb=args.keepdb)
+    try:
+        if not (args.keepdb and Account.objects.exists()):
+            dataset.generate(customers=args.customers, accounts_per_customer=args.accounts_per_customer,
+                             transfers=args.transfers, seed=args.seed, stdout=sys.stdout)
+        paths = [
+            ('transfers', 'model serializer + JSONRenderer',
+             lambda: JSONRenderer().render(TransferSerializer(
+                 TransferSerializer.setup_eager_loading(Transfer.objects.all()), many=True).data)),
+            ('transfers', 'values serializer + FastJSONRenderer',
+             lambda: FastJSONRenderer().render(TransferValuesSerializer(
+                 TransferValuesSerializer.queryset(Transfer.objects.all()), many=True).data)),
+            ('accounts', 'model serializer + JSONRenderer',
+             lambda: JSONRenderer().render(AccountSerializer(
+                 AccountSerializer.setup_eager_loading(Account.objects.all()), many=True).data)),
+            ('accounts', 'values serializer + FastJSONRenderer',
+             lambda: FastJSONRenderer().render(AccountValuesSerializer(
+                 AccountValuesSerializer.queryset(Account.objects.all()), many=True).data)),
+        ]
+        counts = {'transfers': Transfer.objects.count(), 'accounts': Account.objects.count()}
+        print(f'orjson: {"yes" if fastjson.ACCELERATED else "no (standard library)"}')
+        print(f'{"rows":<10} {"path":<38} {"seconds":>9} {"rows/s":>12}')
+        for rows, name, render in paths:
+            seconds = min(_timed(render) for _ in range(args.repeat))
+            print(f'{rows:<10} {name:<38} {seconds:>9.3f} {counts[rows] / seconds:>12,.0f}')
+    finally:
+        teardown_databases(databases, verbosity=1, keepdb=args.keepdb)
+    return 0
+
+
+def _timed(function):
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+Sample = namedtuple('Sample', 'endpoint seconds queries status')
+
+# (method, url name, default weight). Destructive or unbounded endpoints default to 0 and can be
+# switched on with --mix.
+OPERATIONS = {
+    'account-detail': ('GET', 'detail-account', 30),
+    'account-list': ('GET', 'list-account', 5),
+    'account-transfers': ('GET', 'detail-account-transfer', 5),
+    'account-ledger': ('GET', 'detail-account-ledger', 5),
+    'account-balance': ('GET', 'detail-account-balance', 5),
+    'transfer-history': ('GET', 'transfer', 15),
+    'customer-list': ('GET', 'list-create-customer', 0),
+    'account-flows': ('GET', 'detail-account-flows', 0),
+    'account-counterparties': ('GET', 'detail-account-counterparties', 0),
+    'transfer-volume': ('GET', 'transfer-volume', 0),
+    'customer-balances': ('GET', 'customer-balances', 0),
+    'transfer': ('POST', 'transfer', 15),
+    'deposit': ('POST', 'deposit', 8),
+    'withdraw': ('POST', 'withdraw', 8),
+    'transfer-batch': ('POST', 'transfer-batch', 1),
+    'account-create': ('POST', 'create-account', 2),
+    'customer-create': ('POST', 'list-create-customer', 1),
+    'account-update': ('PUT', 'detail-account', 0),
+    'account-delete': ('DELETE', 'detail-account', 0),
+}
+
+# Routes served natively by the async views when the workload runs under ASGI.
+ASYNC_ROUTES = {
+    'detail-account': 'async-detail-account',
+    'list-account': 'async-list-account',
+    'transfer': 'async-transfer',
+    'deposit': 'async-deposit',
+    'withdraw': 'async-withdraw',
+}
+
+
+def parse_mix(value):
+    """'account-detail=50,transfer=10' -> weights for every operation, unnamed ones keep their default."""
+    weights = {name: weight for name, (_, _, weight) in OPERATIONS.items()}
+    for part in filter(None, (value or '').split(',')):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise ValueError(f'Unknown operation "{name}", expected one of: {", ".join(OPERATIONS)}')
+        weights[name] = float(weight)
+    return weights
+
+
+class RequestFactory:
+    """Builds random but valid requests for the operations."""
+
+    def __init__(self, account_ids, customer_ids, rng, server='wsgi'):
+        self.account_ids = account_ids
+        self.customer_ids = customer_ids
+        self.rng = rng
+        self.server = server
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def url(self, url_name, **kwargs):
+        if self.server == 'asgi':
+            url_name = ASYNC_ROUTES.get(url_name, url_name)
+        return reverse(url_name, kwargs=kwargs or None)
+
+    def unique(self):
+        with self.lock:
+            self.counter += 1
+            return self.counter
+
+    def build(self, operation):
+        """Return (method, path, query params or JSON body)."""
+        method, url_name, _ = OPERATIONS[operation]
+        rng = self.rng
+        account = rng.choice(self.account_ids)
+        if operation in ('account-detail', 'account-update', 'account-delete', 'account-transfers',
+                         'account-ledger', 'account-balance', 'account-flows', 'account-counterparties'):
+            path = self.url(url_name, id=account)
+        else:
+            path = self.url(url_name)
+
+        if operation == 'account-list':
+            return method, path, {'customer__id': rng.choice(self.customer_ids)}
+        if operation == 'transfer-volume':
+            return method, path, {'transfer_from__id': account, 'interval': rng.choice(('day', 'month'))}
+        if operation == 'transfer-history':
+            return method, path, {'transfer_from__id': account, 'page_size': 50}
+        if operation == 'transfer':
+            return method, path, {'amount': round(rng.uniform(1, 50), 2), 'transfer_from': account,
+                                  'transfer_to': self.other_account(account)}
+        if operation in ('deposit', 'withdraw'):
+            return method, path, {'amount': round(rng.uniform(1, 50), 2), 'account': account}
+        if operation == 'transfer-batch':
+            return method, path, [{'amount': 1, 'transfer_from': account,
+                                   'transfer_to': self.other_account(account)} for _ in range(100)]
+        if operation == 'account-create':
+            return method, path, {'customer': rng.choice(self.customer_ids), 'type': 'Deposit', 'balance': 100}
+        if operation == 'customer-create':
+            number = 90_000_000_000 + self.unique() * 1000 + rng.randint(0, 999)
+            return method, path, {'name': 'Benchmark Customer', 'address': 'Benchmark Address',
+                                  'identification_number': f'{number:011d}'}
+        if operation == 'account-update':
+            return method, path, {'customer': rng.choice(self.customer_ids), 'type': 'Deposit',
+                                  'balance': 1_000_000, 'is_active': True}
+        return method, path, None
+
+    def other_account(self, account):
+        other = self.rng.choice(self.account_ids)
+        while other == account and len(self.account_ids) > 1:
+            other = self.rng.choice(self.account_ids)
+        return other
+
+
+def choose(weights, rng, count):
+    names = [name for name, weight in weights.items() if weight > 0]
+    return rng.choices(names, weights=[weights[name] for name in names], k=count)
+
+
+def run_wsgi(factory, operations, concurrency):
+    """Run the operations on `concurrency` threads, each with its own test client and connection."""
+    samples = []
+    samples_lock = threading.Lock()
+    queue = iter(operations)
+    queue_lock = threading.Lock()
+
+    def worker():
+        client = Client(raise_request_exception=False)
+        local = []
+        while True:
+            with queue_lock:
+                operation = next(queue, None)
+            if operation is None:
+                break
+            method, path, data = factory.build(operation)
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = _call(client, method, path, data)
+                seconds = time.perf_counter() - started
+            local.append(Sample(f'{method} {path_name(operation)}', seconds, len(context.captured_queries),
+                                response.status_code))
+        connection.close()
+        with samples_lock:
+            samples.extend(local)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return samples, time.perf_counter() - started
+
+
+def run_asgi(factory, operations, concurrency):
+    """
+    Run the operations through the ASGI handler with at most `concurrency` in flight.
+    Queries run on Django's sync threads, so they are not counted here.
+    """
+
+    async def main():
+        client = AsyncClient(raise_request_exception=False)
+        semaphore = asyncio.Semaphore(concurrency)
+        samples = []
+
+        async def one(operation):
+            method, path, data = factory.build(operation)
+            async with semaphore:
+                started = time.perf_counter()
+                response = await _call(client, method, path, data)
+                samples.append(Sample(f'{method} {path_name(operation)}', time.perf_counter() - started, None,
+                                      response.status_code))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(operation) for operation in operations))
+        return samples, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+def path_name(operation):
+    return OPERATIONS[operation][1]
+
+
+def _call(client, method, path, data):
+    if method == 'GET':
+        return client.get(path, data or {})
+    if method == 'DELETE':
+        return client.delete(path)
+    return getattr(client, method.lower())(path, data=json.dumps(data), content_type='application/json')
+
+
+def run(account_ids, customer_ids, requests=1000, concurrency=8, weights=None, server='wsgi', seed=0):
+    rng = random.Random(seed)
+    factory = RequestFactory(account_ids, customer_ids, rng, server=server)
+    operations = choose(weights or parse_mix(None), rng, requests)
+    runner = run_asgi if server == 'asgi' else run_wsgi
+    return runner(factory, operations, concurrency)
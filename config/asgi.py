@@ -2,6 +2,10 @@
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The async endpoints under /api/async/ are served natively here; see README.MD for the
+uvicorn settings. Django 3.2 runs every sync view of an ASGI application on one thread per
+process, so the sync API is served through config.wsgi instead.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 """
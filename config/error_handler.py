@@ -12,21 +12,25 @@ def api_exception_handler(exc: Exception, context) -> Response:
     response = exception_handler(exc, context)
 
     if response is not None:
-        # Using the description's of the HTTPStatus class as error message.
-        http_code_to_message = {v.value: v.description for v in HTTPStatus}
-
-        error_payload = {
-            "error": {
-                "status_code": 0,
-                "message": "",
-                "details": [],
-            }
+        response.data = error_payload(response.status_code, response.data)
+    return response
+
+
+def error_payload(status_code: int, details) -> dict:
+    """The error body every API response uses, also for views that do not go through DRF."""
+    # Using the description's of the HTTPStatus class as error message.
+    http_code_to_message = {v.value: v.description for v in HTTPStatus}
+
+    error_payload = {
+        "error": {
+            "status_code": 0,
+            "message": "",
+            "details": [],
         }
-        error = error_payload["error"]
-        status_code = response.status_code
-
-        error["status_code"] = status_code
-        error["message"] = http_code_to_message[status_code]
-        error["details"] = response.data
-        response.data = error_payload
-    return response
\ No newline at end of file
+    }
+    error = error_payload["error"]
+
+    error["status_code"] = status_code
+    error["message"] = http_code_to_message[status_code]
+    error["details"] = details
+    return error_payload
@@ -0,0 +1,33 @@
+"""
+gunicorn settings for the Docker image, all overridable from the environment.
+
+SERVER_INTERFACE=wsgi (default) runs threaded sync workers for the API. asgi runs uvicorn
+workers for the async views under /api/async/, deployed separately (the `async` service in
+docker-compose.yml): Django 3.2's ASGI handler runs every sync view on a single thread per
+worker, so the sync API must not be served from there. Each worker is a separate process with
+its own database connections (or its own DB_POOL_SIZE pool).
+"""
+import multiprocessing
+import os
+
+interface = os.environ.get('SERVER_INTERFACE', 'wsgi')
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+if interface == 'asgi':
+    wsgi_app = 'config.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'config.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('WEB_THREADS', 4))
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = timeout
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+backlog = int(os.environ.get('WEB_BACKLOG', 2048))
+# Recycle workers now and then so slow leaks cannot build up; the jitter keeps them from
+# restarting all at once.
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
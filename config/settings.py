@@ -45,17 +45,29 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'app.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'app.middleware.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
 
+
+# Instrumentation
+# Per-view latency, query count and SQL time histograms, served at /metrics (restrict it at the
+# proxy). Requests slower than SLOW_REQUEST_SECONDS are logged to 'app.slow_requests' with their
+# slowest query, SLOW_REQUEST_SAMPLE_RATE of them. METRICS_ENABLED=0 removes the middleware.
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 0.5))
+SLOW_REQUEST_SAMPLE_RATE = float(os.environ.get('SLOW_REQUEST_SAMPLE_RATE', 1))
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -78,13 +90,155 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
-DATABASES = {
+# DATABASE_PROFILE=postgres is the production profile (see docker-compose.yml); the default
+# keeps the local SQLite file. On Postgres, connections are persistent for DB_CONN_MAX_AGE
+# seconds and health-checked before reuse. DB_POOL_SIZE > 0 puts them in a per-process pool
+# instead, returned at the end of every request; size it so workers * pool size stays under
+# the server's max_connections. STATEMENT_TIMEOUTS are in milliseconds, see app/db.
+
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'sqlite')
+
+if DATABASE_PROFILE == 'postgres':
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'app.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'bank'),
+            'USER': os.environ.get('POSTGRES_USER', 'bank'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL_SIZE else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+            'POOL_SIZE': DB_POOL_SIZE,
+            'POOL_TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'IDLE_IN_TRANSACTION_TIMEOUT': int(os.environ.get('DB_IDLE_IN_TRANSACTION_TIMEOUT', 60000)),
+        }
+    }
+    # The trigram lookup and similarity function of the customer search.
+    INSTALLED_APPS.append('django.contrib.postgres')
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
+# Read replicas
+# DATABASE_REPLICAS is a comma-separated list of Postgres hosts (host or host:port) or, on the
+# SQLite profile, of database files standing in for replicas. They become the aliases
+# replica1, replica2, ... that the views marked with replica_reads read from. See
+# app/db/routers.py for pinning and health checks.
+
+REPLICA_DATABASES = []
+for number, location in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    alias = f'replica{number}'
+    if DATABASE_PROFILE == 'postgres':
+        host, _, port = location.partition(':')
+        # A real replica: the test runner reuses the primary's test database for it.
+        DATABASES[alias] = dict(DATABASES['default'], HOST=host, PORT=port or DATABASES['default']['PORT'],
+                                TEST={'MIRROR': 'default'})
+    else:
+        DATABASES[alias] = dict(DATABASES['default'], NAME=BASE_DIR / location)
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['app.db.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = float(os.environ.get('REPLICA_PIN_SECONDS', 5))
+REPLICA_HEALTH_CHECK_INTERVAL = float(os.environ.get('REPLICA_HEALTH_CHECK_INTERVAL', 5))
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 10))
+
+STATEMENT_TIMEOUTS = {
+    'default': int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000)),
+    'write': int(os.environ.get('DB_WRITE_STATEMENT_TIMEOUT', 5000)),
+    'report': int(os.environ.get('DB_REPORT_STATEMENT_TIMEOUT', 30 * 60 * 1000)),
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# Local memory by default (and in tests); point CACHE_BACKEND / CACHE_LOCATION at a shared
+# backend such as memcached or redis when running more than one process.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+ACCOUNT_CACHE_ALIAS = 'default'
+ACCOUNT_CACHE_TIMEOUT = 300
+# Aggregates that are not about a single account (volume buckets, customer balances) are only
+# refreshed when this expires; per-account ones are dropped on every write to the account.
+ANALYTICS_CACHE_TIMEOUT = int(os.environ.get('ANALYTICS_CACHE_TIMEOUT', 60))
+
+
+# Async views
+# Threads that run the reads and the transactional part of the writes of the async views; each
+# holds one database connection. 0 runs them on Django's shared sync thread instead.
+
+ASYNC_READ_WORKERS = int(os.environ.get('ASYNC_READ_WORKERS', 16))
+ASYNC_WRITE_WORKERS = int(os.environ.get('ASYNC_WRITE_WORKERS', 8))
+
+
+# Admission control
+# Money movements past these limits, per process, get a 429 with Retry-After
+# ADMISSION_RETRY_AFTER instead of waiting for row locks and connections. 0 turns a limit off.
+
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 32))
+ADMISSION_MAX_PER_ACCOUNT = int(os.environ.get('ADMISSION_MAX_PER_ACCOUNT', 4))
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 1))
+
+
+# Idempotency keys
+# How long a successful response is replayed, how long a duplicate waits for the request
+# holding the key, and after how long an unfinished claim counts as abandoned (in seconds).
+
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', 5))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+
+
+# Background tasks
+# 'database' queues tasks in the Task table for `manage.py run_tasks` (the `worker` service in
+# docker-compose.yml), which has to be running or the table only grows; 'thread' runs them on an
+# in-process pool of TASK_THREADS threads. Retries back off exponentially from TASK_RETRY_DELAY
+# up to TASK_MAX_RETRY_DELAY seconds; a task running longer than TASK_LOCK_TIMEOUT is retried.
+
+TASK_BACKEND = os.environ.get('TASK_BACKEND', 'database')
+TASK_THREADS = int(os.environ.get('TASK_THREADS', 4))
+TASK_MAX_ATTEMPTS = int(os.environ.get('TASK_MAX_ATTEMPTS', 5))
+TASK_RETRY_DELAY = float(os.environ.get('TASK_RETRY_DELAY', 2))
+TASK_MAX_RETRY_DELAY = float(os.environ.get('TASK_MAX_RETRY_DELAY', 600))
+TASK_LOCK_TIMEOUT = int(os.environ.get('TASK_LOCK_TIMEOUT', 300))
+
+
+# History tiers
+# `manage.py archive_history` moves transfers, deposits and withdraws older than
+# ARCHIVE_AFTER_DAYS out of the hot tables. Lowering it is safe; raising it after archiving
+# makes queries skip archived rows that are newer than the new boundary.
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))
+
+
+# Balance projection
+# `manage.py project_balances` folds new ledger entries into the projected balances. It does
+# not pass a gap in the ledger ids younger than PROJECTION_GAP_SECONDS: the transaction that
+# holds the missing ids may not have committed yet.
+
+PROJECTION_GAP_SECONDS = int(os.environ.get('PROJECTION_GAP_SECONDS', 60))
+
+
+# Customer search
+# Off Postgres, customer search runs on an index kept in each process, rebuilt every
+# CUSTOMER_SEARCH_INDEX_TTL seconds to pick up the changes other processes made. A name or
+# address matches when its trigram similarity to the query reaches CUSTOMER_SEARCH_SIMILARITY,
+# the counterpart of pg_trgm.similarity_threshold on Postgres.
+
+CUSTOMER_SEARCH_INDEX_TTL = int(os.environ.get('CUSTOMER_SEARCH_INDEX_TTL', 300))
+CUSTOMER_SEARCH_SIMILARITY = float(os.environ.get('CUSTOMER_SEARCH_SIMILARITY', 0.3))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -127,5 +281,30 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR,'static/')
 
 REST_FRAMEWORK = {
-    'EXCEPTION_HANDLER': 'config.error_handler.api_exception_handler'
+    'EXCEPTION_HANDLER': 'config.error_handler.api_exception_handler',
+    # Token buckets per client and endpoint: '20/s' holds 20 requests and refills 20 a second.
+    # An empty THROTTLE_*_RATE turns the limit off.
+    'DEFAULT_THROTTLE_CLASSES': ['app.api.throttling.TokenBucketThrottle'],
+    'DEFAULT_THROTTLE_RATES': {
+        'read': os.environ.get('THROTTLE_READ_RATE', '100/s') or None,
+        'write': os.environ.get('THROTTLE_WRITE_RATE', '20/s') or None,
+    },
+    # Proxies in front of gunicorn that append to X-Forwarded-For. With 0 the client is the
+    # socket's address and the header, which any client can set, is ignored.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
+THROTTLE_CACHE_ALIAS = 'default'
+
+# FAST_JSON=1 renders and parses JSON with orjson (the standard library when it is missing)
+# and has the account and transfer lists serialize straight from value tuples.
+FAST_JSON = os.environ.get('FAST_JSON', '0') == '1'
+if FAST_JSON:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = [
+        'app.api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ]
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'] = [
+        'app.api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ]
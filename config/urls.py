@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from app.views import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('app.api.urls')),
     path('api-auth/', include('rest_framework.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
@@ -7,6 +7,6 @@ python manage.py migrate
 echo "Add dummy data"
 python add_dummy_data.py
 
-echo "Start Project"
-python manage.py runserver 0.0.0.0:8000
+echo "Start Project (${SERVER_INTERFACE:-wsgi})"
+exec gunicorn -c config/gunicorn.conf.py
 